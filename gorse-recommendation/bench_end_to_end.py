@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from evaluate import git_commit
+from synthetic_events import write_synthetic_events
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_measured(command, cwd, log_path):
+    """Run a script to completion; wall seconds, exit code and the child's own peak RSS"""
+    started = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 reports this child's rusage alone, unlike RUSAGE_CHILDREN
+        _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        'seconds': time.perf_counter() - started,
+        'exit_code': process.returncode,
+        'max_rss_mb': usage.ru_maxrss / 1024,
+        'log': log_path,
+    }
+
+
+def stage_name(labels):
+    """'build_rows feedback' from the label text 'stage="build_rows",table="feedback"'"""
+    values = dict(pair.split('=', 1) for pair in labels.split(',') if pair)
+    stage = values.pop('stage', '').strip('"')
+    return ' '.join([stage] + [value.strip('"') for value in values.values()])
+
+
+def read_summary(metrics_path):
+    """Counters and per-stage seconds (plus training) from the summary line of a METRICS JSON lines file"""
+    summary = {'counters': {}, 'histograms': {}}
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding='utf-8') as f:
+            for line in f:
+                event = json.loads(line)
+                if event['event'] == 'summary':
+                    summary = event
+    stages = {}
+    for name, histogram in summary['histograms'].items():
+        if name.startswith('stage_seconds'):
+            stages[stage_name(name[len('stage_seconds'):].strip('{}'))] = round(histogram['sum'], 3)
+        elif name == 'training_seconds':
+            stages['training'] = round(histogram['sum'], 3)
+    return summary['counters'], stages
+
+
+def counter_total(counters, name):
+    return sum(value for key, value in counters.items() if key == name or key.startswith(name + '{'))
+
+
+def start_stub(port, train_seconds, log_path):
+    with open(log_path, 'w', encoding='utf-8') as log:
+        stub = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, 'stub_gorse.py'), '--port', str(port),
+             '--train-seconds', str(train_seconds)],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+    base_url = f"http://127.0.0.1:{port}/api"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/dashboard/tasks", headers={"X-API-Key": "gorse_key"}, timeout=1)
+            return stub, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    stub.terminate()
+    raise RuntimeError(f"stub Gorse did not start on port {port}")
+
+
+def bench_scale(label, events, args):
+    """Generate, process and upload one scale; returns the measurements"""
+    directory = os.path.abspath(os.path.join(args.work_dir, label))
+    os.makedirs(directory, exist_ok=True)
+    input_csv = os.path.join(directory, 'realestate_data.csv')
+    result = {'events': events}
+
+    if not (args.keep_data and os.path.exists(input_csv)):
+        print(f"\n[{label}] Generating {events:,} events...")
+        started = time.perf_counter()
+        counts = write_synthetic_events(input_csv, events, zipf=args.zipf, malformed_rate=args.malformed_rate)
+        result['generate_seconds'] = round(time.perf_counter() - started, 2)
+        result['malformed'] = counts['malformed']
+    result['input_mb'] = round(os.path.getsize(input_csv) / 1e6, 1)
+
+    output_dir = os.path.join(directory, 'gorse_data')
+    process_metrics = os.path.join(directory, 'process_metrics.jsonl')
+    if os.path.exists(process_metrics):
+        os.remove(process_metrics)
+    print(f"[{label}] Running process_data.py...")
+    process = run_measured(
+        [sys.executable, os.path.join(HERE, 'process_data.py'), '--input', input_csv, '--output-dir', output_dir,
+         '--chunksize', str(args.chunksize), '--workers', str(args.workers), '--metrics', process_metrics],
+        directory, os.path.join(directory, 'process_data.log')
+    )
+    counters, process['stages'] = read_summary(process_metrics)
+    process['rows_per_second'] = round(events / process['seconds'])
+    process['feedback_rows'] = counter_total(counters, 'feedback_rows_total')
+    result['process'] = process
+    if process['exit_code'] != 0 or not os.path.exists(os.path.join(output_dir, 'feedback.csv')):
+        print(f"✗ process_data.py failed, see {process['log']}")
+        return result
+
+    upload_metrics = os.path.join(directory, 'upload_metrics.jsonl')
+    if os.path.exists(upload_metrics):
+        os.remove(upload_metrics)
+    stub, base_url = start_stub(free_port(), args.train_seconds, os.path.join(directory, 'stub.log'))
+    try:
+        print(f"[{label}] Running upload_complete.py against the stub at {base_url}...")
+        upload = run_measured(
+            [sys.executable, os.path.join(HERE, 'upload_complete.py'), '--base-url', base_url, '--restart',
+             '--journal', os.path.join(directory, 'upload_journal.sqlite3'),
+             '--catalog', os.path.join(directory, 'catalog_snapshot.sqlite3'),
+             '--items-batch-size', str(args.items_batch_size),
+             '--feedback-batch-size', str(args.feedback_batch_size),
+             '--concurrency', str(args.concurrency), '--metrics', upload_metrics],
+            output_dir, os.path.join(directory, 'upload.log')
+        )
+    finally:
+        stub.terminate()
+        stub.wait()
+    counters, upload['stages'] = read_summary(upload_metrics)
+    records = counter_total(counters, 'records_uploaded_total')
+    # Rate over the upload spans alone; wall seconds also include training and the test reads
+    sending = sum(seconds for stage, seconds in upload['stages'].items() if stage.startswith('upload'))
+    upload['records'] = records
+    upload['records_per_second'] = round(records / sending) if sending else 0
+    upload['http_requests'] = counter_total(counters, 'http_requests_total')
+    result['upload'] = upload
+    if upload['exit_code'] != 0:
+        print(f"✗ upload_complete.py failed, see {upload['log']}")
+    return result
+
+
+def print_result(label, result):
+    print(f"\n{label}: {result['events']:,} events ({result['input_mb']} MB)")
+    for step in ('process', 'upload'):
+        run = result.get(step)
+        if run is None:
+            continue
+        rate = (f"{run['rows_per_second']:>10,} rows/s" if step == 'process'
+                else f"{run['records_per_second']:>10,} records/s")
+        print(f"  {step:<8} {run['seconds']:8.1f}s {rate}   peak RSS {run['max_rss_mb']:8.1f} MB")
+        for stage, seconds in sorted(run['stages'].items(), key=lambda kv: -kv[1]):
+            print(f"    {stage:<32} {seconds:8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput of process_data.py and the uploader "
+                                                 "on synthetic exports, against the stub Gorse server")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help="Event count to run (repeatable; default: 10k and 1m)")
+    parser.add_argument('--work-dir', default='bench_e2e', help="Where inputs, outputs and logs go")
+    parser.add_argument('--keep-data', action='store_true', help="Reuse generated inputs from an earlier run")
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--malformed-rate', type=float, default=0.02)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--items-batch-size', type=int, default=500)
+    parser.add_argument('--feedback-batch-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--train-seconds', type=float, default=0.5, help="Stub training time")
+    parser.add_argument('--output', default='bench_e2e.json', help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    results = {}
+    for label in args.scale or ['10k', '1m']:
+        results[label] = bench_scale(label, SCALES[label], args)
+        print_result(label, results[label])
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('scale', 'output')},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
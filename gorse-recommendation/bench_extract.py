@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from process_data import EXTRACTED_PROPERTIES, RealEstateDataProcessor
+from synthetic_events import write_synthetic_events
+
+
+def legacy_extract_properties(df):
+    """Original iterrows/df.at extraction, kept here as the benchmark baseline"""
+    df['house_id'] = None
+    for prop in EXTRACTED_PROPERTIES:
+        df[prop] = None
+
+    for idx, row in df.iterrows():
+        parsed = row['event_property_parsed']
+        if isinstance(parsed, dict):
+            df.at[idx, 'house_id'] = parsed.get('house_id')
+            for prop in EXTRACTED_PROPERTIES:
+                df.at[idx, prop] = parsed.get(prop)
+
+    df['rent_price'] = pd.to_numeric(df['rent_price'], errors='coerce')
+    df['sale_price'] = pd.to_numeric(df['sale_price'], errors='coerce')
+    df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
+    df['timestamp'] = df['created_at'].apply(
+        lambda x: int(x.timestamp()) if pd.notnull(x) else 0
+    )
+
+
+def load_parsed(path):
+    df = pd.read_csv(path)
+    df['event_property_parsed'] = df['event_property'].apply(json.loads)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark property extraction paths")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help="Only time the vectorized path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'realestate_data.csv')
+        print(f"Generating {args.rows} synthetic events...")
+        write_synthetic_events(path, args.rows)
+
+        processor = RealEstateDataProcessor(path)
+        processor.df = load_parsed(path)
+        start = time.perf_counter()
+        processor._extract_properties()
+        new_seconds = time.perf_counter() - start
+        print(f"\nVectorized extraction: {new_seconds:.2f}s "
+              f"({args.rows / new_seconds:,.0f} rows/s)")
+
+        if args.skip_legacy:
+            return
+
+        legacy_df = load_parsed(path)
+        start = time.perf_counter()
+        legacy_extract_properties(legacy_df)
+        legacy_seconds = time.perf_counter() - start
+        print(f"Legacy extraction:     {legacy_seconds:.2f}s "
+              f"({args.rows / legacy_seconds:,.0f} rows/s)")
+        print(f"Speedup: {legacy_seconds / new_seconds:.1f}x")
+
+        columns = ['house_id', 'timestamp'] + EXTRACTED_PROPERTIES
+        pd.testing.assert_frame_equal(
+            processor.df[columns], legacy_df[columns], check_dtype=False
+        )
+        print("✓ Outputs match")
+
+
+if __name__ == "__main__":
+    main()
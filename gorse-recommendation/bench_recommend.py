@@ -0,0 +1,75 @@
+import argparse
+import random
+import time
+
+import requests
+
+from recommend_client import RecommendClient, percentile
+from stub_gorse import StubGorseServer
+
+
+def seed_stub(server, users, items, feedback_per_user=20, seed=42):
+    """Fill the stub with synthetic feedback and publish a trained model"""
+    rng = random.Random(seed)
+    server.state.insert_feedback([
+        {'FeedbackType': 'view_listing', 'UserId': user_id, 'ItemId': rng.choice(items)}
+        for user_id in users for _ in range(feedback_per_user)
+    ])
+    server.state.train_seconds = 0
+    server.state.start_training()
+
+
+def report(label, latencies, seconds, count):
+    print(f"{label:<28} p50 {percentile(latencies, 50) * 1000:7.1f}ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f}ms  "
+          f"{count / seconds:8,.0f} users/s  ({seconds:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs batched recommendation reads")
+    parser.add_argument('--users', type=int, default=500, help="Users per dashboard page")
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds the stub spends per request")
+    args = parser.parse_args()
+
+    users = [f"user-{i:06d}" for i in range(args.users)]
+    items = [f"HD{37650000 + i}" for i in range(args.items)]
+    headers = {"X-API-Key": "gorse_key"}
+
+    with StubGorseServer(latency=args.latency) as server:
+        seed_stub(server, users, items)
+        print(f"{args.users} users, n={args.n}, {args.latency * 1000:.0f}ms server latency\n")
+
+        # Baseline: the old test_recommendations loop, one requests.get per user
+        latencies = []
+        started = time.perf_counter()
+        for user_id in users:
+            request_started = time.perf_counter()
+            response = requests.get(f"{server.base_url}/recommend/{user_id}?n={args.n}", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - request_started)
+        report("Sequential requests.get", latencies, time.perf_counter() - started, len(users))
+
+        client = RecommendClient(server.base_url, headers, ttl=600, pool_size=args.concurrency)
+        try:
+            started = time.perf_counter()
+            results = client.recommend_many(users, args.n)
+            seconds = time.perf_counter() - started
+            report("recommend_many (cold)", list(client.miss_latencies), seconds, len(users))
+            failed = sum(not result.ok for result in results)
+
+            started = time.perf_counter()
+            client.recommend_many(users, args.n)
+            seconds = time.perf_counter() - started
+            report("recommend_many (cached)", list(client.hit_latencies), seconds, len(users))
+        finally:
+            client.close()
+
+    print(f"\nFailed users: {failed}")
+    print(f"Client stats: {client.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(headers, pool_size):
+    """requests session whose connection pool can serve pool_size concurrent requests"""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def iter_batches(records, batch_size):
+    """Yield (start_row, batch) pairs without materializing the whole input"""
+    iterator = iter(records)
+    start = 0
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield start, batch
+        start += len(batch)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency window driven by response latency and 429s"""
+
+    def __init__(self, max_limit, target_latency=1.0):
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limit = max(1, max_limit // 2)
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled or (latency is not None and latency > self.target_latency):
+                # Multiplicative decrease when Gorse pushes back
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            elif latency is not None:
+                # Additive increase: one more slot per window of healthy responses
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class UploadResult:
+    def __init__(self):
+        self.total = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.batches = 0
+        self.failed = []
+
+    def __repr__(self):
+        return (f"UploadResult(uploaded={self.uploaded}, skipped={self.skipped}, total={self.total}, "
+                f"batches={self.batches}, failed={len(self.failed)})")
+
+
+class BulkUploader:
+    """Upload Gorse records in concurrent batches over a pooled session with retry and backoff"""
+
+    def __init__(self, base_url, headers, batch_size=100, max_concurrency=8,
+                 max_retries=5, backoff=0.5, max_backoff=30.0, target_latency=1.0, timeout=30, verbose=0):
+        self.base_url = base_url
+        self.verbose = verbose
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = make_session(headers, max_concurrency)
+        self.limiter = AdaptiveLimiter(max_concurrency, target_latency)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if response is not None and response.headers.get('Retry-After'):
+            try:
+                delay = max(delay, float(response.headers['Retry-After']))
+            except ValueError:
+                pass
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def post_batch(self, endpoint, batch):
+        """POST one batch, retrying transient failures; returns (affected, error)"""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            response = None
+            started = time.perf_counter()
+            if attempt:
+                METRICS.count('http_retries_total', endpoint=endpoint)
+            try:
+                response = self.session.post(f"{self.base_url}/{endpoint}", json=batch, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.limiter.release()
+                METRICS.count('http_requests_total', endpoint=endpoint, status='error')
+                error = str(e)
+            else:
+                latency = time.perf_counter() - started
+                self.limiter.release(latency, throttled=response.status_code == 429)
+                METRICS.observe('http_request_seconds', latency, endpoint=endpoint)
+                METRICS.count('http_requests_total', endpoint=endpoint, status=str(response.status_code))
+                if response.status_code == 200:
+                    return response.json().get('RowAffected', len(batch)), None
+                error = f"status {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    return 0, error
+
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response)
+        return 0, error
+
+    def upload(self, endpoint, records, label='records', journal=None, source=None):
+        """Upload an iterable of records to /api/<endpoint>, returning an UploadResult
+
+        With a journal, batches already acknowledged for this source are skipped and
+        every batch outcome is checkpointed, so an interrupted run can simply be rerun.
+        """
+        result = UploadResult()
+        batches = iter_batches(records, self.batch_size)
+        if journal is not None:
+            journal.load(endpoint, source)
+            acked, rows, failed = journal.summary(endpoint, source)
+            if acked or failed:
+                print(f"Resuming: {acked} batches ({rows} {label}) already acknowledged, "
+                      f"{failed} dead-lettered batches to retry")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = {}
+            for batch_number, (start, batch) in enumerate(batches, 1):
+                result.total += len(batch)
+                if journal is not None and journal.is_acked(endpoint, source, start, len(batch)):
+                    result.skipped += len(batch)
+                    continue
+                # Keep a bounded number of batches queued so large inputs stream through
+                while len(pending) >= self.max_concurrency * 2:
+                    self._collect(pending, result, label, endpoint, journal, source)
+                pending[executor.submit(self.post_batch, endpoint, batch)] = (batch_number, start, batch)
+                result.batches += 1
+            while pending:
+                self._collect(pending, result, label, endpoint, journal, source)
+
+        return result
+
+    def _collect(self, pending, result, label, endpoint, journal, source):
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            batch_number, start, batch = pending.pop(future)
+            affected, error = future.result()
+            if error is None:
+                result.uploaded += affected
+                METRICS.count('records_uploaded_total', affected, endpoint=endpoint)
+                if journal is not None:
+                    journal.ack(endpoint, source, start, len(batch), affected)
+                if self.verbose:
+                    print(f"✓ Batch {batch_number}: Uploaded {affected} {label}")
+            else:
+                result.failed.append((batch_number, start, batch, error))
+                METRICS.count('batches_failed_total', endpoint=endpoint)
+                if journal is not None:
+                    journal.dead_letter(endpoint, source, start, len(batch), error)
+                print(f"✗ Batch {batch_number}: Failed after retries: {error}")
@@ -0,0 +1,120 @@
+import sqlite3
+import time
+
+from preprocess_state import item_content_hash
+
+
+def record_content_hash(record):
+    """item_content_hash of a Gorse item record, so CSV rows and API records hash alike"""
+    return item_content_hash({
+        'labels': '|'.join(record.get('Labels') or []),
+        'categories': '|'.join(record.get('Categories') or []),
+        'comment': record.get('Comment', ''),
+    })
+
+
+class CatalogDiff:
+    """Outcome of comparing one catalog with the snapshot"""
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = []
+        self.visible = 0
+        self.seen = set()
+        self.hashes = {}
+
+    def __repr__(self):
+        return (f"CatalogDiff(added={self.added}, changed={self.changed}, unchanged={self.unchanged}, "
+                f"removed={len(self.removed)})")
+
+
+class CatalogSnapshot:
+    """SQLite snapshot of the catalog as Gorse last acknowledged it: item_id -> content hash
+
+    Only labels, categories and comment are hashed (what Gorse stores and
+    uses), so a listing is re-sent only when one of them changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                item_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                hidden INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.known = None
+
+    def load(self):
+        self.known = {
+            item_id: (content_hash, bool(hidden))
+            for item_id, content_hash, hidden in self.conn.execute(
+                "SELECT item_id, content_hash, hidden FROM items"
+            )
+        }
+        return self.known
+
+    def changed_records(self, records, diff):
+        """Yield only added or changed records (and hidden ones that are back), counting into diff
+
+        Streams, so it can sit between a record iterator and the uploader;
+        diff.removed is filled once the input is exhausted.
+        """
+        known = self.known if self.known is not None else self.load()
+        for record in records:
+            item_id = record['ItemId']
+            content_hash = record_content_hash(record)
+            diff.seen.add(item_id)
+            stored = known.get(item_id)
+            if stored is None:
+                diff.added += 1
+            elif stored[0] != content_hash or stored[1]:
+                diff.changed += 1
+            else:
+                diff.unchanged += 1
+                continue
+            diff.hashes[item_id] = content_hash
+            yield record
+        diff.visible = sum(1 for _, hidden in known.values() if not hidden)
+        diff.removed = [
+            item_id for item_id, (_, hidden) in known.items()
+            if not hidden and item_id not in diff.seen
+        ]
+
+    def record(self, hashes):
+        """Remember listings Gorse acknowledged (a re-upload also unhides them)"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO items (item_id, content_hash, hidden, updated_at) VALUES (?, ?, 0, ?)",
+            ((item_id, content_hash, now) for item_id, content_hash in hashes.items())
+        )
+        self.conn.commit()
+        if self.known is not None:
+            self.known.update((item_id, (content_hash, False)) for item_id, content_hash in hashes.items())
+
+    def mark_hidden(self, item_ids):
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE items SET hidden = 1, updated_at = ? WHERE item_id = ?",
+            ((now, item_id) for item_id in item_ids)
+        )
+        self.conn.commit()
+        if self.known is not None:
+            for item_id in item_ids:
+                if item_id in self.known:
+                    self.known[item_id] = (self.known[item_id][0], True)
+
+    def reset(self):
+        self.conn.execute("DELETE FROM items")
+        self.conn.commit()
+        self.known = None
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,198 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Column layout per table: (column, kind, dictionary name, dtype)
+# 'dict' columns store integer codes into a shared string dictionary
+SCHEMA = {
+    'feedback': [
+        ('feedback_type', 'dict', 'feedback_type', 'int8'),
+        ('user_id', 'dict', 'user_id', 'int32'),
+        ('item_id', 'dict', 'item_id', 'int32'),
+        ('timestamp', 'int', None, 'int64'),
+        ('comment', 'dict', 'feedback_comment', 'int16'),
+    ],
+    'items': [
+        ('item_id', 'dict', 'item_id', 'int32'),
+        ('timestamp', 'int', None, 'int64'),
+        ('labels', 'dict', 'item_labels', 'int32'),
+        ('categories', 'dict', 'item_categories', 'int8'),
+        ('comment', 'dict', 'item_comment', 'int32'),
+    ],
+    'users': [
+        ('user_id', 'dict', 'user_id', 'int32'),
+        ('labels', 'dict', 'user_labels', 'int32'),
+        ('comment', 'dict', 'user_comment', 'int32'),
+    ],
+}
+
+
+class StringDictionary:
+    """Append-only mapping between strings and dense integer codes"""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.index = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values, dtype='int32'):
+        """Codes for an array of strings, adding unseen strings in first-seen order"""
+        local_codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(''))
+        index = self.index
+        global_codes = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(self.values)
+                self.values.append(value)
+            global_codes[i] = code
+        if len(self.values) > np.iinfo(dtype).max + 1:
+            raise ValueError(f"{len(self.values)} distinct values do not fit in {dtype} codes")
+        return global_codes[local_codes].astype(dtype)
+
+    def decode(self, codes):
+        return np.asarray(self.values, dtype=object)[np.asarray(codes)]
+
+    def save(self, prefix):
+        """Write the strings as one UTF-8 blob plus an offsets array (Arrow-style)"""
+        encoded = [value.encode('utf-8') for value in self.values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        with open(prefix + '.bin', 'wb') as f:
+            f.write(b''.join(encoded))
+        np.save(prefix + '.offsets.npy', offsets)
+
+    @classmethod
+    def load(cls, prefix):
+        offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        with open(prefix + '.bin', 'rb') as f:
+            blob = f.read()
+        return cls(blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1))
+
+
+class ColumnarWriter:
+    """Append feedback/items/users frames as raw binary columns with dictionary-encoded strings"""
+
+    def __init__(self, directory, dictionaries=None):
+        """dictionaries seeds the shared string dictionaries (e.g. an IdRegistry's) so codes match"""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.dictionaries = dict(dictionaries or {})
+        self.rows = {table: 0 for table in SCHEMA}
+        for table, columns in SCHEMA.items():
+            for column, _, _, _ in columns:
+                # Truncate any previous run's column files
+                open(self._column_path(table, column), 'wb').close()
+
+    def _column_path(self, table, column):
+        return os.path.join(self.directory, f"{table}.{column}.bin")
+
+    def append(self, table, frame, codes=None):
+        """Append frame's rows; codes maps dict columns to codes already in their shared dictionary"""
+        codes = codes or {}
+        for column, kind, dictionary, dtype in SCHEMA[table]:
+            if column in codes:
+                # Already interned (e.g. by the IdRegistry this writer was seeded with)
+                column_codes = np.asarray(codes[column], dtype=dtype)
+            elif kind == 'dict':
+                column_codes = self.dictionaries.setdefault(dictionary, StringDictionary()).encode(
+                    frame[column], dtype
+                )
+            else:
+                column_codes = frame[column].to_numpy(dtype=dtype)
+            with open(self._column_path(table, column), 'ab') as f:
+                f.write(np.ascontiguousarray(column_codes).tobytes())
+        self.rows[table] += len(frame)
+
+    def close(self):
+        for name, dictionary in self.dictionaries.items():
+            dictionary.save(os.path.join(self.directory, f"dict.{name}"))
+        meta = {'rows': self.rows, 'schema': SCHEMA}
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+
+class ColumnarReader:
+    """Memory-map a columnar store written by ColumnarWriter"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.rows = meta['rows']
+        self.schema = meta['schema']
+        self._dictionaries = {}
+
+    def num_rows(self, table):
+        return self.rows[table]
+
+    def column(self, table, column):
+        """Zero-copy view of one column (integer codes for dictionary columns)"""
+        dtype = next(spec[3] for spec in self.schema[table] if spec[0] == column)
+        path = os.path.join(self.directory, f"{table}.{column}.bin")
+        if self.rows[table] == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(self.rows[table],))
+
+    def dictionary(self, name):
+        if name not in self._dictionaries:
+            prefix = os.path.join(self.directory, f"dict.{name}")
+            self._dictionaries[name] = (
+                StringDictionary.load(prefix) if os.path.exists(prefix + '.bin') else StringDictionary()
+            )
+        return self._dictionaries[name]
+
+    def read_frame(self, table):
+        """Decode a whole table into a DataFrame with the CSV column names"""
+        data = {}
+        for column, kind, dictionary, _ in self.schema[table]:
+            values = self.column(table, column)
+            data[column] = self.dictionary(dictionary).decode(values) if kind == 'dict' else np.asarray(values)
+        return pd.DataFrame(data)
+
+    def iter_feedback_records(self, batch_size=10_000):
+        """Yield Gorse feedback records, decoding one slice of the mapped columns at a time"""
+        types = self.dictionary('feedback_type').values
+        users = self.dictionary('user_id').values
+        items = self.dictionary('item_id').values
+        comments = self.dictionary('feedback_comment').values
+        columns = [self.column('feedback', name) for name in
+                   ('feedback_type', 'user_id', 'item_id', 'timestamp', 'comment')]
+
+        for start in range(0, self.rows['feedback'], batch_size):
+            block = [np.asarray(column[start:start + batch_size]).tolist() for column in columns]
+            for feedback_type, user_code, item_code, timestamp, comment in zip(*block):
+                yield {
+                    "FeedbackType": types[feedback_type],
+                    "UserId": users[user_code],
+                    "ItemId": items[item_code],
+                    "Timestamp": str(timestamp),
+                    "Comment": comments[comment]
+                }
+
+    def iter_item_records(self, batch_size=10_000):
+        """Yield Gorse item records; labels/categories are split once per dictionary entry"""
+        item_ids = self.dictionary('item_id').values
+        labels = [
+            [label for label in value.split('|') if ':' in label] if value else []
+            for value in self.dictionary('item_labels').values
+        ]
+        categories = [value.split('|') if value else [] for value in self.dictionary('item_categories').values]
+        comments = self.dictionary('item_comment').values
+        columns = [self.column('items', name) for name in
+                   ('item_id', 'timestamp', 'labels', 'categories', 'comment')]
+
+        for start in range(0, self.rows['items'], batch_size):
+            block = [np.asarray(column[start:start + batch_size]).tolist() for column in columns]
+            for item_code, timestamp, label_code, category_code, comment in zip(*block):
+                yield {
+                    "ItemId": item_ids[item_code],
+                    "Timestamp": str(timestamp),
+                    "Labels": list(labels[label_code]),
+                    "Categories": list(categories[category_code]),
+                    "Comment": comments[comment]
+                }
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from bulk_uploader import BulkUploader
+from offline_recommender import OfflineRecommender, drop_anonymous, load_feedback_frame
+from recommend_client import RecommendClient
+from stub_gorse import StubGorseServer
+from training_watcher import TrainingWatcher
+
+
+def time_split(feedback, test_fraction=0.2):
+    """Split feedback at the timestamp below which (1 - test_fraction) of the rows fall"""
+    feedback = feedback.sort_values('timestamp', kind='stable')
+    cutoff = int(feedback['timestamp'].quantile(1 - test_fraction))
+    return feedback[feedback['timestamp'] < cutoff], feedback[feedback['timestamp'] >= cutoff], cutoff
+
+
+def relevant_items(train, test):
+    """Per test user, the items they touched after the split and never before it
+
+    Only users with training history are evaluated; cold users measure the
+    popularity fill rather than the model.
+    """
+    seen = train.groupby('user_id')['item_id'].agg(set)
+    relevant = {}
+    for user_id, items in test.groupby('user_id')['item_id'].agg(set).items():
+        if user_id in seen.index:
+            new_items = items - seen[user_id]
+            if new_items:
+                relevant[user_id] = new_items
+    return relevant
+
+
+def ranking_metrics(recommended, relevant, k):
+    hits = np.array([item in relevant for item in recommended[:k]], dtype=float)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = discounts[:min(len(relevant), k)].sum()
+    return {
+        'precision': hits.sum() / k,
+        'recall': hits.sum() / len(relevant),
+        'ndcg': float((hits * discounts[:len(hits)]).sum() / ideal) if ideal else 0.0,
+    }
+
+
+class PopularityEngine:
+    """Baseline: the most interacted-with items the user has not seen"""
+
+    def fit(self, feedback):
+        self.popular = feedback['item_id'].value_counts().index.tolist()
+        self.seen = feedback.groupby('user_id')['item_id'].agg(set).to_dict()
+        return self
+
+    def recommend(self, user_id, n=10):
+        seen = self.seen.get(user_id, set())
+        items = []
+        for item_id in self.popular:
+            if item_id not in seen:
+                items.append({'Id': item_id, 'Score': 0.0})
+                if len(items) == n:
+                    break
+        return items
+
+
+class StubGorseEngine:
+    """Replay the training half through the HTTP path: upload, train, wait, read"""
+
+    headers = {"X-API-Key": "gorse_key", "Content-Type": "application/json"}
+
+    def __init__(self, train_seconds=0.5):
+        self.server = StubGorseServer(train_seconds=train_seconds).start()
+        self.client = None
+
+    def fit(self, feedback):
+        base_url = self.server.base_url
+        records = [
+            {'FeedbackType': feedback_type, 'UserId': user_id, 'ItemId': item_id,
+             'Timestamp': str(timestamp), 'Comment': comment}
+            for feedback_type, user_id, item_id, timestamp, comment in feedback[
+                ['feedback_type', 'user_id', 'item_id', 'timestamp', 'comment']
+            ].itertuples(index=False)
+        ]
+        BulkUploader(base_url, self.headers, batch_size=1000).upload('feedback', records, label='feedback entries')
+        watcher = TrainingWatcher(base_url, self.headers, initial_interval=0.1, deadline=60)
+        before = watcher.snapshot()
+        watcher.session.post(f"{base_url}/train")
+        watcher.wait(before)
+        self.client = RecommendClient(base_url, self.headers, ttl=0)
+        return self
+
+    def recommend(self, user_id, n=10):
+        return self.client.recommend(user_id, n)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.server.stop()
+
+
+ENGINES = {
+    'offline': lambda args: OfflineRecommender(neighbors=args.neighbors, config_path=args.config),
+    'popular': lambda args: PopularityEngine(),
+    'stub': lambda args: StubGorseEngine(),
+}
+
+
+def evaluate_engine(engine, train, relevant, k):
+    tracemalloc.start()
+    started = time.perf_counter()
+    engine.fit(train)
+    train_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    totals = {'precision': 0.0, 'recall': 0.0, 'ndcg': 0.0}
+    latencies = []
+    for user_id, items in relevant.items():
+        started = time.perf_counter()
+        recommendations = engine.recommend(user_id, k)
+        latencies.append(time.perf_counter() - started)
+        recommended = [rec['Id'] if isinstance(rec, dict) else rec for rec in recommendations]
+        for name, value in ranking_metrics(recommended, items, k).items():
+            totals[name] += value
+
+    users = max(len(relevant), 1)
+    latencies_ms = np.array(latencies or [0.0]) * 1000
+    return {
+        f'precision@{k}': totals['precision'] / users,
+        f'recall@{k}': totals['recall'] / users,
+        f'ndcg@{k}': totals['ndcg'] / users,
+        'train_seconds': train_seconds,
+        'train_peak_mb': peak / 2 ** 20,
+        'query_p50_ms': float(np.percentile(latencies_ms, 50)),
+        'query_p95_ms': float(np.percentile(latencies_ms, 95)),
+        'query_p99_ms': float(np.percentile(latencies_ms, 99)),
+        'evaluated_users': len(relevant),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-split offline evaluation of recommendation engines")
+    parser.add_argument('--feedback', default='feedback.csv', help="feedback.csv or a columnar store directory")
+    parser.add_argument('--config', default='config.toml')
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                        help="Engine to evaluate (repeatable; default: offline and popular)")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--neighbors', type=int, default=100)
+    parser.add_argument('--output', default='eval_results.json', help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.feedback):
+        print(f"❌ File not found: {args.feedback}")
+        return
+
+    feedback = drop_anonymous(load_feedback_frame(args.feedback))
+    feedback = feedback.assign(comment=feedback['comment'].fillna(''))
+    train, test, cutoff = time_split(feedback, args.test_fraction)
+    relevant = relevant_items(train, test)
+    print(f"Train: {len(train)} rows, test: {len(test)} rows (split at {cutoff}), "
+          f"{len(relevant)} users evaluated")
+
+    results = {}
+    for name in args.engine or ['offline', 'popular']:
+        engine = ENGINES[name](args)
+        try:
+            results[name] = evaluate_engine(engine, train, relevant, args.k)
+        finally:
+            if hasattr(engine, 'close'):
+                engine.close()
+        metrics = results[name]
+        print(f"\n{name}:")
+        for metric, value in metrics.items():
+            print(f"  {metric}: {value:.4f}" if isinstance(value, float) else f"  {metric}: {value}")
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'feedback': args.feedback,
+        'k': args.k,
+        'test_fraction': args.test_fraction,
+        'split_timestamp': cutoff,
+        'train_rows': len(train),
+        'test_rows': len(test),
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
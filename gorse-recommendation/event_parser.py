@@ -0,0 +1,154 @@
+import ast
+import json
+import re
+from collections import Counter
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+VALID_JSON = 'json'
+PYTHON_LITERAL = 'literal'
+ESCAPED_JSON = 'escaped'
+UNKNOWN = 'unknown'
+
+# orjson turns integers wider than 64 bits into floats where json keeps them exact
+_LONG_DIGITS = re.compile(r'\d{19}')
+
+
+def classify(value):
+    """Guess how an event_property payload is encoded from its first characters"""
+    text = value.lstrip()
+    if not text.startswith('{'):
+        return UNKNOWN
+
+    body = text[1:].lstrip()
+    if body.startswith("'"):
+        return PYTHON_LITERAL
+    if body.startswith('\\"'):
+        return ESCAPED_JSON
+    if body.startswith('"') or body.startswith('}'):
+        return VALID_JSON
+    return UNKNOWN
+
+
+def _unescape(value):
+    return value.replace('\\"', '"').replace('"{', '{').replace('}"', '}')
+
+
+class EventPropertyParser:
+    """Parse event_property payloads with cheap routing, memoization and aggregated failure counts
+
+    Results are identical to trying json.loads, ast.literal_eval and the escaped-quote
+    rewrite in that order; the classifier only skips tiers that cannot succeed.
+    """
+
+    def __init__(self, use_orjson=True, max_cache_entries=200_000, max_failure_samples=5):
+        self.use_orjson = use_orjson and orjson is not None
+        self.max_cache_entries = max_cache_entries
+        self.max_failure_samples = max_failure_samples
+        self.cache = {}
+        self.stats = Counter()
+        self.failure_samples = []
+
+    def _loads(self, value):
+        if self.use_orjson and not _LONG_DIGITS.search(value):
+            try:
+                return orjson.loads(value)
+            except orjson.JSONDecodeError:
+                # orjson is stricter (NaN, Infinity, lone surrogates); defer to json for those
+                pass
+        return json.loads(value)
+
+    def _decode_json(self, value):
+        try:
+            return True, self._loads(value)
+        except json.JSONDecodeError:
+            return False, None
+
+    def _decode_literal(self, value):
+        try:
+            return True, ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return False, None
+
+    def _decode_escaped(self, value):
+        try:
+            return True, self._loads(_unescape(value))
+        except Exception:
+            return False, None
+
+    def _decode(self, value):
+        kind = classify(value)
+        self.stats[kind] += 1
+
+        if kind == PYTHON_LITERAL:
+            decoders = (self._decode_literal, self._decode_escaped)
+        elif kind == ESCAPED_JSON:
+            decoders = (self._decode_escaped,)
+        else:
+            decoders = (self._decode_json, self._decode_literal, self._decode_escaped)
+
+        for decoder in decoders:
+            ok, result = decoder(value)
+            if ok:
+                return result
+
+        self._record_failure('unparseable', value)
+        return None
+
+    def _record_failure(self, reason, value):
+        self.stats[reason] += 1
+        if len(self.failure_samples) < self.max_failure_samples:
+            self.failure_samples.append(str(value)[:100])
+
+    def parse(self, value):
+        """Parse a single payload, returning None when it cannot be decoded"""
+        if not isinstance(value, str):
+            if not pd.isna(value):
+                self._record_failure('error', value)
+            return None
+
+        if value in self.cache:
+            self.stats['cache_hits'] += 1
+            return self.cache[value]
+
+        try:
+            result = self._decode(value)
+        except Exception:
+            self._record_failure('error', value)
+            result = None
+
+        if len(self.cache) >= self.max_cache_entries:
+            self.cache.clear()
+        self.cache[value] = result
+        return result
+
+    def parse_series(self, series):
+        """Parse a column of payloads, decoding each distinct string only once"""
+        codes, uniques = pd.factorize(series)
+        self.stats['rows'] += len(codes)
+        self.stats['distinct'] += len(uniques)
+
+        # The extra trailing slot holds None for missing values (factorize code -1)
+        decoded = [None] * (len(uniques) + 1)
+        for i, value in enumerate(uniques):
+            decoded[i] = self.parse(value)
+
+        lookup = pd.Series(decoded, dtype=object).to_numpy()
+        return pd.Series(lookup[codes], index=series.index, dtype=object)
+
+    def report(self, verbose=True):
+        """Print aggregated parse statistics (failure samples only when verbose)"""
+        failures = self.stats['unparseable'] + self.stats['error']
+        print(f"  Parsed {self.stats['rows']} rows ({self.stats['distinct']} distinct payloads)")
+        print(f"  Payload types: json={self.stats[VALID_JSON]}, literal={self.stats[PYTHON_LITERAL]}, "
+              f"escaped={self.stats[ESCAPED_JSON]}, other={self.stats[UNKNOWN]}")
+        if failures:
+            print(f"  Unparseable payloads: {self.stats['unparseable']}, errors: {self.stats['error']}")
+            if verbose:
+                for sample in self.failure_samples:
+                    print(f"    e.g. {sample}...")
@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import StringDictionary
+
+# Names match the columnar store's shared dictionaries, so its codes line up
+DICTIONARIES = ('user_id', 'item_id')
+
+
+def factorize_ids(values):
+    """Local int32 codes for an array of ids plus the distinct id strings they index; missing values get -1
+
+    Cheap enough to run in worker processes: map the codes onto registry codes
+    with to_registry, which looks up each distinct id once.
+    """
+    values = pd.Series(values, dtype=object)
+    present = values.notna().to_numpy()
+    codes = np.full(len(values), -1, dtype=np.int32)
+    uniques = np.empty(0, dtype=object)
+    if present.any():
+        local_codes, uniques = pd.factorize(values[present].astype(str))
+        codes[present] = local_codes
+        uniques = np.asarray(uniques, dtype=object)
+    return codes, uniques
+
+
+def to_registry(mapping, codes):
+    """Translate local codes through mapping (local code -> registry code); -1 stays -1"""
+    return np.append(np.asarray(mapping, dtype=np.int32), np.int32(-1))[np.asarray(codes)]
+
+
+def decode_ids(values, codes):
+    """Id strings for codes into values; -1 decodes to 'nan', as str() of a missing id did"""
+    return np.append(np.asarray(values, dtype=object), 'nan')[np.asarray(codes)]
+
+
+def intern(dictionary, values):
+    """int32 codes for an array of ids, adding unseen ids; missing values get -1"""
+    codes, uniques = factorize_ids(values)
+    return to_registry(dictionary.encode(uniques, 'int32'), codes)
+
+
+class IdRegistry:
+    """Dense int32 codes for user and item ids, persisted so later runs keep the same codes
+
+    Stored as dict.user_id.* / dict.item_id.* files in the columnar store's
+    dictionary format. Codes are only ever appended, never reassigned.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.dictionaries = {}
+        for name in DICTIONARIES:
+            prefix = self._prefix(name)
+            if prefix and os.path.exists(prefix + '.bin'):
+                self.dictionaries[name] = StringDictionary.load(prefix)
+            else:
+                self.dictionaries[name] = StringDictionary()
+
+    def _prefix(self, name):
+        return os.path.join(self.directory, f"dict.{name}") if self.directory else None
+
+    @property
+    def users(self):
+        return self.dictionaries['user_id']
+
+    @property
+    def items(self):
+        return self.dictionaries['item_id']
+
+    def intern_users(self, values):
+        return intern(self.users, values)
+
+    def intern_items(self, values):
+        return intern(self.items, values)
+
+    def save(self):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name, dictionary in self.dictionaries.items():
+            dictionary.save(self._prefix(name))
+
+
+class FirstSeen:
+    """Codes in first-seen order across batches, with an array mask for membership"""
+
+    def __init__(self):
+        self.mask = np.zeros(0, dtype=bool)
+        self.batches = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, codes):
+        """Mark codes as seen; True at positions holding a code's first occurrence overall"""
+        codes = np.asarray(codes)
+        is_new = np.zeros(len(codes), dtype=bool)
+        valid = np.flatnonzero(codes >= 0)
+        if len(valid) == 0:
+            return is_new
+        top = int(codes[valid].max()) + 1
+        if top > len(self.mask):
+            self.mask = np.concatenate([self.mask, np.zeros(max(top, 2 * len(self.mask)) - len(self.mask), bool)])
+        _, first = np.unique(codes[valid], return_index=True)
+        first = valid[first]
+        is_new[first[~self.mask[codes[first]]]] = True
+        self.mask[codes[valid]] = True
+        new_codes = codes[is_new]
+        self.batches.append(new_codes)
+        self.count += len(new_codes)
+        return is_new
+
+    def codes(self):
+        return np.concatenate(self.batches) if self.batches else np.empty(0, dtype=np.int32)
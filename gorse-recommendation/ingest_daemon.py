@@ -0,0 +1,446 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import upload_complete
+from bulk_uploader import BulkUploader
+from item_features import load_item_features
+from metrics import METRICS
+from offline_recommender import load_feedback_frame
+from popularity import RollingPopularity
+
+REQUIRED_FIELDS = ('FeedbackType', 'UserId', 'ItemId')
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+
+class BufferFull(Exception):
+    """The ingest buffer stayed full for longer than the submit timeout"""
+
+
+def normalize_feedback(record):
+    """Validate one Gorse feedback record; Timestamp defaults to now and Comment to ''"""
+    if not isinstance(record, dict):
+        raise ValueError("feedback must be a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return {
+        'FeedbackType': str(record['FeedbackType']),
+        'UserId': str(record['UserId']),
+        'ItemId': str(record['ItemId']),
+        'Timestamp': str(record.get('Timestamp') or int(time.time())),
+        'Comment': str(record.get('Comment') or ''),
+    }
+
+
+class SpillLog:
+    """SQLite log of feedback batches Gorse did not accept, replayed once it recovers
+
+    pending counts the batches waiting in the log.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS spilled (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                records TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.pending = self.summary()[0]
+
+    def spill(self, batch, error):
+        self.conn.execute(
+            "INSERT INTO spilled (records, size, error, created_at) VALUES (?, ?, ?, ?)",
+            (json.dumps(batch, ensure_ascii=False), len(batch), error, time.time())
+        )
+        self.conn.commit()
+        self.pending += 1
+
+    def oldest(self):
+        """(id, batch) of the oldest spilled batch, or None"""
+        row = self.conn.execute("SELECT id, records FROM spilled ORDER BY id LIMIT 1").fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def failed_again(self, spill_id, error):
+        self.conn.execute("UPDATE spilled SET attempts = attempts + 1, error = ? WHERE id = ?", (error, spill_id))
+        self.conn.commit()
+
+    def remove(self, spill_id):
+        if self.conn.execute("DELETE FROM spilled WHERE id = ?", (spill_id,)).rowcount:
+            self.pending -= 1
+        self.conn.commit()
+
+    def summary(self):
+        """(batches, records) waiting in the log"""
+        batches, records = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM spilled").fetchone()
+        return batches, records
+
+    def close(self):
+        self.conn.close()
+
+
+class FeedbackIngestor:
+    """Buffer feedback and flush it to /api/feedback in micro-batches
+
+    A batch goes out as soon as batch_size records are buffered, or after
+    flush_interval seconds otherwise. At most max_inflight batches are posted
+    at once (and the uploader's AIMD window narrows further when Gorse slows
+    down), so a slow Gorse fills the buffer; once max_buffer records are
+    waiting, submit() blocks and finally raises BufferFull. Batches that still
+    fail after the uploader's retries are spilled to the SpillLog and replayed
+    oldest first. While the log holds batches, new ones are appended behind
+    them instead of being posted: Gorse overwrites feedback of the same type,
+    user and item, so replaying old records after newer ones would bring back
+    stale values. For the same reason, outcomes of concurrent batches are
+    settled in posting order, and once a batch spills every batch posted after
+    it is spilled behind it even if Gorse accepted it, so the replay posts it
+    again after the older one. Each accepted list of records is also handed to
+    every listener (e.g. RollingPopularity.add_records).
+    """
+
+    def __init__(self, uploader, spill_log, batch_size=500, flush_interval=1.0, max_buffer=50_000,
+                 max_inflight=4, submit_timeout=5.0, replay_interval=5.0, listeners=()):
+        self.uploader = uploader
+        self.listeners = list(listeners)
+        self.spill_log = spill_log
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_inflight = max_inflight
+        self.submit_timeout = submit_timeout
+        self.replay_interval = replay_interval
+        self.buffer = []
+        self.sending = set()
+        # Resolves to whether the most recently posted batch was spilled
+        self.last_settled = None
+        self.in_flight = 0
+        self.closing = False
+        self.counts = {'received': 0, 'flushed': 0, 'batches': 0, 'spilled': 0, 'deferred': 0, 'replayed': 0,
+                       'rejected': 0}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_inflight)
+        self.slots = asyncio.Semaphore(self.max_inflight)
+        self.wakeup = asyncio.Event()
+        self.space = asyncio.Condition()
+        self.flusher = asyncio.create_task(self._flush_loop())
+        self.replayer = asyncio.create_task(self._replay_loop())
+        return self
+
+    async def submit(self, records):
+        """Buffer validated records, waiting (up to submit_timeout) until all of them fit in max_buffer"""
+        async with self.space:
+            try:
+                if len(records) > self.max_buffer:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(
+                    self.space.wait_for(lambda: len(self.buffer) + len(records) <= self.max_buffer),
+                    self.submit_timeout
+                )
+            except asyncio.TimeoutError:
+                self.counts['rejected'] += len(records)
+                METRICS.count('ingest_rejected_total', len(records))
+                raise BufferFull() from None
+            self.buffer.extend(records)
+        for listener in self.listeners:
+            listener(records)
+        self.counts['received'] += len(records)
+        METRICS.count('ingest_received_total', len(records))
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    async def _post(self, batch):
+        self.in_flight += 1
+        try:
+            return await self.loop.run_in_executor(self.executor, self.uploader.post_batch, 'feedback', batch)
+        finally:
+            self.in_flight -= 1
+
+    async def _flush_loop(self):
+        while self.buffer or not self.closing:
+            if len(self.buffer) < self.batch_size and not self.closing:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+            if not self.buffer:
+                continue
+            if self.spill_log.pending:
+                # Queue behind the spilled batches so the replay keeps feedback in arrival order
+                batch = self.buffer[:self.batch_size]
+                del self.buffer[:self.batch_size]
+                self.spill_log.spill(batch, 'queued behind spilled batches')
+                self.counts['deferred'] += len(batch)
+                METRICS.count('ingest_deferred_total', len(batch))
+                async with self.space:
+                    self.space.notify_all()
+                continue
+            # Waiting for a free slot is the backpressure point: meanwhile the buffer fills up
+            await self.slots.acquire()
+            batch = self.buffer[:self.batch_size]
+            del self.buffer[:self.batch_size]
+            async with self.space:
+                self.space.notify_all()
+            previous, settled = self.last_settled, self.loop.create_future()
+            self.last_settled = settled
+            task = asyncio.create_task(self._send(batch, previous, settled))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, batch, previous, settled):
+        """Post one batch, then settle it after the batch posted before it"""
+        spilled = True
+        try:
+            try:
+                _, error = await self._post(batch)
+            finally:
+                self.slots.release()
+            behind_spill = previous is not None and await previous
+            if error is None and behind_spill:
+                # Gorse took it, but the replay of the older batch would overwrite it
+                self.spill_log.spill(batch, 'posted after a spilled batch')
+                self.counts['deferred'] += len(batch)
+                METRICS.count('ingest_deferred_total', len(batch))
+            elif error is None:
+                spilled = False
+                self.counts['flushed'] += len(batch)
+                self.counts['batches'] += 1
+                METRICS.count('ingest_flushed_total', len(batch))
+            else:
+                self.spill_log.spill(batch, error)
+                self.counts['spilled'] += len(batch)
+                METRICS.count('ingest_spilled_total', len(batch))
+                print(f"✗ Spilled {len(batch)} feedback entries to {self.spill_log.path}: {error}")
+        finally:
+            settled.set_result(spilled)
+
+    async def _replay_loop(self):
+        while not self.closing:
+            while not self.closing:
+                entry = self.spill_log.oldest()
+                if entry is None:
+                    break
+                spill_id, batch = entry
+                async with self.slots:
+                    _, error = await self._post(batch)
+                if error is not None:
+                    self.spill_log.failed_again(spill_id, error)
+                    break
+                self.spill_log.remove(spill_id)
+                self.counts['replayed'] += len(batch)
+                METRICS.count('ingest_replayed_total', len(batch))
+                print(f"✓ Replayed {len(batch)} spilled feedback entries")
+            await asyncio.sleep(self.replay_interval)
+
+    async def close(self):
+        """Flush everything still buffered (spilling what fails) and stop the background tasks"""
+        self.closing = True
+        self.wakeup.set()
+        self.replayer.cancel()
+        await self.flusher
+        await asyncio.gather(*self.sending, self.replayer, return_exceptions=True)
+        self.executor.shutdown()
+
+    def stats(self):
+        spilled_batches, spilled_records = self.spill_log.summary()
+        return {
+            **self.counts,
+            'buffered': len(self.buffer),
+            'in_flight': self.in_flight,
+            'spill_log_batches': spilled_batches,
+            'spill_log_records': spilled_records,
+        }
+
+
+class IngestServer:
+    """Minimal HTTP/1.1 front end: POST /api/feedback (Gorse's shape) and GET /health
+
+    With a RollingPopularity it also answers GET /api/popular and /api/latest
+    (query parameters n, region, category) from memory.
+    """
+
+    def __init__(self, ingestor, popularity=None):
+        self.ingestor = ingestor
+        self.popularity = popularity
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'malformed request line'}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'invalid Content-Length'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': f'body larger than {MAX_BODY_BYTES} bytes'},
+                                        keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                path, _, query = target.partition('?')
+                status, payload, extra_headers = await self._route(method, path, body, query)
+                await self._respond(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body, query=''):
+        if path == '/health':
+            return 200, self.ingestor.stats(), {}
+        if path in ('/api/popular', '/api/latest') and self.popularity is not None:
+            params = {name: values[0] for name, values in parse_qs(query).items()}
+            try:
+                n = int(params.get('n', 10))
+            except ValueError:
+                return 400, {'error': 'n must be an integer'}, {}
+            serve = self.popularity.popular if path == '/api/popular' else self.popularity.latest
+            return 200, serve(n, params.get('region'), params.get('category')), {}
+        if path != '/api/feedback':
+            return 404, {'error': f'unknown endpoint {path}'}, {}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}, {}
+        try:
+            payload = json.loads(body or b'[]')
+            records = [normalize_feedback(record) for record in
+                       (payload if isinstance(payload, list) else [payload])]
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+        if len(records) > self.ingestor.max_buffer:
+            return 413, {'error': f'more than {self.ingestor.max_buffer} feedback entries in one request'}, {}
+        try:
+            await self.ingestor.submit(records)
+        except BufferFull:
+            return 503, {'error': 'ingest buffer full'}, {'Retry-After': '1'}
+        return 200, {'RowAffected': len(records)}, {}
+
+    async def _respond(self, writer, status, payload, keep_alive=True, extra_headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        lines = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(args):
+    uploader = BulkUploader(args.base_url, upload_complete.headers, batch_size=args.batch_size,
+                            max_concurrency=args.concurrency, max_retries=args.max_retries)
+    spill_log = SpillLog(args.wal)
+    batches, records = spill_log.summary()
+    if batches:
+        print(f"Replaying {batches} spilled batches ({records} feedback entries) from {args.wal}")
+    popularity = None
+    if args.items:
+        popularity = RollingPopularity.from_config(args.config).set_items(load_item_features(args.items))
+        if args.feedback and os.path.exists(args.feedback):
+            popularity.add_frame(load_feedback_frame(args.feedback))
+        print(f"Serving popular/latest listings for {len(popularity.item_ids)} items "
+              f"({popularity.counts['events']} events in the window so far)")
+    ingestor = await FeedbackIngestor(
+        uploader, spill_log, batch_size=args.batch_size, flush_interval=args.flush_interval,
+        max_buffer=args.max_buffer, max_inflight=args.concurrency,
+        listeners=[popularity.add_records] if popularity is not None else ()
+    ).start()
+    server = IngestServer(ingestor, popularity)
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+        listener = await asyncio.start_unix_server(server.handle, path=args.unix_socket)
+        print(f"Feedback ingest listening on unix:{args.unix_socket}")
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"Feedback ingest listening on http://{args.host}:{args.port}/api/feedback")
+    print(f"Flushing to {args.base_url}/feedback every {args.batch_size} entries or {args.flush_interval}s")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("\nShutting down, flushing buffered feedback...")
+    listener.close()
+    await ingestor.close()
+    print(f"Ingest stats: {ingestor.stats()}")
+    spill_log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running feedback ingest service with micro-batched uploads")
+    parser.add_argument('--base-url', default=upload_complete.BASE_URL, help="Gorse API root")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--unix-socket', default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--batch-size', type=int, default=500, help="Flush once this many entries are buffered")
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                        help="Flush a partial batch after this many seconds")
+    parser.add_argument('--max-buffer', type=int, default=50_000,
+                        help="Buffered entries above which clients wait and then get 503")
+    parser.add_argument('--concurrency', type=int, default=4, help="Maximum batches in flight")
+    parser.add_argument('--max-retries', type=int, default=3, help="Retries per batch before it is spilled")
+    parser.add_argument('--wal', default='ingest_wal.sqlite3', help="Spill log for batches Gorse did not accept")
+    parser.add_argument('--items', default=None,
+                        help="items.csv or columnar store: also serve /api/popular and /api/latest from memory")
+    parser.add_argument('--feedback', default='feedback.csv',
+                        help="Feedback used to warm the popularity window when --items is given")
+    parser.add_argument('--config', default='config.toml', help="Gorse config (popular_window, feedback weights)")
+    parser.add_argument('--metrics', default=None,
+                        help="Write ingest counters and HTTP histograms here on shutdown (.prom or JSON lines)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        METRICS.configure(args.metrics)
+    try:
+        asyncio.run(serve(args))
+    finally:
+        METRICS.close()
+
+
+if __name__ == "__main__":
+    main()
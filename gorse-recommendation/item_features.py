@@ -0,0 +1,213 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import ColumnarReader
+
+CATEGORIES = ['rental', 'sale']
+PRICES = ['rent_price', 'sale_price']
+
+# Written next to items.csv by process_data.py
+FEATURES_FILE = 'item_features.npz'
+
+# Categorical columns: int32 codes into a vocabulary, -1 when missing
+CODED = ['estate', 'region', 'address']
+
+
+def load_items_frame(path):
+    """items.csv, or the items table of a columnar store directory"""
+    if os.path.isdir(path):
+        return ColumnarReader(path).read_frame('items')
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def label_values(labels, kind):
+    """Value of the first `kind:` label in each pipe-separated labels string ('' if none)"""
+    return labels.fillna('').astype(str).str.extract(
+        rf'(?:^|\|){kind}:([^|]*)', expand=False
+    ).fillna('')
+
+
+def extract_price(comments, price):
+    """A price field of the item comment JSON as floats (NaN if absent), without json.loads per row"""
+    return pd.to_numeric(
+        comments.fillna('').astype(str).str.extract(rf'"{price}":\s*([0-9.eE+-]+)', expand=False), errors='coerce'
+    ).to_numpy()
+
+
+def encode(values):
+    """int32 codes and the vocabulary for a column of strings; missing or '' values get -1"""
+    values = pd.Series(values, dtype=object)
+    codes, vocabulary = pd.factorize(values.where(values.ne('')))
+    return codes.astype(np.int32), vocabulary.to_numpy(dtype=object).astype(str)
+
+
+class PageViewCounter:
+    """Events per listing and pageType, accumulated on interned item codes across chunks"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, item_codes, page_types, counts=None):
+        item_codes = np.asarray(item_codes)
+        page_types = pd.Series(page_types, dtype=object).to_numpy()
+        counts = np.ones(len(item_codes), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        valid = (item_codes >= 0) & pd.notna(page_types)
+        if not valid.any():
+            return
+        type_codes, uniques = pd.factorize(page_types[valid].astype(str))
+        item_codes = item_codes[valid]
+        counts = counts[valid]
+        size = int(item_codes.max()) + 1
+        for t, page_type in enumerate(uniques):
+            column = self.counts.get(page_type, np.zeros(0, dtype=np.int64))
+            if len(column) < size:
+                column = np.concatenate([column, np.zeros(max(size, 2 * len(column)) - len(column), np.int64)])
+            selected = type_codes == t
+            column += np.bincount(
+                item_codes[selected], weights=counts[selected], minlength=len(column)
+            ).astype(np.int64)
+            self.counts[page_type] = column
+
+    def matrix(self, item_codes):
+        """(page types, int32 [len(item_codes), n_types] counts) for the given listings"""
+        page_types = sorted(self.counts)
+        item_codes = np.asarray(item_codes)
+        views = np.zeros((len(item_codes), len(page_types)), dtype=np.int32)
+        for t, page_type in enumerate(page_types):
+            column = self.counts[page_type]
+            known = item_codes < len(column)
+            views[known, t] = column[item_codes[known]]
+        return np.array(page_types, dtype=str), views
+
+
+class ItemFeatures:
+    """Typed per-listing attributes as parallel NumPy arrays
+
+    rent_price/sale_price are float32 (NaN when absent), listing_type holds one
+    bit per entry of CATEGORIES, and estate/region/address are int32 codes into
+    the matching vocabularies (-1 when missing). page_views counts each
+    listing's events per pageType, when the processor saw them.
+    """
+
+    def __init__(self, item_ids, timestamp, rent_price, sale_price, listing_type, codes, vocabularies,
+                 page_types=None, page_views=None):
+        self.item_ids = np.asarray(item_ids, dtype=object)
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.rent_price = np.asarray(rent_price, dtype=np.float32)
+        self.sale_price = np.asarray(sale_price, dtype=np.float32)
+        self.listing_type = np.asarray(listing_type, dtype=np.uint8)
+        self.codes = codes
+        self.vocabularies = vocabularies
+        self.page_types = np.asarray(page_types if page_types is not None else [], dtype=str)
+        self.page_views = (page_views if page_views is not None
+                           else np.zeros((len(self.item_ids), 0), dtype=np.int32))
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __repr__(self):
+        return (f"ItemFeatures(items={len(self)}, estates={len(self.vocabularies['estate'])}, "
+                f"regions={len(self.vocabularies['region'])}, page_types={self.page_types.tolist()})")
+
+    @classmethod
+    def from_properties(cls, properties, page_views=None, item_codes=None):
+        """From one extracted event per listing (house_id, timestamp, prices, estate/region/address)
+
+        Listing types follow build_item_rows: a positive price makes a listing a
+        rental or a sale. page_views is a PageViewCounter keyed by item_codes.
+        """
+        rent_price = pd.to_numeric(properties['rent_price'], errors='coerce').to_numpy(dtype=np.float64)
+        sale_price = pd.to_numeric(properties['sale_price'], errors='coerce').to_numpy(dtype=np.float64)
+        rental = rent_price > 0
+        sale = sale_price > 0
+        codes, vocabularies = {}, {}
+        for kind, column in zip(CODED, ('estate_name', 'region_name', 'house_address')):
+            values = properties[column] if column in properties else [None] * len(properties)
+            codes[kind], vocabularies[kind] = encode(values)
+        page_types, views = (page_views.matrix(item_codes) if page_views is not None and item_codes is not None
+                             else (None, None))
+        return cls(
+            item_ids=properties['house_id'].astype(str).to_numpy(),
+            timestamp=pd.to_numeric(properties['timestamp'], errors='coerce').fillna(0).to_numpy(dtype=np.int64),
+            rent_price=np.where(rental, rent_price, np.nan),
+            sale_price=np.where(sale, sale_price, np.nan),
+            listing_type=rental.astype(np.uint8) | (sale.astype(np.uint8) << 1),
+            codes=codes, vocabularies=vocabularies, page_types=page_types, page_views=views,
+        )
+
+    @classmethod
+    def from_items_frame(cls, items):
+        """From items.csv rows, parsing labels and the comment JSON once, vectorized"""
+        items = items.drop_duplicates('item_id', keep='last').reset_index(drop=True)
+        categories = items['categories'].fillna('').astype(str)
+        listing_type = np.zeros(len(items), dtype=np.uint8)
+        for bit, category in enumerate(CATEGORIES):
+            listing_type |= categories.str.contains(category, regex=False).to_numpy().astype(np.uint8) << bit
+        codes, vocabularies = {}, {}
+        for kind in CODED:
+            codes[kind], vocabularies[kind] = encode(label_values(items['labels'], kind))
+        return cls(
+            item_ids=items['item_id'].astype(str).to_numpy(),
+            timestamp=pd.to_numeric(items['timestamp'], errors='coerce').fillna(0).to_numpy(dtype=np.int64),
+            rent_price=extract_price(items['comment'], 'rent_price'),
+            sale_price=extract_price(items['comment'], 'sale_price'),
+            listing_type=listing_type, codes=codes, vocabularies=vocabularies,
+        )
+
+    def price(self, name):
+        return self.rent_price if name == 'rent_price' else self.sale_price
+
+    def has_category(self, category):
+        return (self.listing_type & (1 << CATEGORIES.index(category))) != 0
+
+    def matches(self, kind, value):
+        """Boolean mask of listings whose `kind` (estate/region/address) equals value"""
+        vocabulary = self.vocabularies[kind]
+        code = np.flatnonzero(vocabulary == value)
+        if len(code) == 0:
+            return np.zeros(len(self), dtype=bool)
+        return self.codes[kind] == code[0]
+
+    def values(self, kind):
+        """Decoded `kind` strings per listing ('' when missing)"""
+        vocabulary = np.append(self.vocabularies[kind].astype(object), '')
+        return vocabulary[self.codes[kind]]
+
+    def save(self, path):
+        arrays = {
+            'item_ids': self.item_ids.astype(str), 'timestamp': self.timestamp,
+            'rent_price': self.rent_price, 'sale_price': self.sale_price, 'listing_type': self.listing_type,
+            'page_types': self.page_types, 'page_views': self.page_views,
+        }
+        for kind in CODED:
+            arrays[kind] = self.codes[kind]
+            arrays[f"{kind}_vocabulary"] = self.vocabularies[kind]
+        np.savez(path, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                item_ids=data['item_ids'], timestamp=data['timestamp'],
+                rent_price=data['rent_price'], sale_price=data['sale_price'], listing_type=data['listing_type'],
+                codes={kind: data[kind] for kind in CODED},
+                vocabularies={kind: data[f"{kind}_vocabulary"] for kind in CODED},
+                page_types=data['page_types'], page_views=data['page_views'],
+            )
+
+
+def load_item_features(path):
+    """ItemFeatures for an items.csv, a columnar store directory, or an item_features.npz
+
+    An item_features.npz written by process_data.py next to items.csv (and not
+    older than it) is loaded directly; otherwise the rows are parsed once.
+    """
+    if path.endswith('.npz'):
+        return ItemFeatures.load(path)
+    sibling = os.path.join(os.path.dirname(os.path.abspath(path)), FEATURES_FILE)
+    if os.path.isfile(path) and os.path.exists(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path):
+        return ItemFeatures.load(sibling)
+    return ItemFeatures.from_items_frame(load_items_frame(path))
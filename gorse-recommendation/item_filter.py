@@ -0,0 +1,215 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from item_features import CATEGORIES, PRICES, load_item_features, load_items_frame
+from recommend_client import percentile
+
+# Which comment price a price band applies to for each listing type
+CATEGORY_PRICE = {'rental': 'rent_price', 'sale': 'sale_price'}
+
+
+class ItemAttributeIndex:
+    """Boolean filter masks over the catalog from typed ItemFeatures
+
+    Region/estate filters compare int32 codes, listing types test a bit, and
+    price bands are two searchsorted calls on prices sorted once. Masks are
+    cached per distinct filter, so filtering a candidate list is a lookup of
+    candidate rows plus one fancy-indexing step, without parsing any JSON.
+    """
+
+    def __init__(self, features, max_cached_masks=256):
+        self.features = features
+        self.item_ids = pd.Index(features.item_ids)
+        self.prices = {}
+        for price in PRICES:
+            values = features.price(price)
+            order = np.argsort(values, kind='stable')
+            present = np.count_nonzero(~np.isnan(values))
+            # NaN sorts last; keep only listings that have the price
+            self.prices[price] = (order[:present], values[order[:present]])
+        self.max_cached_masks = max_cached_masks
+        self.masks = OrderedDict()
+
+    @classmethod
+    def from_path(cls, path, **options):
+        return cls(load_item_features(path), **options)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def _price_mask(self, price, min_price, max_price):
+        rows, values = self.prices[price]
+        low = 0 if min_price is None else np.searchsorted(values, min_price, side='left')
+        high = len(values) if max_price is None else np.searchsorted(values, max_price, side='right')
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows[low:high]] = True
+        return mask
+
+    def mask(self, region=None, estate=None, category=None, min_price=None, max_price=None):
+        """Boolean mask over the catalog of listings matching every given filter
+
+        The price band applies to rent_price for rentals, sale_price for sales,
+        and to either price when no category is given.
+        """
+        key = (region, estate, category, min_price, max_price)
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.masks.move_to_end(key)
+            return mask
+
+        mask = np.ones(len(self), dtype=bool)
+        if region is not None:
+            mask &= self.features.matches('region', region)
+        if estate is not None:
+            mask &= self.features.matches('estate', estate)
+        if category is not None:
+            mask &= self.features.has_category(category)
+        if min_price is not None or max_price is not None:
+            prices = [CATEGORY_PRICE[category]] if category is not None else PRICES
+            in_band = np.zeros(len(self), dtype=bool)
+            for price in prices:
+                in_band |= self._price_mask(price, min_price, max_price)
+            mask &= in_band
+
+        self.masks[key] = mask
+        if len(self.masks) > self.max_cached_masks:
+            self.masks.popitem(last=False)
+        return mask
+
+    def filter_ids(self, item_ids, **filters):
+        """Positions in item_ids (in order) of the listings matching the filters; unknown ids never match"""
+        rows = self.item_ids.get_indexer(item_ids)
+        mask = self.mask(**filters)
+        keep = (rows >= 0) & mask[np.maximum(rows, 0)]
+        return np.flatnonzero(keep)
+
+    def filter(self, recommendations, **filters):
+        """Keep the [{"Id", "Score"}] entries whose listing matches the filters"""
+        if not recommendations:
+            return []
+        keep = self.filter_ids([entry['Id'] for entry in recommendations], **filters)
+        return [recommendations[i] for i in keep]
+
+
+class FilteredRecommender:
+    """Personalized recommendations restricted to a region / listing type / price band
+
+    Gorse cannot filter by price or region, so candidates are over-fetched and
+    post-filtered through an ItemAttributeIndex. The first fetch size comes from
+    the filter's share of the catalog (or the survival rate seen for the same
+    filter before); when fewer than n survive, the fetch at least doubles until
+    n do, the user's list runs out, max_fetch is reached or max_rounds requests
+    were made. With a caching RecommendClient, a larger fetch also serves later
+    smaller ones.
+    """
+
+    def __init__(self, client, index, max_fetch=1000, headroom=1.5, min_rate=0.01, max_rounds=4):
+        self.client = client
+        self.index = index
+        self.max_fetch = max_fetch
+        self.max_rounds = max_rounds
+        self.headroom = headroom
+        self.min_rate = min_rate
+        self.survival = {}
+        self.fetches = 0
+
+    def _fetch_size(self, n, key, selectivity):
+        rate = max(self.survival.get(key, selectivity), self.min_rate)
+        return min(self.max_fetch, max(n, math.ceil(n / rate * self.headroom)))
+
+    def recommend(self, user_id, n=10, **filters):
+        key = tuple(sorted(filters.items()))
+        selectivity = float(self.index.mask(**filters).mean())
+        if selectivity == 0.0:
+            return []
+        fetch = self._fetch_size(n, key, selectivity)
+        for _ in range(self.max_rounds):
+            candidates = self.client.recommend(user_id, fetch)
+            self.fetches += 1
+            matches = self.index.filter(candidates, **filters)
+            if candidates:
+                rate = len(matches) / len(candidates)
+                previous = self.survival.get(key)
+                self.survival[key] = rate if previous is None else 0.8 * previous + 0.2 * rate
+            if len(matches) >= n or len(candidates) < fetch or fetch >= self.max_fetch:
+                break
+            # The smoothed survival rate lags behind an empty round, so grow at least geometrically
+            target = self._fetch_size(n, key, 0.0) if not matches else math.ceil(
+                n * len(candidates) / len(matches) * self.headroom
+            )
+            fetch = min(self.max_fetch, max(fetch * 2, target))
+        return matches[:n]
+
+
+def parse_prices_per_candidate(candidates, comments, category, min_price, max_price):
+    """The per-request JSON path the index replaces, kept for --measure"""
+    price = CATEGORY_PRICE[category]
+    kept = []
+    for item_id in candidates:
+        value = json.loads(comments[item_id] or '{}').get(price)
+        if value is not None and min_price <= value <= max_price:
+            kept.append(item_id)
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter recommendation candidates by region, listing type and price")
+    parser.add_argument('--items', default='items.csv', help="items.csv or a columnar store directory")
+    parser.add_argument('--region', default=None)
+    parser.add_argument('--estate', default=None)
+    parser.add_argument('--category', choices=CATEGORIES, default='rental')
+    parser.add_argument('--min-price', type=float, default=None)
+    parser.add_argument('--max-price', type=float, default=None)
+    parser.add_argument('--candidates', type=int, default=500, help="Candidate list length for --measure")
+    parser.add_argument('--measure', action='store_true',
+                        help="Time index filtering against parsing the comment JSON per candidate")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.items):
+        print(f"❌ File not found: {args.items}")
+        return
+
+    started = time.perf_counter()
+    index = ItemAttributeIndex.from_path(args.items)
+    vocabularies = index.features.vocabularies
+    print(f"✓ Indexed {len(index)} listings ({len(vocabularies['region'])} regions, "
+          f"{len(vocabularies['estate'])} estates) "
+          f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    filters = {'region': args.region, 'estate': args.estate, 'category': args.category,
+               'min_price': args.min_price, 'max_price': args.max_price}
+    matching = int(index.mask(**filters).sum())
+    print(f"{matching} listings ({matching / max(len(index), 1):.1%}) match {filters}")
+
+    if args.measure:
+        rng = random.Random(42)
+        all_ids = list(index.item_ids)
+        items = load_items_frame(args.items)
+        comments = dict(zip(items['item_id'].astype(str), items['comment'].fillna('')))
+        low = args.min_price if args.min_price is not None else -math.inf
+        high = args.max_price if args.max_price is not None else math.inf
+        naive, vectorized = [], []
+        for _ in range(200):
+            candidates = [{'Id': item_id, 'Score': 0.0}
+                          for item_id in rng.sample(all_ids, min(args.candidates, len(all_ids)))]
+            started = time.perf_counter()
+            parse_prices_per_candidate([entry['Id'] for entry in candidates], comments, args.category, low, high)
+            naive.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index.filter(candidates, category=args.category, min_price=args.min_price, max_price=args.max_price)
+            vectorized.append(time.perf_counter() - started)
+        print(f"\n{args.candidates} candidates per request:")
+        print(f"  json.loads per candidate: p50 {percentile(naive, 50) * 1000:.3f}ms")
+        print(f"  attribute index:          p50 {percentile(vectorized, 50) * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
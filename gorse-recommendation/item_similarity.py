@@ -0,0 +1,312 @@
+import argparse
+import os
+import random
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from item_features import CATEGORIES, PRICES, ItemFeatures, load_item_features
+from offline_recommender import concat_ranges
+
+# Relative weight of each feature block in the cosine similarity
+FEATURE_WEIGHTS = {
+    'estate': 1.0,
+    'region': 0.5,
+    'category': 0.5,
+    'price': 0.5,
+}
+
+LABELS = ('estate', 'region')
+
+
+def _hashed_columns(vocabulary, dim):
+    """Stable (bucket, sign) feature hashing for each string of a vocabulary"""
+    hashes = np.array([zlib.crc32(value.encode('utf-8')) for value in vocabulary], dtype=np.int64)
+    return hashes % dim, np.where((hashes >> 16) & 1, 1.0, -1.0)
+
+
+def hashed_labels(features, kind, hash_dim):
+    """Per-item (bucket, sign) of an estate/region label; bucket -1 and sign 0 where it is missing"""
+    codes = features.codes[kind]
+    buckets = np.full(len(features), -1, dtype=np.int64)
+    signs = np.zeros(len(features))
+    rows = np.flatnonzero(codes >= 0)
+    if len(rows):
+        vocabulary_buckets, vocabulary_signs = _hashed_columns(features.vocabularies[kind], hash_dim)
+        buckets[rows] = vocabulary_buckets[codes[rows]]
+        signs[rows] = vocabulary_signs[codes[rows]]
+    return buckets, signs
+
+
+def build_item_embeddings(features, hash_dim=64, return_norms=False):
+    """Unit-length float32 vectors from estate/region codes, listing types and log prices
+
+    Estates and regions are feature-hashed into hash_dim columns per kind so the
+    width stays fixed however many estates the catalog has. Distinct estates
+    can share a column; ItemSimilarityService re-ranks with the exact labels.
+    With return_norms, also returns each vector's length before normalizing.
+    """
+    n = len(features)
+    blocks = []
+
+    for kind in LABELS:
+        block = np.zeros((n, hash_dim), dtype=np.float32)
+        buckets, signs = hashed_labels(features, kind, hash_dim)
+        rows = np.flatnonzero(buckets >= 0)
+        block[rows, buckets[rows]] = signs[rows]
+        blocks.append(block * FEATURE_WEIGHTS[kind])
+
+    category_block = np.stack(
+        [features.has_category(category).astype(np.float32) for category in CATEGORIES], axis=1
+    )
+    blocks.append(category_block * FEATURE_WEIGHTS['category'])
+
+    price_block = np.zeros((n, len(PRICES)), dtype=np.float32)
+    for i, price in enumerate(PRICES):
+        values = features.price(price).astype(np.float64)
+        present = values > 0
+        if present.any():
+            logs = np.log(values[present])
+            std = logs.std() or 1.0
+            price_block[present, i] = (logs - logs.mean()) / std
+    blocks.append(price_block * FEATURE_WEIGHTS['price'])
+
+    embeddings = np.hstack(blocks)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = (embeddings / norms).astype(np.float32)
+    return (embeddings, norms[:, 0]) if return_norms else embeddings
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first"""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means lists, probing the n_probe nearest at query time"""
+
+    def __init__(self, n_lists=None, n_probe=8, iterations=10, sample_size=50_000, seed=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = None
+        self.order = None
+        self.offsets = None
+        self.list_vectors = None
+
+    def _assign(self, vectors, block=16_384):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            assignment[start:start + block] = np.argmax(vectors[start:start + block] @ self.centroids.T, axis=1)
+        return assignment
+
+    def fit(self, vectors):
+        n_lists = self.n_lists or max(1, int(2 * np.sqrt(len(vectors))))
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), self.sample_size), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=len(self.centroids))
+            # Re-seed empty lists from random sample points
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+        assignment = self._assign(vectors)
+        self.order = np.argsort(assignment, kind='stable')
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(self.centroids)), out=self.offsets[1:])
+        # Vectors stored list by list, so probing a list reads one contiguous slice
+        self.list_vectors = np.ascontiguousarray(vectors[self.order])
+        return self
+
+    def search(self, query, k=10):
+        """(indices, scores) of approximately the k vectors with the highest cosine to query"""
+        lists = top_k(self.centroids @ query, self.n_probe)
+        positions = concat_ranges(self.offsets[lists], self.offsets[lists + 1] - self.offsets[lists])
+        scores = np.concatenate([
+            self.list_vectors[self.offsets[i]:self.offsets[i + 1]] @ query for i in lists
+        ])
+        best = top_k(scores, k)
+        return self.order[positions[best]], scores[best]
+
+
+def brute_force(vectors, query, k=10):
+    scores = vectors @ query
+    best = top_k(scores, k)
+    return best, scores[best]
+
+
+class ItemSimilarityService:
+    """'Similar listings' lookups over an IVF index of item embeddings
+
+    The index ranks on hashed estate/region columns, where thousands of
+    estates share hash_dim buckets. The top rerank * (n + 1) candidates are
+    re-scored with the exact labels: a shared bucket only counts when the
+    estate (or region) codes are equal, so the cosine is the one a one-hot
+    encoding of every estate would give.
+    """
+
+    def __init__(self, features, n_lists=None, n_probe=8, hash_dim=64, rerank=16):
+        self.item_ids = features.item_ids
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.rerank = rerank
+        started = time.perf_counter()
+        self.embeddings, norms = build_item_embeddings(features, hash_dim, return_norms=True)
+        # Per kind: label codes, hashed (bucket, sign) and the label's entry in the unit vector
+        self.labels = [
+            (features.codes[kind], *hashed_labels(features, kind, hash_dim), FEATURE_WEIGHTS[kind] / norms)
+            for kind in LABELS
+        ]
+        self.index = IVFIndex(n_lists=n_lists, n_probe=n_probe).fit(self.embeddings)
+        self.build_seconds = time.perf_counter() - started
+
+    @classmethod
+    def from_path(cls, path, **options):
+        return cls(load_item_features(path), **options)
+
+    def exact_scores(self, item, candidates, scores):
+        """Cosines of candidates to item with exact labels, from their hashed cosines"""
+        scores = scores.astype(np.float64)
+        for codes, buckets, signs, entries in self.labels:
+            hashed = (buckets[candidates] == buckets[item]) * signs[candidates] * signs[item]
+            exact = (codes[candidates] == codes[item]) & (codes[item] >= 0)
+            scores += (exact - hashed) * entries[candidates] * entries[item]
+        return scores
+
+    def search(self, item, k=10):
+        """(indices, scores) of approximately the k items most similar to item, item included"""
+        candidates, scores = self.index.search(self.embeddings[item], k * self.rerank)
+        scores = self.exact_scores(item, candidates, scores)
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def similar(self, item_id, n=10):
+        """Top-n similar items as [{"Id", "Score"}], excluding the item itself"""
+        item = self.item_index.get(item_id)
+        if item is None:
+            return []
+        indices, scores = self.search(item, n + 1)
+        return [
+            {'Id': self.item_ids[i], 'Score': float(score)}
+            for i, score in zip(indices, scores) if i != item
+        ][:n]
+
+    def measure(self, k=10, queries=1000, seed=42):
+        """Recall@k against brute force plus ANN/brute-force query latency percentiles
+
+        Brute force scores every item with the exact labels, so recall includes
+        what hash collisions cost the index before re-ranking. A returned item
+        counts as a hit when it scores at least as high as the k-th exact
+        neighbour, so ties between identical listings do not count as misses.
+        hashed_recall is the same check for a brute-force top-k on the hashed
+        embeddings alone.
+        """
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(self.embeddings), min(queries, len(self.embeddings)), replace=False)
+        everything = np.arange(len(self.embeddings))
+        hits = 0
+        hashed_hits = 0
+        ann_latencies = []
+        exact_latencies = []
+        for item in sample:
+            query = self.embeddings[item]
+            started = time.perf_counter()
+            _, ann_scores = self.search(item, k)
+            ann_latencies.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            exact = self.exact_scores(item, everything, self.embeddings @ query)
+            kth_best = exact[top_k(exact, k)[-1]]
+            exact_latencies.append(time.perf_counter() - started)
+            hits += int((ann_scores >= kth_best - 1e-6).sum())
+            hashed, _ = brute_force(self.embeddings, query, k)
+            hashed_hits += int((exact[hashed] >= kth_best - 1e-6).sum())
+        return {
+            'recall': hits / (len(sample) * k),
+            'hashed_recall': hashed_hits / (len(sample) * k),
+            'ann_p50_ms': float(np.percentile(ann_latencies, 50) * 1000),
+            'ann_p99_ms': float(np.percentile(ann_latencies, 99) * 1000),
+            'brute_force_p50_ms': float(np.percentile(exact_latencies, 50) * 1000),
+        }
+
+
+def synthetic_items(count, seed=42):
+    """An items.csv-shaped catalog of `count` listings for scale tests"""
+    rng = random.Random(seed)
+    regions = [f"區{i}" for i in range(max(1, count // 2000))]
+    estates = [(f"屋苑{i}", rng.choice(regions)) for i in range(max(1, count // 40))]
+    rows = []
+    for i in range(count):
+        estate, region = rng.choice(estates)
+        categories = rng.choice([['rental'], ['sale'], ['rental', 'sale']])
+        prices = {}
+        if 'rental' in categories:
+            prices['rent_price'] = float(rng.randrange(8000, 60000, 500))
+        if 'sale' in categories:
+            prices['sale_price'] = float(rng.randrange(3000000, 20000000, 10000))
+        rows.append({
+            'item_id': f"HD{40000000 + i}",
+            'timestamp': str(1758000000 + i),
+            'labels': f"estate:{estate}|region:{region}",
+            'categories': '|'.join(categories),
+            'comment': str(prices).replace("'", '"'),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-listing lookups over an approximate nearest-neighbour index")
+    parser.add_argument('--items', default='items.csv',
+                        help="items.csv, a columnar store directory or item_features.npz")
+    parser.add_argument('--synthetic', type=int, default=0, help="Index this many synthetic listings instead")
+    parser.add_argument('--item', action='append', default=[], help="Print listings similar to this item")
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--lists', type=int, default=None, help="IVF lists (default: twice the square root of the item count)")
+    parser.add_argument('--probe', type=int, default=8, help="Lists scanned per query")
+    parser.add_argument('--rerank', type=int, default=16,
+                        help="Candidates re-scored with exact estate/region labels, per result")
+    parser.add_argument('--measure', action='store_true', help="Report recall@n and latency vs brute force")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        features = ItemFeatures.from_items_frame(synthetic_items(args.synthetic))
+    elif os.path.exists(args.items):
+        features = load_item_features(args.items)
+    else:
+        print(f"❌ File not found: {args.items}")
+        return
+
+    service = ItemSimilarityService(features, n_lists=args.lists, n_probe=args.probe, rerank=args.rerank)
+    print(f"✓ Indexed {len(service.item_ids)} items in {len(service.index.centroids)} lists "
+          f"({service.build_seconds:.2f}s)")
+
+    for item_id in args.item:
+        print(f"\nListings similar to {item_id}:")
+        for i, rec in enumerate(service.similar(item_id, args.n)):
+            print(f"  {i+1}. Item ID: {rec['Id']}, Score: {rec['Score']:.3f}")
+
+    if args.measure:
+        stats = service.measure(k=args.n)
+        print(f"\nRecall@{args.n}: {stats['recall']:.3f} (hashed labels without re-ranking: "
+              f"{stats['hashed_recall']:.3f})")
+        print(f"ANN query: p50 {stats['ann_p50_ms']:.3f}ms, p99 {stats['ann_p99_ms']:.3f}ms")
+        print(f"Brute force query: p50 {stats['brute_force_p50_ms']:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    """Thread-safe counters, histograms and timing spans for the ETL and upload stages
+
+    Nothing is written unless a sink is configured: a JSON lines file receives
+    one event per span as it finishes plus a final summary, a .prom file gets
+    the Prometheus text exposition of all counters and histograms on close().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.jsonl = None
+        self.prometheus_path = None
+
+    def configure(self, path):
+        """Send metrics to path: Prometheus text if it ends in .prom, JSON lines otherwise"""
+        if path.endswith('.prom'):
+            self.prometheus_path = path
+        else:
+            self.jsonl = open(path, 'a', encoding='utf-8')
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def emit(self, event, **fields):
+        if self.jsonl is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields}, default=str)
+        with self.lock:
+            self.jsonl.write(line + '\n')
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time a block as stage_seconds{stage=...} and emit it as a span event"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe('stage_seconds', seconds, stage=stage, **labels)
+            self.emit('span', stage=stage, seconds=round(seconds, 6), **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': {name + _label_text(labels): value for (name, labels), value in self.counters.items()},
+                'histograms': {
+                    name + _label_text(labels): {'count': histogram.count, 'sum': round(histogram.sum, 6)}
+                    for (name, labels), histogram in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{name}{_label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if math.isinf(bound) else repr(bound)
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self.jsonl is not None:
+            self.emit('summary', **self.snapshot())
+            self.jsonl.close()
+            self.jsonl = None
+        if self.prometheus_path is not None:
+            # Write then rename so a scraper never reads a half-written file
+            temp_path = self.prometheus_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, self.prometheus_path)
+            self.prometheus_path = None
+
+
+# Process-wide registry shared by the processor, uploader and clients
+METRICS = Metrics()
+
+
+@contextmanager
+def profiled(stage, path=None, top=20):
+    """Run a block under cProfile when path is set; dump the stats there and print the top entries"""
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+        print(f"\nProfile of {stage} saved to {path} (top {top} by cumulative time):")
+        print(output.getvalue())
@@ -0,0 +1,309 @@
+import argparse
+import os
+import re
+import time
+import tomllib
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import ColumnarReader
+
+
+def load_feedback_weights(config_path='config.toml'):
+    """Weight per feedback type from [recommend.feedback_types] in the Gorse config"""
+    try:
+        with open(config_path, 'rb') as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        config = {}
+    types = config.get('recommend', {}).get('feedback_types', {})
+    weights = {feedback_type: float(types.get('read_feedback_weight', 1.0))
+               for feedback_type in types.get('read_types', ['view_listing'])}
+    weights.update({feedback_type: float(types.get('positive_feedback_weight', 3.0))
+                    for feedback_type in types.get('positive_types', ['contact_agent'])})
+    return weights
+
+
+WEIGHT_COMMENT = r'weight:([0-9.]+)'
+
+
+def comment_weights(comments):
+    """weight:x values of feedback comments as floats, NaN where absent
+
+    A compacted feedback row carries the summed weight of its whole session.
+    """
+    return pd.to_numeric(comments.astype(str).str.extract(WEIGHT_COMMENT, expand=False), errors='coerce')
+
+
+def comment_weight(comment):
+    """comment_weights for one comment string; None when it has no usable weight"""
+    match = re.search(WEIGHT_COMMENT, str(comment or ''))
+    try:
+        return float(match.group(1)) if match else None
+    except ValueError:
+        return None
+
+
+def load_feedback_frame(path):
+    """feedback.csv, or the feedback table of a columnar store directory"""
+    if os.path.isdir(path):
+        return ColumnarReader(path).read_frame('feedback')
+    return pd.read_csv(path, dtype={'user_id': str, 'item_id': str})
+
+
+def drop_anonymous(feedback):
+    """Rows with a user id; anonymous events come through as NaN or the string 'nan'"""
+    user_ids = feedback['user_id']
+    return feedback[user_ids.notna() & (user_ids.astype(str) != 'nan')]
+
+
+def concat_ranges(starts, lengths):
+    """np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)]) without the loop"""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + (np.arange(total) - offsets)
+
+
+class CSRMatrix:
+    """Minimal compressed sparse row matrix: indptr, indices and data arrays"""
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape):
+        """Build from (row, col, value) triplets, summing duplicates"""
+        keys = rows.astype(np.int64) * shape[1] + cols
+        keys, inverse = np.unique(keys, return_inverse=True)
+        data = np.bincount(inverse, weights=values).astype(np.float32)
+        rows = keys // shape[1]
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, (keys % shape[1]).astype(np.int32), data, shape)
+
+    def row(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_lengths(self):
+        return np.diff(self.indptr)
+
+
+class OfflineRecommender:
+    """Item-item cosine recommender trained from the feedback the processor emits
+
+    User-item weights come from the weight:x comments (or the config's weight
+    for the feedback type), summed and log-damped. Each item keeps its top
+    `neighbors` most similar items as a CSR matrix, and a user's scores are the
+    weighted sum of the neighbour rows of the items they interacted with.
+    """
+
+    def __init__(self, neighbors=100, max_user_items=500, max_pairs=5_000_000, config_path='config.toml'):
+        self.neighbors = neighbors
+        self.max_user_items = max_user_items
+        self.max_pairs = max_pairs
+        self.feedback_weights = load_feedback_weights(config_path)
+        self.user_ids = None
+        self.item_ids = None
+        self.user_index = {}
+        self.item_index = {}
+        self.user_items = None
+        self.similar = None
+        self.popular = None
+        self.train_seconds = 0.0
+
+    def _interaction_weights(self, feedback):
+        feedback = drop_anonymous(feedback)
+        feedback = feedback[feedback['feedback_type'].isin(self.feedback_weights.keys())]
+        weights = comment_weights(feedback['comment']).fillna(feedback['feedback_type'].map(self.feedback_weights))
+        return feedback, weights.to_numpy(dtype=np.float64)
+
+    def fit(self, feedback):
+        started = time.perf_counter()
+        feedback, weights = self._interaction_weights(feedback)
+        user_codes, self.user_ids = pd.factorize(feedback['user_id'].astype(str))
+        item_codes, self.item_ids = pd.factorize(feedback['item_id'].astype(str))
+        self.user_ids = np.asarray(self.user_ids, dtype=object)
+        self.item_ids = np.asarray(self.item_ids, dtype=object)
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        n_users, n_items = len(self.user_ids), len(self.item_ids)
+
+        self.user_items = CSRMatrix.from_coo(user_codes, item_codes, weights, (n_users, n_items))
+        self.user_items.data = np.log1p(self.user_items.data)
+        self.popular = np.argsort(
+            -np.bincount(item_codes, weights=weights, minlength=n_items), kind='stable'
+        )
+        self.similar = self._item_neighbors(n_items)
+        self.train_seconds = time.perf_counter() - started
+        return self
+
+    @staticmethod
+    def _cooccurrence_pairs(matrix, users):
+        """Item pairs (i, j, r_ui * r_uj) for a block of users"""
+        lengths = matrix.row_lengths()[users]
+        entries = concat_ranges(matrix.indptr[users], lengths)
+        entry_lengths = np.repeat(lengths, lengths)
+        left = np.repeat(entries, entry_lengths)
+        right = concat_ranges(np.repeat(matrix.indptr[users], lengths), entry_lengths)
+        return matrix.indices[left], matrix.indices[right], matrix.data[left] * matrix.data[right]
+
+    def _item_neighbors(self, n_items):
+        matrix = self.user_items
+        # Very heavy users add quadratic pairs but little signal; keep their strongest items
+        lengths = matrix.row_lengths()
+        if (lengths > self.max_user_items).any():
+            keep = np.ones(len(matrix.indices), dtype=bool)
+            for user in np.flatnonzero(lengths > self.max_user_items):
+                start, end = matrix.indptr[user], matrix.indptr[user + 1]
+                keep[start + np.argsort(-matrix.data[start:end])[self.max_user_items:]] = False
+            rows = np.repeat(np.arange(matrix.shape[0]), lengths)[keep]
+            matrix = CSRMatrix.from_coo(
+                rows, matrix.indices[keep], matrix.data[keep], matrix.shape
+            )
+            lengths = matrix.row_lengths()
+
+        # Accumulate co-occurrence in user blocks of at most max_pairs pairs
+        blocks = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))]
+        block_start = 0
+        pair_counts = np.cumsum(lengths.astype(np.int64) ** 2)
+        while block_start < matrix.shape[0]:
+            offset = pair_counts[block_start - 1] if block_start else 0
+            block_end = max(block_start + 1, int(np.searchsorted(pair_counts, offset + self.max_pairs, 'right')))
+            left, right, values = self._cooccurrence_pairs(matrix, np.arange(block_start, block_end))
+            block = CSRMatrix.from_coo(left, right, values, (n_items, n_items))
+            rows = np.repeat(np.arange(n_items), block.row_lengths())
+            blocks.append((rows, block.indices, block.data))
+            block_start = block_end
+        rows, cols, values = (np.concatenate(parts) for parts in zip(*blocks))
+        cooccurrence = CSRMatrix.from_coo(rows, cols, values, (n_items, n_items))
+
+        # Cosine: divide by the item norms (the diagonal) and drop self-similarity
+        rows = np.repeat(np.arange(n_items), cooccurrence.row_lengths())
+        cols = cooccurrence.indices
+        diagonal = np.zeros(n_items)
+        on_diagonal = rows == cols
+        diagonal[rows[on_diagonal]] = cooccurrence.data[on_diagonal]
+        norms = np.sqrt(diagonal)
+        off_diagonal = ~on_diagonal
+        rows, cols = rows[off_diagonal], cols[off_diagonal]
+        similarity = cooccurrence.data[off_diagonal] / (norms[rows] * norms[cols])
+
+        # Keep each item's top neighbours
+        order = np.lexsort((-similarity, rows))
+        rows, cols, similarity = rows[order], cols[order], similarity[order]
+        row_starts = np.searchsorted(rows, np.arange(n_items))
+        rank = np.arange(len(rows)) - row_starts[rows]
+        keep = rank < self.neighbors
+        indptr = np.zeros(n_items + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=n_items), out=indptr[1:])
+        return CSRMatrix(indptr, cols[keep].astype(np.int32), similarity[keep].astype(np.float32),
+                         (n_items, n_items))
+
+    def score(self, user_id):
+        """Score vector over all items for one user (None for unknown users)"""
+        user = self.user_index.get(user_id)
+        if user is None:
+            return None
+        items, weights = self.user_items.row(user)
+        lengths = self.similar.indptr[items + 1] - self.similar.indptr[items]
+        positions = concat_ranges(self.similar.indptr[items], lengths)
+        return np.bincount(
+            self.similar.indices[positions],
+            weights=self.similar.data[positions] * np.repeat(weights, lengths),
+            minlength=len(self.item_ids)
+        ).astype(np.float64)
+
+    def recommend(self, user_id, n=10, exclude_seen=True):
+        """Top-n items as [{"Id", "Score"}], like /api/recommend; popular items fill the gaps"""
+        scores = self.score(user_id)
+        seen = np.empty(0, dtype=np.int64)
+        if scores is None:
+            scores = np.zeros(len(self.item_ids))
+        elif exclude_seen:
+            seen = self.user_items.row(self.user_index[user_id])[0]
+            scores[seen] = -np.inf
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        top = candidates[np.argsort(-scores[candidates], kind='stable')]
+        if len(top) < n:
+            fill = self.popular[~np.isin(self.popular, np.concatenate([top, seen]))][:n - len(top)]
+            top = np.concatenate([top, fill])
+        return [{'Id': self.item_ids[i], 'Score': float(max(scores[i], 0.0))} for i in top]
+
+    def similar_items(self, item_id, n=10):
+        item = self.item_index.get(item_id)
+        if item is None:
+            return []
+        neighbors, similarity = self.similar.row(item)
+        return [{'Id': self.item_ids[j], 'Score': float(s)} for j, s in zip(neighbors[:n], similarity[:n])]
+
+    def save(self, path):
+        np.savez(
+            path,
+            user_ids=self.user_ids.astype(str), item_ids=self.item_ids.astype(str), popular=self.popular,
+            user_items_indptr=self.user_items.indptr, user_items_indices=self.user_items.indices,
+            user_items_data=self.user_items.data, similar_indptr=self.similar.indptr,
+            similar_indices=self.similar.indices, similar_data=self.similar.data
+        )
+
+    @classmethod
+    def load(cls, path, **options):
+        model = cls(**options)
+        with np.load(path) as arrays:
+            model.user_ids = arrays['user_ids'].astype(object)
+            model.item_ids = arrays['item_ids'].astype(object)
+            model.popular = arrays['popular']
+            shape = (len(model.user_ids), len(model.item_ids))
+            model.user_items = CSRMatrix(arrays['user_items_indptr'], arrays['user_items_indices'],
+                                         arrays['user_items_data'], shape)
+            model.similar = CSRMatrix(arrays['similar_indptr'], arrays['similar_indices'],
+                                      arrays['similar_data'], (shape[1], shape[1]))
+        model.user_index = {user_id: i for i, user_id in enumerate(model.user_ids)}
+        model.item_index = {item_id: i for i, item_id in enumerate(model.item_ids)}
+        return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the offline item-item recommender")
+    parser.add_argument('--feedback', default='feedback.csv', help="feedback.csv or a columnar store directory")
+    parser.add_argument('--config', default='config.toml')
+    parser.add_argument('--neighbors', type=int, default=100, help="Similar items kept per item")
+    parser.add_argument('--save', default=None, help="Write the trained model to this .npz file")
+    parser.add_argument('--user', action='append', default=[], help="Print recommendations for this user")
+    parser.add_argument('--n', type=int, default=10)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.feedback):
+        print(f"❌ File not found: {args.feedback}")
+        return
+
+    feedback = load_feedback_frame(args.feedback)
+    model = OfflineRecommender(neighbors=args.neighbors, config_path=args.config).fit(feedback)
+    print(f"✓ Trained on {len(feedback)} feedback rows in {model.train_seconds:.2f}s")
+    print(f"  {len(model.user_ids)} users, {len(model.item_ids)} items, "
+          f"{len(model.similar.data)} item neighbour links")
+
+    if args.save:
+        model.save(args.save)
+        print(f"✓ Model saved to {args.save}")
+
+    for user_id in args.user:
+        started = time.perf_counter()
+        recommendations = model.recommend(user_id, args.n)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"\nRecommendations for user {user_id} ({elapsed:.2f}ms):")
+        for i, rec in enumerate(recommendations):
+            print(f"  {i+1}. Item ID: {rec['Id']}, Score: {rec['Score']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from bulk_uploader import BulkUploader
+from id_registry import FirstSeen
+from process_data import (
+    FEEDBACK_COLUMNS, FeedbackSessions, RealEstateDataProcessor, build_feedback_records, build_user_frame,
+    decode_feedback, detect_encoding, register_shard
+)
+import upload_complete
+
+_DONE = object()
+
+
+class QueueSource:
+    """Iterate over records from lists put on a queue until the end marker arrives"""
+
+    def __init__(self, records_queue):
+        self.records_queue = records_queue
+        self.finished = False
+
+    def __iter__(self):
+        while not self.finished:
+            records = self.records_queue.get()
+            if records is _DONE:
+                self.finished = True
+                return
+            yield from records
+
+    def drain(self):
+        for _ in self:
+            pass
+
+
+def upload_from_queue(uploader, endpoint, records_queue, label, results):
+    """Consumer side: upload everything the producer queues for one endpoint"""
+    source = QueueSource(records_queue)
+    try:
+        results[endpoint] = uploader.upload(endpoint, source, label=label)
+    except BaseException as e:
+        results[f'{endpoint}_error'] = e
+    finally:
+        # Drain whatever is left so the producer never blocks on a full queue
+        source.drain()
+
+
+class CsvSink:
+    """Optional side output that writes the same feedback/items/users CSV files as process_data.py"""
+
+    def __init__(self, output_dir):
+        Path(output_dir).mkdir(exist_ok=True)
+        self.output_dir = output_dir
+        self.feedback_file = open(os.path.join(output_dir, 'feedback.csv'), 'w', encoding='utf-8', newline='')
+        self.feedback_file.write(','.join(FEEDBACK_COLUMNS) + '\n')
+        self.item_rows = []
+        self.user_ids = []
+
+    def write_shard(self, shard, new_items, new_users):
+        if shard['feedback_csv'] is not None:
+            self.feedback_file.write(shard['feedback_csv'])
+        self.item_rows.extend(row for row, _ in new_items)
+        self.user_ids.extend(new_users)
+
+    def write_feedback(self, feedback):
+        feedback.to_csv(self.feedback_file, header=False, index=False)
+
+    def close(self):
+        self.feedback_file.close()
+        pd.DataFrame(self.item_rows).to_csv(os.path.join(self.output_dir, 'items.csv'), index=False)
+        build_user_frame(self.user_ids).to_csv(os.path.join(self.output_dir, 'users.csv'), index=False)
+        print(f"✓ CSV copies written to {self.output_dir}/")
+
+
+def produce(processor, encoding, chunksize, workers, items_queue, feedback_queue, sink, stats):
+    """Stream shards from the processor into the upload queues (and the CSV sink)
+
+    Items and users are de-duplicated on the processor's interned codes. With a
+    compact window, feedback sessions are queued once they are settled (see
+    FeedbackSessions), the ones still open after the last shard.
+    """
+    items_seen = FirstSeen()
+    users_seen = FirstSeen()
+    sessions = FeedbackSessions(processor.compact_window) if processor.compact_window is not None else None
+
+    def queue_sessions(feedback):
+        if not len(feedback):
+            return
+        feedback = decode_feedback(feedback, processor.ids.users.values, processor.ids.items.values)
+        for start in range(0, len(feedback), chunksize):
+            feedback_queue.put(build_feedback_records(feedback.iloc[start:start + chunksize]))
+        if sink is not None:
+            sink.write_feedback(feedback)
+        stats['feedback'] += len(feedback)
+
+    try:
+        shards = processor.iter_shards(encoding, chunksize, workers, with_records=True)
+        for shard in shards:
+            register_shard(shard, processor.ids)
+            is_new = items_seen.add(shard['item_codes'])
+            new_items = [
+                (row, record) for row, record, new in zip(shard['item_rows'], shard['item_records'], is_new) if new
+            ]
+            new_users = shard['user_ids'][users_seen.add(shard['user_codes'])].tolist()
+
+            # Items go first so a shard's listings are queued before its feedback
+            items_queue.put([record for _, record in new_items])
+            if sessions is not None:
+                queue_sessions(sessions.add(shard['feedback_frame']))
+            else:
+                feedback_queue.put(shard['feedback_records'])
+                stats['feedback'] += shard['feedback_count']
+            if sink is not None:
+                sink.write_shard(shard, new_items, new_users)
+
+            stats['rows'] += shard['rows']
+            stats['items'] += len(new_items)
+
+        if sessions is not None:
+            queue_sessions(sessions.finish())
+    except BaseException as e:
+        stats['error'] = e
+    finally:
+        items_queue.put(_DONE)
+        feedback_queue.put(_DONE)
+        if sink is not None:
+            sink.close()
+
+
+def run_pipeline(input_csv, base_url=upload_complete.BASE_URL, chunksize=50_000, workers=1,
+                 concurrency=8, items_batch_size=100, feedback_batch_size=500,
+                 queue_size=4, csv_dir=None, compact_window=None, verbose=0):
+    """Process events and upload them to Gorse in one pass, without intermediate CSV files"""
+    encoding = detect_encoding(input_csv)
+    if encoding is None:
+        print("Failed to load with any encoding")
+        return None
+
+    processor = RealEstateDataProcessor(input_csv, verbose=verbose, compact_window=compact_window)
+    # Bounded queues hold whole shards; a slow upload side blocks parsing instead of buffering
+    items_queue = queue.Queue(maxsize=queue_size)
+    feedback_queue = queue.Queue(maxsize=queue_size)
+    sink = CsvSink(csv_dir) if csv_dir else None
+    stats = {'rows': 0, 'items': 0, 'feedback': 0, 'error': None}
+
+    started = time.perf_counter()
+    producer = threading.Thread(
+        target=produce,
+        args=(processor, encoding, chunksize, workers, items_queue, feedback_queue, sink, stats),
+        daemon=True
+    )
+    producer.start()
+
+    items_uploader = BulkUploader(base_url, upload_complete.headers, batch_size=items_batch_size,
+                                  max_concurrency=concurrency)
+    feedback_uploader = BulkUploader(base_url, upload_complete.headers, batch_size=feedback_batch_size,
+                                     max_concurrency=concurrency)
+    results = {}
+    items_thread = threading.Thread(
+        target=upload_from_queue,
+        args=(items_uploader, 'items', items_queue, 'items', results),
+        daemon=True
+    )
+    items_thread.start()
+    upload_from_queue(feedback_uploader, 'feedback', feedback_queue, 'feedback entries', results)
+    items_thread.join()
+    producer.join()
+    elapsed = time.perf_counter() - started
+
+    for error in (stats['error'], results.get('items_error'), results.get('feedback_error')):
+        if error is not None:
+            raise error
+
+    processor.parser.report(verbose=verbose > 0)
+    print(f"\nProcessed {stats['rows']} events in {elapsed:.1f}s")
+    print(f"  Items uploaded: {results['items'].uploaded}/{stats['items']}")
+    print(f"  Feedback uploaded: {results['feedback'].uploaded}/{stats['feedback']}")
+    failed = len(results['items'].failed) + len(results['feedback'].failed)
+    if failed:
+        print(f"✗ {failed} batches still failing after retries")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process events and stream them straight into Gorse")
+    parser.add_argument('--input', default='realestate_data.csv', help="Event export CSV")
+    parser.add_argument('--base-url', default=upload_complete.BASE_URL, help="Gorse API root")
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    parser.add_argument('--workers', type=int, default=1, help="Processes used to parse shards")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum batches in flight per endpoint")
+    parser.add_argument('--items-batch-size', type=int, default=100)
+    parser.add_argument('--feedback-batch-size', type=int, default=500)
+    parser.add_argument('--csv-dir', default=None, help="Also write feedback/items/users CSV files here")
+    parser.add_argument('--compact-window', type=int, default=None, metavar='SECONDS',
+                        help="Merge repeated events of the same user, listing and type within this window")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="Print parse failure samples")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"❌ File not found: {args.input}")
+        return
+
+    run_pipeline(
+        args.input, base_url=args.base_url, chunksize=args.chunksize, workers=args.workers,
+        concurrency=args.concurrency, items_batch_size=args.items_batch_size,
+        feedback_batch_size=args.feedback_batch_size, csv_dir=args.csv_dir,
+        compact_window=args.compact_window, verbose=args.verbose
+    )
+
+
+if __name__ == "__main__":
+    main()
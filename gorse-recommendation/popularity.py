@@ -0,0 +1,259 @@
+import argparse
+import math
+import os
+import time
+import tomllib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from item_features import CATEGORIES, load_item_features
+from item_similarity import top_k
+from offline_recommender import comment_weight, comment_weights, load_feedback_frame, load_feedback_weights
+from recommend_client import parse_duration
+
+
+def load_popular_window(config_path='config.toml', default=7 * 24 * 3600.0):
+    """recommend.popular_window from the Gorse config, in seconds"""
+    try:
+        with open(config_path, 'rb') as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        return default
+    window = config.get('recommend', {}).get('popular_window')
+    return parse_duration(window) if window else default
+
+
+def event_time(timestamp):
+    """Unix seconds of a feedback Timestamp; anything unparseable counts as now"""
+    try:
+        return int(float(timestamp))
+    except (TypeError, ValueError):
+        return int(time.time())
+
+
+class RollingPopularity:
+    """Rolling-window popular and latest listings per region and category, served from memory
+
+    Feedback weights are summed into buckets of bucket_seconds by event
+    timestamp: the weight:x comment of a row (a compacted session's summed
+    weight), or the Gorse config's weight for its feedback type. Only types
+    the config knows are counted. A running total per listing is kept, and a
+    whole bucket is subtracted once it leaves the window, so an event costs
+    O(1). The window ends at the newest event or at `now` (the wall clock by
+    default) when reading, whichever is later, so a feed that went quiet
+    stops reporting old listings as popular. Top lists per (region, category)
+    segment are rebuilt from the totals with argpartition at most every
+    refresh_seconds when stale; reads are a slice of a prebuilt list.
+    region/category None means any.
+    """
+
+    def __init__(self, window=7 * 24 * 3600.0, bucket_seconds=3600, capacity=100, feedback_weights=None,
+                 refresh_seconds=1.0, clock=time.monotonic, wall_clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(1, math.ceil(window / bucket_seconds))
+        self.capacity = capacity
+        self.feedback_weights = feedback_weights if feedback_weights is not None else load_feedback_weights()
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.item_ids = np.empty(0, dtype=object)
+        self.index = {}
+        self.totals = np.zeros(0)
+        self.buckets = {}
+        self.current_bucket = None
+        self.segments = {}
+        self.latest_lists = {}
+        self.top_lists = {}
+        self.version = 0
+        self.counts = {'events': 0, 'unknown_items': 0, 'expired_buckets': 0}
+
+    @classmethod
+    def from_config(cls, config_path='config.toml', **options):
+        return cls(window=load_popular_window(config_path), feedback_weights=load_feedback_weights(config_path),
+                   **options)
+
+    def set_items(self, features):
+        """Index the catalog (ItemFeatures) and precompute latest lists per segment"""
+        self.item_ids = features.item_ids
+        self.index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.totals = np.zeros(len(features))
+        self.buckets = {}
+        self.current_bucket = None
+        self.version += 1
+
+        timestamps = features.timestamp
+
+        self.segments = {}
+        everything = np.ones(len(features), dtype=bool)
+        for region in [None] + sorted(map(str, features.vocabularies['region'])):
+            region_mask = everything if region is None else features.matches('region', region)
+            for category in [None] + CATEGORIES:
+                mask = region_mask if category is None else region_mask & features.has_category(category)
+                indices = np.flatnonzero(mask)
+                if len(indices):
+                    self.segments[(region, category)] = indices
+
+        self.latest_lists = {}
+        self.top_lists = {}
+        for key, indices in self.segments.items():
+            newest = indices[np.argsort(-timestamps[indices], kind='stable')[:self.capacity]]
+            self.latest_lists[key] = [
+                {'Id': self.item_ids[i], 'Score': float(timestamps[i])} for i in newest
+            ]
+        return self
+
+    def _advance(self, bucket):
+        """Move the window so it ends at bucket, subtracting the buckets that fall out"""
+        self.current_bucket = bucket
+        oldest = bucket - self.n_buckets + 1
+        for expired in [b for b in self.buckets if b < oldest]:
+            for i, weight in self.buckets.pop(expired).items():
+                self.totals[i] -= weight
+            self.counts['expired_buckets'] += 1
+        self.version += 1
+
+    def advance(self, now=None):
+        """End the window at now (unix seconds, default the wall clock) if that is past the newest event"""
+        bucket = int(self.wall_clock() if now is None else now) // self.bucket_seconds
+        if self.current_bucket is None or bucket > self.current_bucket:
+            self._advance(bucket)
+
+    def add(self, feedback_type, item_id, timestamp, weight=None):
+        """Count one feedback event (weight defaults to its type's); events older than the window are ignored"""
+        if feedback_type not in self.feedback_weights:
+            return
+        if weight is None:
+            weight = self.feedback_weights[feedback_type]
+        i = self.index.get(item_id)
+        if i is None:
+            self.counts['unknown_items'] += 1
+            return
+        bucket = event_time(timestamp) // self.bucket_seconds
+        if self.current_bucket is None or bucket > self.current_bucket:
+            self._advance(bucket)
+        elif bucket <= self.current_bucket - self.n_buckets:
+            return
+        self.buckets.setdefault(bucket, Counter())[i] += weight
+        self.totals[i] += weight
+        self.counts['events'] += 1
+        self.version += 1
+
+    def add_records(self, records):
+        """Count Gorse feedback records, e.g. as they arrive at the ingest daemon"""
+        for record in records:
+            self.add(record['FeedbackType'], record['ItemId'], record.get('Timestamp'),
+                     comment_weight(record.get('Comment')))
+
+    def add_frame(self, feedback):
+        """Count a feedback.csv-shaped frame in one vectorized pass"""
+        weights = feedback['feedback_type'].map(self.feedback_weights)
+        if 'comment' in feedback:
+            weights = comment_weights(feedback['comment']).where(weights.notna()).fillna(weights)
+        indices = feedback['item_id'].astype(str).map(self.index)
+        self.counts['unknown_items'] += int((weights.notna() & indices.isna()).sum())
+        valid = (weights.notna() & indices.notna()).to_numpy()
+        if not valid.any():
+            return
+        buckets = feedback['timestamp'].to_numpy(dtype=np.int64)[valid] // self.bucket_seconds
+        indices = indices.to_numpy()[valid].astype(np.int64)
+        weights = weights.to_numpy(dtype=np.float64)[valid]
+
+        newest = int(buckets.max())
+        if self.current_bucket is None or newest > self.current_bucket:
+            self._advance(newest)
+        recent = buckets > self.current_bucket - self.n_buckets
+        sums = pd.Series(weights[recent]).groupby([buckets[recent], indices[recent]]).sum()
+        for (bucket, i), weight in sums.items():
+            self.buckets.setdefault(bucket, Counter())[i] += weight
+        self.totals += np.bincount(indices[recent], weights=weights[recent], minlength=len(self.totals))
+        self.counts['events'] += int(recent.sum())
+        self.version += 1
+
+    def _top_list(self, key):
+        entry = self.top_lists.get(key)
+        if entry is not None:
+            version, built_at, ranked = entry
+            if version == self.version or self.clock() - built_at < self.refresh_seconds:
+                return ranked
+        indices = self.segments.get(key)
+        if indices is None:
+            return []
+        scores = self.totals[indices]
+        best = top_k(scores, self.capacity)
+        best = best[scores[best] > 1e-9]
+        ranked = [{'Id': self.item_ids[i], 'Score': round(float(self.totals[i]), 6)} for i in indices[best]]
+        self.top_lists[key] = (self.version, self.clock(), ranked)
+        return ranked
+
+    def popular(self, n=10, region=None, category=None, exclude=(), now=None):
+        """Top-n listings by windowed weight as [{"Id", "Score"}], skipping ids in exclude
+
+        The window ends at now (unix seconds, default the wall clock) or the newest event.
+        """
+        self.advance(now)
+        ranked = self._top_list((region or None, category or None))
+        if not exclude:
+            return ranked[:n]
+        return [entry for entry in ranked if entry['Id'] not in exclude][:n]
+
+    def latest(self, n=10, region=None, category=None):
+        """Newest n listings as [{"Id", "Score": timestamp}]"""
+        return self.latest_lists.get((region or None, category or None), [])[:n]
+
+    def recommend(self, user_id, n=10):
+        """Cold-start answer with the OfflineRecommender interface, usable as a RecommendClient fallback"""
+        return self.popular(n)
+
+    def stats(self):
+        return {**self.counts, 'items': len(self.item_ids), 'segments': len(self.segments),
+                'buckets': len(self.buckets)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-window popular and latest listings per region/category")
+    parser.add_argument('--items', default='items.csv', help="items.csv or a columnar store directory")
+    parser.add_argument('--feedback', default='feedback.csv', help="feedback.csv or a columnar store directory")
+    parser.add_argument('--config', default='config.toml')
+    parser.add_argument('--region', default=None)
+    parser.add_argument('--category', choices=CATEGORIES, default=None)
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--latest', action='store_true', help="Print the newest listings instead")
+    parser.add_argument('--now', type=float, default=None,
+                        help="Unix time the window ends at (default: the wall clock); pass the export's "
+                             "last timestamp to inspect historical feedback")
+    args = parser.parse_args()
+
+    for path in (args.items, args.feedback):
+        if not os.path.exists(path):
+            print(f"❌ File not found: {path}")
+            return
+
+    started = time.perf_counter()
+    popularity = RollingPopularity.from_config(args.config).set_items(load_item_features(args.items))
+    popularity.add_frame(load_feedback_frame(args.feedback))
+    print(f"✓ Indexed {len(popularity.item_ids)} listings in {len(popularity.segments)} segments and counted "
+          f"{popularity.counts['events']} events in {time.perf_counter() - started:.2f}s")
+
+    segment = ' / '.join(value for value in (args.region, args.category) if value) or 'all listings'
+    if args.latest:
+        print(f"\nNewest in {segment}:")
+        for i, entry in enumerate(popularity.latest(args.n, args.region, args.category)):
+            print(f"  {i+1}. Item ID: {entry['Id']}, Timestamp: {int(entry['Score'])}")
+    else:
+        print(f"\nMost popular in {segment} (last {popularity.n_buckets * popularity.bucket_seconds // 3600}h):")
+        popular = popularity.popular(args.n, args.region, args.category, now=args.now)
+        for i, entry in enumerate(popular):
+            print(f"  {i+1}. Item ID: {entry['Id']}, Score: {entry['Score']:.1f}")
+        if not popular and args.now is None:
+            print("  (no feedback in the window ending now; pass --now to end it at an older export's last event)")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        popularity.popular(args.n, args.region, args.category, now=args.now)
+    print(f"\nServed in {(time.perf_counter() - started) * 1000:.3f}µs per query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import io
+import sqlite3
+
+HEAD_HASH_BYTES = 64 * 1024
+QUERY_BATCH = 500
+
+
+def item_content_hash(item_row):
+    """Hash the Gorse-visible attributes of an item row"""
+    content = '\x1f'.join(str(item_row.get(key, '')) for key in ('labels', 'categories', 'comment'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def head_hash(path, length):
+    """Hash the first `length` bytes (capped at HEAD_HASH_BYTES) of a file"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(min(length, HEAD_HASH_BYTES))).hexdigest()
+
+
+def complete_lines_end(path, size, block_size=64 * 1024):
+    """Offset just past the last newline, so a half-written trailing row is left for the next run"""
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+class ByteRangeReader(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self._remaining]
+        count = self._file.readinto(view)
+        self._remaining -= count
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class PreprocessState:
+    """SQLite-backed watermark plus known item hashes and user ids for incremental runs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS watermark (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS items (item_id TEXT PRIMARY KEY, content_hash TEXT);
+            CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY);
+        """)
+
+    def get_watermark(self):
+        rows = self.conn.execute("SELECT key, value FROM watermark").fetchall()
+        return dict(rows)
+
+    def set_watermark(self, **values):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO watermark (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def _lookup(self, query, keys):
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), QUERY_BATCH):
+            batch = keys[i:i + QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self.conn.execute(query.format(placeholders), batch).fetchall())
+        return found
+
+    def item_hashes(self, item_ids):
+        return self._lookup("SELECT item_id, content_hash FROM items WHERE item_id IN ({})", item_ids)
+
+    def known_users(self, user_ids):
+        return set(self._lookup("SELECT user_id, 1 FROM users WHERE user_id IN ({})", user_ids))
+
+    def record_items(self, item_hashes):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO items (item_id, content_hash) VALUES (?, ?)",
+            item_hashes.items()
+        )
+
+    def record_users(self, user_ids):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+            ((user_id,) for user_id in user_ids)
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
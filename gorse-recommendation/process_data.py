@@ -1,149 +1,593 @@
 import pandas as pd
+import numpy as np
 import json
-import ast
 from datetime import datetime
 import os
 from pathlib import Path
 import traceback
+import codecs
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import io
+import time
+
+from columnar_store import ColumnarWriter
+from event_parser import EventPropertyParser
+from id_registry import FirstSeen, IdRegistry, decode_ids, factorize_ids, to_registry
+from item_features import FEATURES_FILE, ItemFeatures, PageViewCounter
+from metrics import METRICS, profiled
+from preprocess_state import (
+    ByteRangeReader, PreprocessState, complete_lines_end, head_hash, item_content_hash
+)
+
+EXTRACTED_PROPERTIES = [
+    'pageType', 'rent_price', 'sale_price',
+    'estate_name', 'region_name', 'house_address'
+]
+
+ENCODINGS = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+
+FEEDBACK_COLUMNS = ['feedback_type', 'user_id', 'item_id', 'timestamp', 'comment']
+
+ITEM_COLUMNS = ['item_id', 'timestamp', 'labels', 'categories', 'comment']
+
+# Extracted columns the typed item feature table is built from
+ITEM_PROPERTY_COLUMNS = [
+    'house_id', 'timestamp', 'rent_price', 'sale_price', 'estate_name', 'region_name', 'house_address'
+]
+
+FEEDBACK_WEIGHTS = {
+    'view_listing': 1.0,
+    'contact_agent': 3.0
+}
+
+
+def detect_encoding(path, sample_size=1 << 20):
+    """Pick the first encoding that decodes a sample from the head of the file"""
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+
+    for encoding in ENCODINGS:
+        try:
+            # final=False tolerates a multi-byte character cut at the sample boundary
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def to_unix_seconds(created_at):
+    """Convert a datetime column to integer unix seconds, 0 for missing values"""
+    if not pd.api.types.is_datetime64_any_dtype(created_at):
+        # Mixed timezones leave an object column; fall back to per-value conversion
+        return created_at.apply(lambda x: int(x.timestamp()) if pd.notnull(x) else 0)
+
+    if created_at.dt.tz is not None:
+        created_at = created_at.dt.tz_convert(None)
+
+    seconds = created_at.to_numpy().astype('datetime64[s]').astype('int64')
+    seconds[created_at.isna().to_numpy()] = 0
+    return pd.Series(seconds, index=created_at.index)
+
+
+def parse_events(df, parser):
+    """Add the event_property_parsed column, returning how many rows failed to parse"""
+    df['event_property_parsed'] = parser.parse_series(df['event_property'])
+    return sum(1 for parsed in df['event_property_parsed'] if parsed is None)
+
+
+def extract_properties(df):
+    """Add house_id, property and timestamp columns from event_property_parsed"""
+    # Build every property column in a single pass over the parsed dicts
+    # instead of writing cell by cell with df.at
+    properties_to_extract = ['house_id'] + EXTRACTED_PROPERTIES
+    columns = [[] for _ in properties_to_extract]
+    appenders = [column.append for column in columns]
+
+    for parsed in df['event_property_parsed']:
+        if isinstance(parsed, dict):
+            get = parsed.get
+            for append, prop in zip(appenders, properties_to_extract):
+                append(get(prop))
+        else:
+            for append in appenders:
+                append(None)
+
+    for prop, values in zip(properties_to_extract, columns):
+        df[prop] = pd.Series(values, index=df.index, dtype=object)
+
+    df['rent_price'] = pd.to_numeric(df['rent_price'], errors='coerce')
+    df['sale_price'] = pd.to_numeric(df['sale_price'], errors='coerce')
+
+    try:
+        df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
+        df['timestamp'] = to_unix_seconds(df['created_at'])
+    except Exception as e:
+        print(f"Warning: Could not parse timestamps: {e}")
+        df['timestamp'] = 0
+
+    return df
+
+
+def compact_feedback(feedback, window):
+    """Collapse repeated (user, item, feedback_type) events into sessions
+
+    Events of the same key whose gap to the previous one is at most `window`
+    seconds form one session. Each session becomes a single row with the
+    latest timestamp, the summed 'weight' column and the earliest
+    'first_timestamp'; rows are ordered by the input 'position' of their
+    latest event. Rows that are already sessions (first_timestamp up to
+    timestamp) merge exactly like their events would, so compacting shards
+    and then their concatenation gives the rows of one pass over all events.
+    Sort-based, no Python-level loop over rows.
+    """
+    timestamps = feedback['timestamp'].to_numpy(dtype=np.int64)
+    firsts = feedback['first_timestamp'].to_numpy(dtype=np.int64) if 'first_timestamp' in feedback else timestamps
+    positions = feedback['position'].to_numpy() if 'position' in feedback else np.arange(len(feedback))
+    feedback = feedback.assign(first_timestamp=firsts, position=positions)
+    if len(feedback) < 2:
+        return feedback.reset_index(drop=True)
+
+    keys = [
+        feedback['user_code'].to_numpy(), feedback['item_code'].to_numpy(), pd.factorize(feedback['feedback_type'])[0]
+    ]
+    # lexsort is stable, so events with equal timestamps keep their input order
+    order = np.lexsort((firsts, keys[2], keys[1], keys[0]))
+
+    same_key = np.ones(len(order) - 1, dtype=bool)
+    for codes in keys:
+        sorted_codes = codes[order]
+        same_key &= sorted_codes[1:] == sorted_codes[:-1]
+    # Latest timestamp reached so far within each key; a row starting more than
+    # `window` after it opens a new session
+    key_ids = np.concatenate(([0], np.cumsum(~same_key)))
+    reach = pd.Series(timestamps[order]).groupby(key_ids).cummax().to_numpy()
+    continues = same_key & (firsts[order][1:] - reach[:-1] <= window)
+    session_ids = np.concatenate(([0], np.cumsum(~continues)))
+
+    weights = np.bincount(session_ids, weights=feedback['weight'].to_numpy(dtype=np.float64)[order])
+    session_firsts = firsts[order][np.concatenate(([True], ~continues))]
+    # A session's row is its latest event, the later one in the input on equal timestamps
+    by_latest = np.lexsort((positions[order], timestamps[order], session_ids))
+    ends = np.append(session_ids[by_latest][1:] != session_ids[by_latest][:-1], True)
+    latest = order[by_latest[ends]]
+    keep = np.argsort(positions[latest], kind='stable')
+    compacted = feedback.iloc[latest[keep]].reset_index(drop=True)
+    compacted['weight'] = weights[keep]
+    compacted['first_timestamp'] = session_firsts[keep]
+    return compacted
+
+
+class FeedbackSessions:
+    """Compacted feedback of every shard, merged across shard boundaries as shards arrive
+
+    A session can continue in a later shard, so shards hand over their coded,
+    locally compacted rows (with registry codes) and add() compacts them with
+    the sessions still open. A session whose last event is more than window
+    seconds older than the newest event seen is settled; add() returns the
+    settled rows that precede every open one in input order, and only the
+    rest stays in memory until finish(). For an export in time order, as the
+    events export is, the rows match a serial run over the whole input
+    whatever the chunk size. An event older than a returned session's reach
+    plus the window (late_events) may start a session of its own instead.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.open = None
+        self.newest = None
+        self.flushed_reach = None
+        self.rows = 0
+        self.late_events = 0
+
+    def add(self, feedback):
+        """Merge one shard's compacted rows; returns the rows that are settled"""
+        self.rows += len(feedback)
+        if not len(feedback):
+            return feedback.iloc[:0]
+        if self.flushed_reach is not None:
+            firsts = feedback['first_timestamp'].to_numpy()
+            self.late_events += int((firsts - self.window <= self.flushed_reach).sum())
+        merged = compact_feedback(pd.concat([self.open, feedback], ignore_index=True), self.window)
+        timestamps = merged['timestamp'].to_numpy()
+        self.newest = int(timestamps.max()) if self.newest is None else max(self.newest, int(timestamps.max()))
+        # Rows are ordered by input position, so only a prefix can go out
+        open_rows = np.flatnonzero(self.newest - timestamps <= self.window)
+        settled = open_rows[0] if len(open_rows) else len(merged)
+        self.open = merged.iloc[settled:]
+        if settled:
+            reach = int(timestamps[:settled].max())
+            self.flushed_reach = reach if self.flushed_reach is None else max(self.flushed_reach, reach)
+        return merged.iloc[:settled]
+
+    def finish(self):
+        """The rows of the sessions still open"""
+        if self.open is None:
+            return pd.DataFrame(columns=['feedback_type', 'user_code', 'item_code', 'timestamp', 'weight'])
+        feedback = self.open.reset_index(drop=True)
+        self.open = None
+        return feedback
+
+
+def build_feedback_frame(df, compact_window=None):
+    """Turn events with an item_code into feedback rows keyed on the interned user/item codes
+
+    The ids stay int32 codes (user_code/item_code) next to the float 'weight';
+    decode_feedback turns them into Gorse feedback rows at the output boundary.
+    With compact_window (seconds), repeated events are merged by compact_feedback.
+    """
+    valid_rows = df[df['item_code'].to_numpy() >= 0]
+    weights = valid_rows['event_name'].map(FEEDBACK_WEIGHTS).fillna(1.0)
+
+    feedback = pd.DataFrame({
+        'feedback_type': valid_rows['event_name'].to_numpy(),
+        'user_code': valid_rows['user_code'].to_numpy(),
+        'item_code': valid_rows['item_code'].to_numpy(),
+        'timestamp': valid_rows['timestamp'].astype('int64').to_numpy(),
+        'weight': weights.to_numpy(dtype=np.float64)
+    })
+    if compact_window is not None:
+        # Input row of each event; orders sessions that are merged again across shards
+        feedback['position'] = valid_rows.index.to_numpy()
+        feedback = compact_feedback(feedback, compact_window)
+    return feedback
+
+
+def weight_comments(weights):
+    return 'weight:' + weights.astype(str)
+
+
+def decode_feedback(feedback, user_ids, item_ids):
+    """FEEDBACK_COLUMNS rows for coded feedback; user_ids/item_ids are the strings the codes index"""
+    return pd.DataFrame({
+        'feedback_type': feedback['feedback_type'].to_numpy(),
+        'user_id': decode_ids(user_ids, feedback['user_code']),
+        'item_id': decode_ids(item_ids, feedback['item_code']),
+        'timestamp': feedback['timestamp'].to_numpy(),
+        'comment': weight_comments(feedback['weight']).to_numpy()
+    })
+
+
+def first_item_rows(df):
+    """First row of each listing, found on the int32 item codes instead of hashing id strings"""
+    item_codes = df['item_code'].to_numpy()
+    valid = np.flatnonzero(item_codes >= 0)
+    _, first = np.unique(item_codes[valid], return_index=True)
+    return df.iloc[valid[np.sort(first)]]
+
+
+def build_item_rows(unique_properties, as_records=False):
+    """Turn one event per house_id into items.csv rows, or Gorse API records if as_records"""
+    item_data = []
+
+    columns = zip(
+        unique_properties['house_id'], unique_properties['timestamp'],
+        unique_properties['rent_price'], unique_properties['sale_price'],
+        unique_properties['estate_name'], unique_properties['region_name']
+    )
+    for house_id, timestamp, rent_price, sale_price, estate_name, region_name in columns:
+        listing_type = []
+        numerical_features = {}
+        if pd.notna(rent_price) and rent_price > 0:
+            listing_type.append('rental')
+            numerical_features['rent_price'] = float(rent_price)
+        if pd.notna(sale_price) and sale_price > 0:
+            listing_type.append('sale')
+            numerical_features['sale_price'] = float(sale_price)
+
+        labels = []
+        if pd.notna(estate_name):
+            labels.append(f"estate:{estate_name}")
+        if pd.notna(region_name):
+            labels.append(f"region:{region_name}")
+
+        if as_records:
+            item_data.append({
+                'ItemId': str(house_id),
+                'Timestamp': str(int(timestamp)),
+                'Labels': labels,
+                'Categories': listing_type,
+                'Comment': json.dumps(numerical_features, ensure_ascii=False)
+            })
+            continue
+
+        item_data.append({
+            'item_id': str(house_id),
+            'timestamp': int(timestamp),
+            'labels': '|'.join(labels) if labels else '',
+            'categories': '|'.join(listing_type) if listing_type else '',
+            'comment': json.dumps(numerical_features, ensure_ascii=False)
+        })
+
+    return item_data
+
+
+def build_feedback_records(feedback):
+    """Turn feedback rows into Gorse API records"""
+    columns = zip(
+        feedback['feedback_type'].fillna(''), feedback['user_id'], feedback['item_id'],
+        feedback['timestamp'], feedback['comment']
+    )
+    return [
+        {
+            'FeedbackType': feedback_type,
+            'UserId': user_id,
+            'ItemId': item_id,
+            'Timestamp': str(timestamp),
+            'Comment': comment
+        }
+        for feedback_type, user_id, item_id, timestamp, comment in columns
+    ]
+
+
+def build_user_frame(user_ids):
+    """Turn unique user ids into Gorse user rows"""
+    return pd.DataFrame({
+        'user_id': [str(user_id) for user_id in user_ids],
+        'labels': '',
+        'comment': ''
+    })
+
+
+def process_shard(chunk, parser, min_timestamp=None, with_records=False, with_frame=False, compact_window=None):
+    """Parse, extract and build Gorse rows for one chunk of events
+
+    Returns plain, cheaply picklable values so shards can run in worker processes;
+    feedback rows come back already serialized as CSV text without a header.
+    When min_timestamp is set, only events strictly newer than it are kept.
+    With with_records, Gorse API records for feedback and items are included too;
+    with_frame adds the coded feedback DataFrame itself (for the columnar writer).
+    compact_window merges repeated events within the shard (see compact_feedback);
+    sessions may continue in a later shard, so the coded rows then come back in
+    'feedback_frame' only, to be merged by FeedbackSessions before serializing.
+    User and house ids are factorized into shard-local codes: 'user_ids' and
+    'item_ids' hold the distinct strings they index, and register_shard maps
+    them onto the IdRegistry's codes. 'item_codes'/'item_rows' describe the
+    first event of each listing, 'item_properties' their typed-feature
+    columns and 'page_views' the shard's event counts per (item code, pageType).
+    Per-stage seconds come back in 'timings' since workers cannot reach METRICS.
+    """
+    timings = {}
+    started = time.perf_counter()
+    parse_errors = parse_events(chunk, parser)
+    timings['parse_events'] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    extract_properties(chunk)
+    timings['extract_properties'] = time.perf_counter() - started
+    rows = len(chunk)
+    if min_timestamp is not None:
+        chunk = chunk[chunk['timestamp'] > min_timestamp].copy()
+
+    started = time.perf_counter()
+    chunk['user_code'], user_ids = factorize_ids(chunk['user_id'])
+    chunk['item_code'], item_ids = factorize_ids(chunk['house_id'])
+    timings['intern_ids'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    feedback = build_feedback_frame(chunk, compact_window)
+    candidates = first_item_rows(chunk)
+    item_rows = build_item_rows(candidates)
+    page_views = chunk.groupby(['item_code', 'pageType']).size()
+    timings['build_rows'] = time.perf_counter() - started
+
+    output = feedback_csv = None
+    if compact_window is None:
+        started = time.perf_counter()
+        output = decode_feedback(feedback, user_ids, item_ids)
+        feedback_csv = output.to_csv(header=False, index=False)
+        timings['serialize_csv'] = time.perf_counter() - started
+
+    result = {
+        'rows': rows,
+        'parse_errors': parse_errors,
+        'max_timestamp': int(chunk['timestamp'].max()) if len(chunk) else 0,
+        'feedback_csv': feedback_csv,
+        'feedback_count': len(feedback),
+        'feedback_events': int((chunk['item_code'].to_numpy() >= 0).sum()),
+        'feedback_head': output.head(10) if output is not None else None,
+        'feedback_types': feedback['feedback_type'].value_counts().to_dict(),
+        'user_ids': user_ids,
+        'item_ids': item_ids,
+        'item_codes': candidates['item_code'].to_numpy(),
+        'item_rows': item_rows,
+        'item_properties': candidates[ITEM_PROPERTY_COLUMNS].reset_index(drop=True),
+        'page_views': (
+            page_views.index.get_level_values('item_code').to_numpy(),
+            page_views.index.get_level_values('pageType').to_numpy(), page_views.to_numpy()
+        ),
+        'timings': timings,
+    }
+    if with_records:
+        started = time.perf_counter()
+        result['feedback_records'] = build_feedback_records(output) if output is not None else None
+        result['item_records'] = build_item_rows(candidates, as_records=True)
+        timings['build_records'] = time.perf_counter() - started
+    if with_frame or compact_window is not None:
+        result['feedback_frame'] = feedback
+    return result
+
+
+def register_shard(result, ids):
+    """Swap a shard's local user/item codes for IdRegistry codes, in place
+
+    Each distinct id of the shard is looked up once; the per-row arrays are
+    then translated with integer indexing. Adds 'user_codes', the registry
+    codes of the shard's users.
+    """
+    user_map = ids.users.encode(result['user_ids'], 'int32')
+    item_map = ids.items.encode(result['item_ids'], 'int32')
+    result['user_codes'] = user_map
+    result['item_codes'] = to_registry(item_map, result['item_codes'])
+    item_codes, page_types, counts = result['page_views']
+    result['page_views'] = (to_registry(item_map, item_codes), page_types, counts)
+    feedback = result.get('feedback_frame')
+    if feedback is not None:
+        feedback['user_code'] = to_registry(user_map, feedback['user_code'].to_numpy())
+        feedback['item_code'] = to_registry(item_map, feedback['item_code'].to_numpy())
+    return result
+
+
+def append_feedback(writer, feedback):
+    """Append coded feedback rows to a ColumnarWriter seeded with the IdRegistry's dictionaries"""
+    writer.append('feedback', feedback.assign(comment=weight_comments(feedback['weight'])), codes={
+        'user_id': feedback['user_code'].to_numpy(), 'item_id': feedback['item_code'].to_numpy()
+    })
+
+
+def record_shard_metrics(result):
+    """Fold one shard's counts and stage timings into METRICS"""
+    for stage, seconds in result['timings'].items():
+        METRICS.observe('stage_seconds', seconds, stage=stage)
+    METRICS.count('rows_read_total', result['rows'])
+    METRICS.count('feedback_rows_total', result['feedback_count'])
+    METRICS.count('feedback_events_compacted_total', result['feedback_events'] - result['feedback_count'])
+    METRICS.emit('shard', rows=result['rows'], feedback=result['feedback_count'],
+                 **{stage: round(seconds, 6) for stage, seconds in result['timings'].items()})
+
+
+def record_parse_metrics(parser):
+    for kind in ('unparseable', 'error'):
+        if parser.stats[kind]:
+            METRICS.count('parse_failures_total', parser.stats[kind], kind=kind)
+
+
+_worker_parser = None
+
+
+def _process_shard_in_worker(chunk, min_timestamp=None, with_records=False, with_frame=False,
+                             compact_window=None):
+    # Each worker keeps its own parser so the payload memo survives across shards
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = EventPropertyParser()
+    _worker_parser.stats.clear()
+    _worker_parser.failure_samples.clear()
+
+    result = process_shard(chunk, _worker_parser, min_timestamp, with_records, with_frame, compact_window)
+    result['parser_stats'] = dict(_worker_parser.stats)
+    result['failure_samples'] = list(_worker_parser.failure_samples)
+    return result
+
+
+def map_in_order(executor, fn, iterable, max_pending):
+    """Like executor.map, but reads the input lazily with at most max_pending shards in flight"""
+    pending = deque()
+    for value in iterable:
+        pending.append(executor.submit(fn, value))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 
 class RealEstateDataProcessor:
-    def __init__(self, input_csv_path):
+    def __init__(self, input_csv_path, verbose=0, compact_window=None, ids=None):
         self.input_csv_path = input_csv_path
+        # User and house ids are interned to int32 codes; strings only come back for output
+        self.ids = ids if ids is not None else IdRegistry()
+        self.verbose = verbose
+        self.compact_window = compact_window
         self.df = None
+        self.feedback_frame = None
         self.feedback_df = None
         self.items_df = None
         self.users_df = None
+        self.feedback_count = 0
+        self.feedback_head = None
+        self.columnar = None
+        self.item_features = None
+        self.parser = EventPropertyParser()
         
     def safe_json_parse(self, json_str):
-        if pd.isna(json_str):
-            return None
-            
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-            
-        try:
-            return ast.literal_eval(json_str)
-        except (ValueError, SyntaxError):
-            pass
-            
-        try:
-            cleaned = json_str.replace('\\"', '"').replace('"{', '{').replace('}"', '}')
-            return json.loads(cleaned)
-        except:
-            pass
-            
-        print(f"Warning: Could not parse JSON: {json_str[:100]}...")
-        return None
+        return self.parser.parse(json_str)
     
     def load_data(self):
         print(f"Loading data from {self.input_csv_path}...")
         
-        try:
-            with open(self.input_csv_path, 'r') as f:
-                first_lines = [next(f) for _ in range(3)]
-            print("First few lines of CSV:")
-            for i, line in enumerate(first_lines):
-                print(f"Line {i}: {line[:200]}...")
-        except Exception as e:
-            print(f"Could not preview file: {e}")
+        if self.verbose:
+            try:
+                with open(self.input_csv_path, 'r') as f:
+                    first_lines = [next(f) for _ in range(3)]
+                print("First few lines of CSV:")
+                for i, line in enumerate(first_lines):
+                    print(f"Line {i}: {line[:200]}...")
+            except Exception as e:
+                print(f"Could not preview file: {e}")
+        
+        with METRICS.span('detect_encoding'):
+            encoding = detect_encoding(self.input_csv_path)
+        if encoding is None:
+            print("Failed to load with any encoding")
+            return False
+        print(f"Detected encoding: {encoding}")
         
         try:
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings:
+            with METRICS.span('read_csv'):
                 try:
-                    print(f"Trying encoding: {encoding}")
                     self.df = pd.read_csv(self.input_csv_path, encoding=encoding)
-                    print(f"Successfully loaded with {encoding} encoding")
-                    print(f"Columns: {list(self.df.columns)}")
-                    print(f"First row sample:")
-                    print(self.df.iloc[0].to_dict())
-                    break
                 except UnicodeDecodeError:
-                    continue
-            else:
-                print("Failed to load with any encoding")
-                return False
+                    # The sample decoded but a later byte did not; latin-1 accepts any byte
+                    print(f"Encoding {encoding} failed past the sample, falling back to latin-1")
+                    METRICS.count('encoding_retries_total', encoding=encoding)
+                    self.df = pd.read_csv(self.input_csv_path, encoding='latin-1')
+            METRICS.count('rows_read_total', len(self.df))
+            METRICS.count('bytes_read_total', os.path.getsize(self.input_csv_path))
+            if self.verbose:
+                print(f"Columns: {list(self.df.columns)}")
+                print(f"First row sample:")
+                print(self.df.iloc[0].to_dict())
                 
         except Exception as e:
             print(f"Error loading CSV: {e}")
             return False
         
         print("\nParsing event_property column...")
-        parse_errors = 0
-        
-        def parse_row(value):
-            nonlocal parse_errors
-            try:
-                result = self.safe_json_parse(value)
-                if result is None:
-                    parse_errors += 1
-                return result
-            except Exception as e:
-                parse_errors += 1
-                print(f"Parse error for value: {value[:50] if value else 'None'}... Error: {e}")
-                return None
-        
-        self.df['event_property_parsed'] = self.df['event_property'].apply(parse_row)
+        with METRICS.span('parse_events'):
+            parse_errors = parse_events(self.df, self.parser)
+        self.parser.report(verbose=self.verbose > 0)
+        record_parse_metrics(self.parser)
         
         if parse_errors > 0:
             print(f"Warning: {parse_errors} rows could not be parsed")
         
         self._extract_properties()
         
+        with METRICS.span('intern_ids'):
+            self.df['user_code'] = self.ids.intern_users(self.df['user_id'])
+            self.df['item_code'] = self.ids.intern_items(self.df['house_id'])
+        
         print(f"\nLoaded {len(self.df)} rows of data")
-        print(f"Unique users: {self.df['user_id'].nunique()}")
-        print(f"Unique properties found: {self.df['house_id'].nunique()}")
+        print(f"Unique users: {len(self._unique_codes('user_code'))}")
+        print(f"Unique properties found: {len(self._unique_codes('item_code'))}")
         
-        print("\nSample parsed data:")
-        for i in range(min(3, len(self.df))):
-            row = self.df.iloc[i]
-            print(f"Row {i}: User={row['user_id']}, Event={row['event_name']}, Property={row.get('house_id', 'N/A')}")
+        if self.verbose:
+            print("\nSample parsed data:")
+            for i in range(min(3, len(self.df))):
+                row = self.df.iloc[i]
+                print(f"Row {i}: User={row['user_id']}, Event={row['event_name']}, Property={row.get('house_id', 'N/A')}")
         
         return True
     
     def _extract_properties(self):
         print("\nExtracting properties...")
         
-        self.df['house_id'] = None
-        properties_to_extract = [
-            'pageType', 'rent_price', 'sale_price', 
-            'estate_name', 'region_name', 'house_address'
-        ]
-        
-        for prop in properties_to_extract:
-            self.df[prop] = None
-        
-        for idx, row in self.df.iterrows():
-            parsed = row['event_property_parsed']
-            
-            if isinstance(parsed, dict):
-                self.df.at[idx, 'house_id'] = parsed.get('house_id')
-                
-                for prop in properties_to_extract:
-                    self.df.at[idx, prop] = parsed.get(prop)
-        
-        print("Cleaning data types...")
-        
-        self.df['rent_price'] = pd.to_numeric(self.df['rent_price'], errors='coerce')
-        self.df['sale_price'] = pd.to_numeric(self.df['sale_price'], errors='coerce')
-        
-        try:
-            self.df['created_at'] = pd.to_datetime(self.df['created_at'], errors='coerce')
-            self.df['timestamp'] = self.df['created_at'].apply(
-                lambda x: int(x.timestamp()) if pd.notnull(x) else 0
-            )
-        except Exception as e:
-            print(f"Warning: Could not parse timestamps: {e}")
-            self.df['timestamp'] = 0
+        with METRICS.span('extract_properties'):
+            extract_properties(self.df)
         
         print(f"\nExtraction Summary:")
         print(f"  Valid house_id entries: {self.df['house_id'].notna().sum()}")
         print(f"  Properties with rent_price: {self.df['rent_price'].notna().sum()}")
         print(f"  Properties with sale_price: {self.df['sale_price'].notna().sum()}")
     
+    def _unique_codes(self, column):
+        """Distinct non-missing codes of an interned column, in first-seen order"""
+        codes = self.df[column].to_numpy()
+        return pd.unique(codes[codes >= 0])
+    
     def create_feedback_data(self, output_path='feedback.csv'):
         print("\nCreating feedback data...")
         
@@ -151,33 +595,26 @@ class RealEstateDataProcessor:
             print("Error: No house_id data found")
             return None
         
-        valid_rows = self.df[self.df['house_id'].notna()].copy()
+        valid_rows = self.df[self.df['item_code'].to_numpy() >= 0]
         
         if len(valid_rows) == 0:
             print("Error: No valid rows with house_id")
             return None
         
-        feedback_data = []
-        feedback_weights = {
-            'view_listing': 1.0,
-            'contact_agent': 3.0
-        }
-        
-        for _, row in valid_rows.iterrows():
-            feedback_entry = {
-                'feedback_type': row['event_name'],
-                'user_id': str(row['user_id']),
-                'item_id': str(row['house_id']),
-                'timestamp': int(row.get('timestamp', 0)),
-                'comment': f"weight:{feedback_weights.get(row['event_name'], 1.0)}"
-            }
-            feedback_data.append(feedback_entry)
+        with METRICS.span('build_rows', table='feedback'):
+            self.feedback_frame = build_feedback_frame(valid_rows, self.compact_window)
+            self.feedback_df = decode_feedback(self.feedback_frame, self.ids.users.values, self.ids.items.values)
+        self.feedback_count = len(self.feedback_df)
+        METRICS.count('feedback_events_compacted_total', len(valid_rows) - self.feedback_count)
+        self.feedback_head = self.feedback_df.head(10)
         
-        self.feedback_df = pd.DataFrame(feedback_data)
-        
-        self.feedback_df.to_csv(output_path, index=False)
+        with METRICS.span('write_csv', table='feedback'):
+            self.feedback_df.to_csv(output_path, index=False)
+        METRICS.count('rows_written_total', len(self.feedback_df), table='feedback')
         print(f"✓ Feedback data saved to {output_path}")
         print(f"  Total entries: {len(self.feedback_df)}")
+        if self.compact_window is not None:
+            print(f"  Compacted from {len(valid_rows)} events ({self.compact_window}s window)")
         print(f"  Feedback types:")
         for feedback_type, count in self.feedback_df['feedback_type'].value_counts().items():
             print(f"    - {feedback_type}: {count}")
@@ -191,73 +628,330 @@ class RealEstateDataProcessor:
             print("Error: house_id column not found")
             return None
         
-        unique_properties = self.df.dropna(subset=['house_id']).drop_duplicates('house_id')
+        unique_properties = first_item_rows(self.df)
         
         if len(unique_properties) == 0:
             print("Error: No unique properties found")
             return None
         
-        item_data = []
+        with METRICS.span('build_rows', table='items'):
+            item_data = build_item_rows(unique_properties)
+            self.items_df = pd.DataFrame(item_data)
         
-        for _, row in unique_properties.iterrows():
-            listing_type = []
-            if pd.notna(row['rent_price']) and row['rent_price'] > 0:
-                listing_type.append('rental')
-            if pd.notna(row['sale_price']) and row['sale_price'] > 0:
-                listing_type.append('sale')
-            
-            labels = []
-            if pd.notna(row['estate_name']):
-                labels.append(f"estate:{row['estate_name']}")
-            if pd.notna(row['region_name']):
-                labels.append(f"region:{row['region_name']}")
-            
-            numerical_features = {}
-            if pd.notna(row['rent_price']) and row['rent_price'] > 0:
-                numerical_features['rent_price'] = float(row['rent_price'])
-            if pd.notna(row['sale_price']) and row['sale_price'] > 0:
-                numerical_features['sale_price'] = float(row['sale_price'])
-            
-            item_entry = {
-                'item_id': str(row['house_id']),
-                'timestamp': int(row.get('timestamp', 0)),
-                'labels': '|'.join(labels) if labels else '',
-                'categories': '|'.join(listing_type) if listing_type else '',
-                'comment': json.dumps(numerical_features, ensure_ascii=False)
-            }
-            item_data.append(item_entry)
-        
-        self.items_df = pd.DataFrame(item_data)
-        
-        self.items_df.to_csv(output_path, index=False)
+        with METRICS.span('write_csv', table='items'):
+            self.items_df.to_csv(output_path, index=False)
+        METRICS.count('rows_written_total', len(self.items_df), table='items')
         print(f"✓ Item data saved to {output_path}")
         print(f"  Total unique properties: {len(self.items_df)}")
         print(f"  Properties with labels: {self.items_df['labels'].ne('').sum()}")
         
+        page_views = PageViewCounter()
+        page_views.add(self.df['item_code'].to_numpy(), self.df['pageType'])
+        self.write_item_features(
+            unique_properties[ITEM_PROPERTY_COLUMNS], page_views, unique_properties['item_code'].to_numpy(),
+            os.path.join(os.path.dirname(output_path), FEATURES_FILE)
+        )
+        
         return output_path
     
+    def write_item_features(self, properties, page_views, item_codes, path):
+        """Save the typed item feature table, row-aligned with items.csv"""
+        with METRICS.span('write_item_features'):
+            self.item_features = ItemFeatures.from_properties(properties, page_views, item_codes)
+            self.item_features.save(path)
+        print(f"✓ Item features saved to {path}")
+        return path
+    
     def create_user_data(self, output_path='users.csv'):
         print("\nCreating user data...")
         
-        unique_users = self.df['user_id'].dropna().unique()
+        unique_users = self.ids.users.decode(self._unique_codes('user_code'))
         
-        user_data = []
-        for user_id in unique_users:
-            user_entry = {
-                'user_id': str(user_id),
-                'labels': '',
-                'comment': ''
-            }
-            user_data.append(user_entry)
+        self.users_df = build_user_frame(unique_users)
         
-        self.users_df = pd.DataFrame(user_data)
-        
-        self.users_df.to_csv(output_path, index=False)
+        with METRICS.span('write_csv', table='users'):
+            self.users_df.to_csv(output_path, index=False)
+        METRICS.count('rows_written_total', len(self.users_df), table='users')
         print(f"✓ User data saved to {output_path}")
         print(f"  Total unique users: {len(self.users_df)}")
         
         return output_path
     
+    def process_in_chunks(self, output_dir, chunksize=100_000, workers=1, columnar_dir=None):
+        print(f"Streaming data from {self.input_csv_path} in chunks of {chunksize} rows...")
+        
+        feedback_path = os.path.join(output_dir, 'feedback.csv')
+        # Feedback shards are appended to the columnar copy as they stream past
+        self.columnar = ColumnarWriter(columnar_dir, self.ids.dictionaries) if columnar_dir else None
+        if not self._stream(feedback_path, chunksize, workers):
+            return False
+        
+        if self.feedback_count == 0:
+            print("Error: No valid rows with house_id")
+            return False
+        
+        items_path = os.path.join(output_dir, 'items.csv')
+        self.items_df = pd.DataFrame(self.seen_items)
+        with METRICS.span('write_csv', table='items'):
+            self.items_df.to_csv(items_path, index=False)
+        METRICS.count('rows_written_total', len(self.items_df), table='items')
+        print(f"✓ Item data saved to {items_path}")
+        print(f"  Total unique properties: {len(self.items_df)}")
+        self.write_item_features(
+            pd.concat(self.seen_item_properties, ignore_index=True), self.page_views,
+            self.seen_item_codes, os.path.join(output_dir, FEATURES_FILE)
+        )
+        
+        users_path = os.path.join(output_dir, 'users.csv')
+        self.users_df = build_user_frame(self.seen_users)
+        with METRICS.span('write_csv', table='users'):
+            self.users_df.to_csv(users_path, index=False)
+        METRICS.count('rows_written_total', len(self.users_df), table='users')
+        print(f"✓ User data saved to {users_path}")
+        print(f"  Total unique users: {len(self.users_df)}")
+        
+        if self.columnar is not None:
+            self.columnar.append('items', self.items_df)
+            self.columnar.append('users', self.users_df)
+            self.columnar.close()
+            print(f"✓ Columnar copy saved to {self.columnar.directory}")
+        
+        return True
+    
+    def write_columnar(self, directory):
+        """Write the in-memory feedback/items/users frames as a memory-mappable columnar store"""
+        with METRICS.span('write_columnar'):
+            writer = ColumnarWriter(directory, self.ids.dictionaries)
+            append_feedback(writer, self.feedback_frame)
+            writer.append('items', self.items_df)
+            writer.append('users', self.users_df)
+            writer.close()
+        print(f"✓ Columnar copy saved to {directory}")
+        return directory
+    
+    def process_incremental(self, output_dir, state_path, chunksize=100_000, workers=1):
+        state = PreprocessState(state_path)
+        try:
+            return self._process_incremental(state, output_dir, chunksize, workers)
+        finally:
+            state.close()
+    
+    def _process_incremental(self, state, output_dir, chunksize, workers):
+        watermark = state.get_watermark()
+        offset = int(watermark.get('byte_offset', 0))
+        max_timestamp = int(watermark.get('max_timestamp', 0))
+        end = complete_lines_end(self.input_csv_path, os.path.getsize(self.input_csv_path))
+        
+        min_timestamp = None
+        if offset and offset <= end and watermark.get('head_hash') == head_hash(self.input_csv_path, offset):
+            print(f"Input is unchanged up to byte {offset}; processing bytes {offset}-{end}")
+        elif offset:
+            print(f"Input was rewritten since the last run; keeping events after {max_timestamp}")
+            offset = 0
+            min_timestamp = max_timestamp
+        else:
+            print("No watermark yet; processing the full input")
+        
+        feedback_path = os.path.join(output_dir, 'feedback_delta.csv')
+        self.seen_items = []
+        self.seen_users = []
+        self.feedback_count = 0
+        self.feedback_head = None
+        self.max_timestamp = 0
+        if offset == end:
+            print("No new events since the last run")
+            pd.DataFrame(columns=FEEDBACK_COLUMNS).to_csv(feedback_path, index=False)
+        elif not self._stream(feedback_path, chunksize, workers, (offset, end), min_timestamp):
+            return False
+        
+        # Only items that are new or whose Gorse-visible attributes changed go in the delta
+        item_hashes = {row['item_id']: item_content_hash(row) for row in self.seen_items}
+        stored_hashes = state.item_hashes(item_hashes)
+        changed_items = [
+            row for row in self.seen_items
+            if stored_hashes.get(row['item_id']) != item_hashes[row['item_id']]
+        ]
+        user_ids = [str(user_id) for user_id in self.seen_users]
+        known_users = state.known_users(user_ids)
+        new_users = [user_id for user_id in user_ids if user_id not in known_users]
+        
+        items_path = os.path.join(output_dir, 'items_delta.csv')
+        self.items_df = pd.DataFrame(changed_items, columns=ITEM_COLUMNS)
+        self.items_df.to_csv(items_path, index=False)
+        print(f"✓ Item delta saved to {items_path}")
+        print(f"  New or changed properties: {len(self.items_df)}")
+        
+        users_path = os.path.join(output_dir, 'users_delta.csv')
+        self.users_df = build_user_frame(new_users)
+        self.users_df.to_csv(users_path, index=False)
+        print(f"✓ User delta saved to {users_path}")
+        print(f"  New users: {len(self.users_df)}")
+        
+        # Advance the watermark only after every delta file is on disk
+        state.record_items({row['item_id']: item_hashes[row['item_id']] for row in changed_items})
+        state.record_users(new_users)
+        state.set_watermark(
+            byte_offset=end,
+            head_hash=head_hash(self.input_csv_path, end),
+            max_timestamp=max(max_timestamp, self.max_timestamp)
+        )
+        state.commit()
+        print(f"✓ Watermark advanced to byte {end}")
+        
+        return True
+    
+    def _stream(self, feedback_path, chunksize, workers=1, byte_range=None, min_timestamp=None):
+        encoding = detect_encoding(self.input_csv_path)
+        if encoding is None:
+            print("Failed to load with any encoding")
+            return False
+        print(f"Detected encoding: {encoding}")
+        
+        for attempt_encoding in dict.fromkeys([encoding, 'latin-1']):
+            try:
+                self._stream_range(attempt_encoding, feedback_path, chunksize, workers, byte_range, min_timestamp)
+                return True
+            except UnicodeDecodeError:
+                print(f"Encoding {attempt_encoding} failed past the sample, restarting with latin-1")
+                METRICS.count('encoding_retries_total', encoding=attempt_encoding)
+        return False
+    
+    def _stream_range(self, encoding, feedback_path, chunksize, workers, byte_range, min_timestamp):
+        shard_results = self.iter_shards(encoding, chunksize, workers, byte_range, min_timestamp,
+                                         with_frame=self.columnar is not None)
+        self._stream_chunks(shard_results, feedback_path, workers)
+    
+    def iter_shards(self, encoding, chunksize, workers=1, byte_range=None, min_timestamp=None,
+                    with_records=False, with_frame=False):
+        """Yield process_shard results for the input (or a byte range of it) in input order"""
+        options = {'encoding': encoding, 'chunksize': chunksize, 'dtype': {'user_id': str}}
+        if byte_range is None:
+            METRICS.count('bytes_read_total', os.path.getsize(self.input_csv_path))
+            reader = pd.read_csv(self.input_csv_path, **options)
+            yield from self._iter_shard_results(reader, workers, min_timestamp, with_records, with_frame)
+            return
+        
+        start, end = byte_range
+        METRICS.count('bytes_read_total', end - start)
+        if start > 0:
+            # A range in the middle of the file has no header row of its own
+            columns = pd.read_csv(self.input_csv_path, encoding=encoding, nrows=0).columns
+            options.update(header=None, names=list(columns))
+        with io.BufferedReader(ByteRangeReader(self.input_csv_path, start, end)) as source:
+            reader = pd.read_csv(source, **options)
+            yield from self._iter_shard_results(reader, workers, min_timestamp, with_records, with_frame)
+    
+    def _iter_shard_results(self, reader, workers, min_timestamp=None, with_records=False, with_frame=False):
+        if workers <= 1:
+            for chunk in reader:
+                result = process_shard(chunk, self.parser, min_timestamp, with_records, with_frame,
+                                       self.compact_window)
+                record_shard_metrics(result)
+                yield result
+            return
+        
+        shard_fn = partial(_process_shard_in_worker, min_timestamp=min_timestamp,
+                           with_records=with_records, with_frame=with_frame, compact_window=self.compact_window)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in map_in_order(executor, shard_fn, reader, workers * 2):
+                self.parser.stats.update(result.pop('parser_stats'))
+                samples = result.pop('failure_samples')
+                room = self.parser.max_failure_samples - len(self.parser.failure_samples)
+                self.parser.failure_samples.extend(samples[:max(room, 0)])
+                record_shard_metrics(result)
+                yield result
+    
+    def _stream_chunks(self, shard_results, feedback_path, workers=1):
+        # Only compact state survives between chunks: first-seen item rows and the
+        # first-seen user codes, tracked on interned int32 codes
+        self.seen_items = []
+        self.seen_item_codes = None
+        self.seen_item_properties = []
+        self.seen_users = []
+        self.page_views = PageViewCounter()
+        items_seen = FirstSeen()
+        users_seen = FirstSeen()
+        self.feedback_count = 0
+        self.feedback_head = None
+        self.max_timestamp = 0
+        feedback_events = 0
+        feedback_types = Counter()
+        parse_errors = 0
+        sessions = FeedbackSessions(self.compact_window) if self.compact_window is not None else None
+        
+        def write_sessions(feedback):
+            if not len(feedback):
+                return
+            with METRICS.span('write_csv', table='feedback'):
+                output = decode_feedback(feedback, self.ids.users.values, self.ids.items.values)
+                output.to_csv(feedback_file, header=False, index=False)
+                if self.columnar is not None:
+                    append_feedback(self.columnar, feedback)
+            METRICS.count('rows_written_total', len(output), table='feedback')
+            if self.feedback_head is None or len(self.feedback_head) < 10:
+                self.feedback_head = pd.concat([self.feedback_head, output.head(10)]).head(10)
+            self.feedback_count += len(output)
+            feedback_types.update(output['feedback_type'].value_counts().to_dict())
+        
+        if workers > 1:
+            print(f"Processing shards with {workers} worker processes")
+        
+        with open(feedback_path, 'w', encoding='utf-8', newline='') as feedback_file:
+            feedback_file.write(','.join(FEEDBACK_COLUMNS) + '\n')
+            
+            # Shard results arrive in input order, so merging them here reproduces
+            # the serial output and its first-seen order of items and users
+            for chunk_number, result in enumerate(shard_results, 1):
+                register_shard(result, self.ids)
+                parse_errors += result['parse_errors']
+                self.max_timestamp = max(self.max_timestamp, result['max_timestamp'])
+                
+                if sessions is not None:
+                    write_sessions(sessions.add(result['feedback_frame']))
+                else:
+                    with METRICS.span('write_csv', table='feedback'):
+                        feedback_file.write(result['feedback_csv'])
+                        if self.columnar is not None:
+                            append_feedback(self.columnar, result['feedback_frame'])
+                    METRICS.count('rows_written_total', result['feedback_count'], table='feedback')
+                    if self.feedback_head is None or len(self.feedback_head) < 10:
+                        self.feedback_head = pd.concat([self.feedback_head, result['feedback_head']]).head(10)
+                    self.feedback_count += result['feedback_count']
+                    feedback_types.update(result['feedback_types'])
+                feedback_events += result['feedback_events']
+                
+                is_new = items_seen.add(result['item_codes'])
+                self.seen_items.extend(row for row, new in zip(result['item_rows'], is_new) if new)
+                self.seen_item_properties.append(result['item_properties'][is_new])
+                self.page_views.add(*result['page_views'])
+                users_seen.add(result['user_codes'])
+                
+                print(f"  Chunk {chunk_number}: {result['rows']} rows, {result['feedback_count']} feedback, "
+                      f"{len(items_seen)} items and {len(users_seen)} users so far")
+            
+            if sessions is not None:
+                write_sessions(sessions.finish())
+                METRICS.count('feedback_events_compacted_total', sessions.rows - self.feedback_count)
+        
+        self.seen_item_codes = items_seen.codes()
+        self.seen_users = self.ids.users.decode(users_seen.codes()).tolist()
+        
+        self.parser.report(verbose=self.verbose > 0)
+        record_parse_metrics(self.parser)
+        if parse_errors > 0:
+            print(f"Warning: {parse_errors} rows could not be parsed")
+        
+        print(f"✓ Feedback data saved to {feedback_path}")
+        print(f"  Total entries: {self.feedback_count}")
+        if self.compact_window is not None:
+            print(f"  Compacted from {feedback_events} events ({self.compact_window}s window)")
+            if sessions.late_events:
+                print(f"Warning: {sessions.late_events} events arrived after sessions they may belong to "
+                      f"were written; the input is not in time order")
+        print(f"  Feedback types:")
+        for feedback_type, count in feedback_types.most_common():
+            print(f"    - {feedback_type}: {count}")
+    
     def debug_data(self):
         print("\n" + "="*60)
         print("DATA DEBUG INFO")
@@ -285,19 +979,116 @@ class RealEstateDataProcessor:
             print(self.df['house_id'].head(10).tolist())
 
 
-def main():
+def print_summary(processor, output_dir):
+    print("\n" + "="*60)
+    print("✅ SUCCESS!")
+    print("="*60)
+    print(f"\nCreated files in '{output_dir}/':")
+    print(f"1. feedback.csv - {processor.feedback_count} interactions")
+    print(f"2. items.csv - {len(processor.items_df)} properties")
+    print(f"3. users.csv - {len(processor.users_df)} users")
     
-    INPUT_CSV = 'realestate_data.csv'
+    print(f"\nCreating test_sample.csv with 10 rows for quick testing...")
+    if processor.feedback_head is not None and processor.feedback_count > 10:
+        processor.feedback_head.to_csv(
+            os.path.join(output_dir, 'test_sample.csv'), 
+            index=False
+        )
+        print("✓ Created test_sample.csv")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert real estate events into Gorse data files")
+    parser.add_argument('--input', default='realestate_data.csv', help="Event export CSV")
+    parser.add_argument('--output-dir', default='gorse_data', help="Directory for the Gorse CSV files")
+    parser.add_argument('--chunksize', type=int, default=0,
+                        help="Stream the input in chunks of this many rows instead of loading it whole")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Process chunks in this many worker processes (implies streaming)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process events added since the last run and write *_delta.csv files")
+    parser.add_argument('--state', default=None,
+                        help="Watermark database for --incremental (default: <output-dir>/preprocess_state.sqlite3)")
+    parser.add_argument('--columnar', action='store_true',
+                        help="Also write a dictionary-encoded, memory-mappable copy to <output-dir>/columnar")
+    parser.add_argument('--ids', default=None,
+                        help="Directory of the persistent user/item id dictionaries (default: <output-dir>/ids)")
+    parser.add_argument('--compact-window', type=int, default=None, metavar='SECONDS',
+                        help="Merge repeated events of the same user, listing and type that are at most "
+                             "this many seconds apart into one feedback row with the latest timestamp "
+                             "and the summed weight")
+    parser.add_argument('--metrics', default=None,
+                        help="Write stage timings and counters here: Prometheus text for *.prom, JSON lines otherwise")
+    parser.add_argument('--profile', nargs='?', const='process_data.prof', default=None,
+                        help="Run under cProfile and dump the stats (default file: process_data.prof)")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Print data previews and debug info (debug_data, parse failure samples)")
+    args = parser.parse_args(argv)
+    
+    if args.metrics:
+        METRICS.configure(args.metrics)
+    try:
+        with METRICS.span('total'), profiled('process_data', args.profile):
+            run(args)
+    finally:
+        METRICS.close()
+
+
+def run(args):
+    INPUT_CSV = args.input
     
     if not os.path.exists(INPUT_CSV):
         print(f"❌ File not found: {INPUT_CSV}")
         print("Please ensure the CSV file is in the current directory.")
         return
     
-    output_dir = 'gorse_data'
+    output_dir = args.output_dir
     Path(output_dir).mkdir(exist_ok=True)
     
-    processor = RealEstateDataProcessor(INPUT_CSV)
+    ids = IdRegistry(args.ids or os.path.join(output_dir, 'ids'))
+    processor = RealEstateDataProcessor(INPUT_CSV, verbose=args.verbose, compact_window=args.compact_window,
+                                        ids=ids)
+    columnar_dir = os.path.join(output_dir, 'columnar') if args.columnar else None
+    
+    if (args.workers > 1 or args.incremental) and args.chunksize <= 0:
+        args.chunksize = 100_000
+    
+    if args.incremental:
+        state_path = args.state or os.path.join(output_dir, 'preprocess_state.sqlite3')
+        print("="*60)
+        print("INCREMENTAL GORSE DATA FILES")
+        print("="*60)
+        if columnar_dir:
+            print("Note: --columnar is not supported for delta files and is ignored")
+        
+        try:
+            if processor.process_incremental(output_dir, state_path, args.chunksize, args.workers):
+                ids.save()
+                print(f"\n✅ Delta files written to '{output_dir}/': "
+                      f"{processor.feedback_count} feedback, {len(processor.items_df)} items, "
+                      f"{len(processor.users_df)} users")
+            else:
+                print("\n❌ Failed to create delta files")
+        except Exception as e:
+            print(f"\n❌ Error creating delta files: {e}")
+            traceback.print_exc()
+        return
+    
+    if args.chunksize > 0:
+        print("="*60)
+        print("STREAMING GORSE DATA FILES")
+        print("="*60)
+        
+        try:
+            if processor.process_in_chunks(output_dir, args.chunksize, args.workers, columnar_dir):
+                ids.save()
+                print_summary(processor, output_dir)
+            else:
+                print("\n❌ Failed to create one or more files")
+        except Exception as e:
+            print(f"\n❌ Error creating files: {e}")
+            traceback.print_exc()
+        return
     
     print("="*60)
     print("STEP 1: DEBUG DATA")
@@ -319,7 +1110,8 @@ def main():
             print(f"Could not load raw data: {e}")
         return
     
-    processor.debug_data()
+    if args.verbose:
+        processor.debug_data()
     
     print("\n" + "="*60)
     print("STEP 2: CREATE GORSE DATA FILES")
@@ -335,21 +1127,10 @@ def main():
         users_success = processor.create_user_data(users_file)
         
         if feedback_success and items_success and users_success:
-            print("\n" + "="*60)
-            print("✅ SUCCESS!")
-            print("="*60)
-            print(f"\nCreated files in '{output_dir}/':")
-            print(f"1. feedback.csv - {len(processor.feedback_df)} interactions")
-            print(f"2. items.csv - {len(processor.items_df)} properties")
-            print(f"3. users.csv - {len(processor.users_df)} users")
-            
-            print(f"\nCreating test_sample.csv with 10 rows for quick testing...")
-            if processor.feedback_df is not None and len(processor.feedback_df) > 10:
-                processor.feedback_df.head(10).to_csv(
-                    os.path.join(output_dir, 'test_sample.csv'), 
-                    index=False
-                )
-                print("✓ Created test_sample.csv")
+            if columnar_dir:
+                processor.write_columnar(columnar_dir)
+            ids.save()
+            print_summary(processor, output_dir)
         else:
             print("\n❌ Failed to create one or more files")
             
@@ -0,0 +1,264 @@
+import re
+import threading
+import time
+import tomllib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+from bulk_uploader import make_session
+from metrics import METRICS
+
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """Seconds in a Go-style duration string such as 10m, 1h30m or 500ms"""
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value.strip():
+        raise ValueError(f"Invalid duration: {value!r}")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def load_refresh_period(config_path='config.toml', default=600.0):
+    """recommend.refresh_recommend_period from the Gorse config, in seconds"""
+    try:
+        with open(config_path, 'rb') as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        return default
+    period = config.get('recommend', {}).get('refresh_recommend_period')
+    return parse_duration(period) if period else default
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class TTLCache:
+    """Bounded LRU map whose entries also expire ttl seconds after they were stored"""
+
+    def __init__(self, max_entries=10_000, ttl=600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        return self.entries.pop(key, None) is not None
+
+
+class RecommendResult:
+    def __init__(self, user_id, items=None, error=None):
+        self.user_id = user_id
+        self.items = items
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"RecommendResult(user_id={self.user_id!r}, error={self.error!r})"
+        return f"RecommendResult(user_id={self.user_id!r}, items={len(self.items)})"
+
+
+class RecommendClient:
+    """Gorse recommendation reads through a per-user cache
+
+    Entries live as long as Gorse's own refresh_recommend_period, a cached list
+    fetched for a larger n also answers smaller n, and feedback posted through
+    this client drops the affected users' entries. Concurrent misses for the
+    same user share one request; a request still in flight when its user is
+    invalidated answers its callers but is not cached or shared any more.
+    With a fallback engine (e.g. OfflineRecommender), reads that fail at the
+    HTTP level are answered locally and not cached.
+    """
+
+    def __init__(self, base_url, headers, ttl=None, max_entries=10_000, config_path='config.toml',
+                 pool_size=8, timeout=10, latency_samples=10_000, fallback=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.fallback = fallback
+        self.session = make_session(headers, pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        ttl = load_refresh_period(config_path) if ttl is None else ttl
+        self.cache = TTLCache(max_entries, ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self._in_flight = {}
+        # Bumped by invalidate(); a fetch only caches if its user's generation is unchanged
+        self._generations = {}
+        self.hit_latencies = deque(maxlen=latency_samples)
+        self.miss_latencies = deque(maxlen=latency_samples)
+
+    def _cached(self, user_id, n):
+        with self.lock:
+            entry = self.cache.get(user_id)
+        if entry is None:
+            return None
+        fetched_n, items = entry
+        # A list shorter than what was asked for is everything Gorse has for the user
+        if fetched_n >= n or len(items) < fetched_n:
+            return items[:n]
+        return None
+
+    def fetch(self, user_id, n=10):
+        """GET /api/recommend/{user_id} bypassing the cache"""
+        url = f"{self.base_url}/recommend/{quote(str(user_id), safe='')}"
+        started = time.perf_counter()
+        response = self.session.get(url, params={'n': n}, timeout=self.timeout)
+        METRICS.observe('http_request_seconds', time.perf_counter() - started, endpoint='recommend')
+        METRICS.count('http_requests_total', endpoint='recommend', status=str(response.status_code))
+        response.raise_for_status()
+        return response.json() or []
+
+    def recommend(self, user_id, n=10):
+        started = time.perf_counter()
+        items = self._cached(user_id, n)
+        if items is not None:
+            with self.lock:
+                self.hits += 1
+                self.hit_latencies.append(time.perf_counter() - started)
+            return items
+
+        with self.lock:
+            in_flight = self._in_flight.get(user_id)
+            owner = in_flight is None or in_flight[0] < n
+            if owner:
+                in_flight = self._in_flight[user_id] = (n, Future())
+                generation = self._generations.get(user_id, 0)
+        future = in_flight[1]
+        if not owner:
+            # Someone is already fetching at least n items for this user
+            items = future.result()
+            with self.lock:
+                self.coalesced += 1
+            return items[:n]
+
+        try:
+            items = self.fetch(user_id, n)
+        except requests.RequestException as e:
+            if self.fallback is None:
+                self._release_in_flight(user_id, in_flight)
+                future.set_exception(e)
+                raise
+            try:
+                items = self.fallback.recommend(user_id, n)
+            except BaseException as err:
+                # Not covered by the clauses below: release waiters here
+                self._release_in_flight(user_id, in_flight)
+                future.set_exception(err)
+                raise
+            with self.lock:
+                self.fallbacks += 1
+            self._release_in_flight(user_id, in_flight)
+            future.set_result(items)
+            return items
+        except BaseException as e:
+            self._release_in_flight(user_id, in_flight)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            # Feedback arrived while fetching: the list may predate it
+            if self._generations.get(user_id, 0) == generation:
+                self.cache.put(user_id, (n, items))
+            self.misses += 1
+            self.miss_latencies.append(time.perf_counter() - started)
+        self._release_in_flight(user_id, in_flight)
+        future.set_result(items)
+        return items
+
+    def _release_in_flight(self, user_id, in_flight):
+        with self.lock:
+            if self._in_flight.get(user_id) is in_flight:
+                del self._in_flight[user_id]
+
+    def recommend_many(self, user_ids, n=10):
+        """Recommendations for many users over the pooled session, as RecommendResults in input order
+
+        Duplicate user ids are fetched once, and a failing user only marks its own
+        result with the error instead of failing the whole call.
+        """
+        user_ids = list(user_ids)
+        futures = {
+            user_id: self.executor.submit(self.recommend, user_id, n)
+            for user_id in dict.fromkeys(user_ids)
+        }
+        results = []
+        for user_id in user_ids:
+            future = futures[user_id]
+            error = future.exception()
+            results.append(RecommendResult(user_id, None if error else future.result(), error))
+        return results
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            # Later callers start a fresh fetch instead of joining one that may be stale
+            self._in_flight.pop(user_id, None)
+            if self.cache.pop(user_id):
+                self.invalidations += 1
+
+    def insert_feedback(self, feedback_list):
+        """POST feedback and drop the cached recommendations of every user it touches"""
+        try:
+            response = self.session.post(f"{self.base_url}/feedback", json=feedback_list, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json().get('RowAffected', len(feedback_list))
+        finally:
+            # Also on failure: part of the batch may have been written
+            for user_id in {feedback['UserId'] for feedback in feedback_list}:
+                self.invalidate(user_id)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def stats(self):
+        with self.lock:
+            hit_latencies = list(self.hit_latencies)
+            miss_latencies = list(self.miss_latencies)
+            requests_total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'coalesced': self.coalesced,
+                'fallbacks': self.fallbacks,
+                'hit_rate': self.hits / requests_total if requests_total else 0.0,
+                'cached_users': len(self.cache),
+                'hit_p50_ms': percentile(hit_latencies, 50) * 1000,
+                'miss_p50_ms': percentile(miss_latencies, 50) * 1000,
+                'miss_p99_ms': percentile(miss_latencies, 99) * 1000,
+            }
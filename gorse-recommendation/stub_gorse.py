@@ -0,0 +1,272 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from urllib.parse import parse_qs, unquote, urlparse
+
+TRAINING_TASKS = ['Fit collaborative filtering model', 'Fit click-through rate prediction model']
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+
+class StubGorseState:
+    """In-memory stand-in for the parts of the Gorse API this repo talks to"""
+
+    def __init__(self, api_key='gorse_key', latency=0.0, fail_rate=0.0, throttle_rate=0.0, seed=None,
+                 train_seconds=2.0):
+        self.api_key = api_key
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.train_seconds = train_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.items = {}
+        self.hidden = set()
+        self.feedback = {}
+        self.requests = 0
+        self.train_started = None
+        self.trained_at = None
+        # Popularity "model" built when a training run completes
+        self.popular = []
+        self.seen = {}
+
+    def roll(self):
+        """Pick an injected outcome for one request: None, 'fail' or 'throttle'"""
+        with self.lock:
+            self.requests += 1
+            value = self.random.random()
+        if value < self.throttle_rate:
+            return 'throttle'
+        if value < self.throttle_rate + self.fail_rate:
+            return 'fail'
+        return None
+
+    def insert_items(self, items):
+        with self.lock:
+            for item in items:
+                self.items[item['ItemId']] = item
+                # An upsert replaces the whole item, IsHidden included
+                if item.get('IsHidden'):
+                    self.hidden.add(item['ItemId'])
+                else:
+                    self.hidden.discard(item['ItemId'])
+        return len(items)
+
+    def patch_item(self, item_id, patch):
+        with self.lock:
+            if item_id not in self.items:
+                return False
+            self.items[item_id].update(patch)
+            if self.items[item_id].get('IsHidden'):
+                self.hidden.add(item_id)
+            else:
+                self.hidden.discard(item_id)
+            return True
+
+    def insert_feedback(self, feedback_list):
+        with self.lock:
+            for feedback in feedback_list:
+                key = (feedback['FeedbackType'], feedback['UserId'], feedback['ItemId'])
+                self.feedback[key] = feedback
+        return len(feedback_list)
+
+    def start_training(self):
+        with self.lock:
+            self._finish_training()
+            if self.train_started is None:
+                self.train_started = time.time()
+
+    def _finish_training(self):
+        # Called with the lock held: a run whose time is up publishes its model
+        if self.train_started is None or time.time() - self.train_started < self.train_seconds:
+            return
+        popularity = Counter()
+        seen = defaultdict(set)
+        for feedback_type, user_id, item_id in self.feedback:
+            popularity[item_id] += 1
+            seen[user_id].add(item_id)
+        self.popular = popularity.most_common()
+        self.seen = dict(seen)
+        self.trained_at = self.train_started + self.train_seconds
+        self.train_started = None
+
+    def tasks(self):
+        with self.lock:
+            self._finish_training()
+            running = self.train_started is not None
+            return [
+                {
+                    'Name': name,
+                    'Status': 'Running' if running else ('Complete' if self.trained_at else 'Pending'),
+                    'StartTime': _isoformat(self.train_started or self.trained_at),
+                    'FinishTime': None if running else _isoformat(self.trained_at),
+                }
+                for name in TRAINING_TASKS
+            ]
+
+    def recommend(self, user_id, n=10, offset=0):
+        """Most popular visible items the user has not interacted with, from the last finished run"""
+        with self.lock:
+            self._finish_training()
+            popular = self.popular
+            seen = self.seen.get(user_id, set())
+            hidden = set(self.hidden)
+        ranked = (
+            {'Id': item_id, 'Score': float(count)}
+            for item_id, count in popular if item_id not in seen and item_id not in hidden
+        )
+        return list(islice(ranked, offset, offset + n))
+
+
+class StubGorseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def _check_request(self):
+        """Apply auth, latency and injected faults; returns False if a response was already sent"""
+        if self.state.api_key and self.headers.get('X-API-Key') != self.state.api_key:
+            self._send_json(401, {'error': 'unauthorized'})
+            return False
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        outcome = self.state.roll()
+        if outcome == 'throttle':
+            self._send_json(429, {'error': 'too many requests'}, {'Retry-After': '0'})
+            return False
+        if outcome == 'fail':
+            self._send_json(503, {'error': 'injected failure'})
+            return False
+        return True
+
+    def do_POST(self):
+        body = self._read_json()
+        if not self._check_request():
+            return
+        path = urlparse(self.path).path
+        if path == '/api/items':
+            self._send_json(200, {'RowAffected': self.state.insert_items(body)})
+        elif path == '/api/feedback':
+            self._send_json(200, {'RowAffected': self.state.insert_feedback(body)})
+        elif path == '/api/train':
+            self.state.start_training()
+            self._send_json(200, {'Status': 'training started'})
+        else:
+            self._send_json(404, {'error': f'unknown endpoint {path}'})
+
+    def do_PATCH(self):
+        body = self._read_json()
+        if not self._check_request():
+            return
+        path = urlparse(self.path).path
+        if path.startswith('/api/item/'):
+            item_id = unquote(path[len('/api/item/'):])
+            if self.state.patch_item(item_id, body):
+                self._send_json(200, {'RowAffected': 1})
+            else:
+                self._send_json(404, {'error': f'item {item_id} not found'})
+        else:
+            self._send_json(404, {'error': f'unknown endpoint {path}'})
+
+    def do_GET(self):
+        if not self._check_request():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/api/dashboard/tasks':
+            self._send_json(200, self.state.tasks())
+        elif url.path.startswith('/api/recommend/'):
+            user_id = unquote(url.path[len('/api/recommend/'):])
+            n = int(query.get('n', ['10'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+            self._send_json(200, self.state.recommend(user_id, n, offset))
+        else:
+            self._send_json(404, {'error': f'unknown endpoint {url.path}'})
+
+
+class StubGorseServer:
+    """Run the stub on a background thread, e.g. for local benchmarks"""
+
+    def __init__(self, host='127.0.0.1', port=0, **state_options):
+        self.httpd = ThreadingHTTPServer((host, port), StubGorseHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = StubGorseState(**state_options)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Gorse HTTP API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--train-seconds', type=float, default=2.0,
+                        help="How long a POST /api/train run stays 'Running' before recommendations refresh")
+    args = parser.parse_args()
+
+    server = StubGorseServer(args.host, args.port, latency=args.latency, fail_rate=args.fail_rate,
+                             throttle_rate=args.throttle_rate, train_seconds=args.train_seconds)
+    print(f"Stub Gorse API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
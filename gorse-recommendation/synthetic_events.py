@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# How malformed event_property values are written, in equal shares of the malformed rows.
+# repr and escaped are recovered by EventPropertyParser; truncated and empty are not.
+MALFORMED_KINDS = ('repr', 'escaped', 'truncated', 'empty')
+
+EVENT_COLUMNS = ['user_id', 'event_name', 'created_at', 'event_property']
+
+
+def zipf_sampler(rng, n, exponent):
+    """Draw ranks in [0, n) with P(rank k) proportional to 1 / (k + 1) ** exponent"""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+
+    def sample(size):
+        return np.minimum(np.searchsorted(cdf, rng.random(size)), n - 1)
+    return sample
+
+
+class SyntheticCatalog:
+    """Fixed listings (estate, region, address, listing type, prices) the events refer to"""
+
+    def __init__(self, items, rng, regions=None, estates=None):
+        regions = regions or max(1, min(200, items // 500))
+        estates = estates or max(1, min(20_000, items // 20))
+        estate_regions = rng.integers(0, regions, estates)
+        self.house_ids = np.array([f"HD{37650000 + i}" for i in range(items)], dtype=object)
+        self.estates = rng.integers(0, estates, items)
+        self.regions = estate_regions[self.estates]
+        self.addresses = rng.integers(1, 400, items)
+        kind = rng.random(items)
+        # 40% rentals, 55% sales, 5% listed for both
+        self.rent_price = np.where((kind < 0.40) | (kind >= 0.95),
+                                   rng.integers(16, 120, items) * 500.0, np.nan)
+        self.sale_price = np.where(kind >= 0.40, rng.integers(300, 2000, items) * 10_000.0, np.nan)
+
+    def __len__(self):
+        return len(self.house_ids)
+
+    def properties(self, index, page_type):
+        """The event_property dict of one view of listing index"""
+        props = {
+            'house_id': self.house_ids[index],
+            'pageType': page_type,
+            'estate_name': f"屋苑{self.estates[index]}",
+            'region_name': f"區{self.regions[index]}",
+            'house_address': f"{self.addresses[index]} 屋苑{self.estates[index]}",
+        }
+        if not np.isnan(self.rent_price[index]):
+            props['rent_price'] = float(self.rent_price[index])
+        if not np.isnan(self.sale_price[index]):
+            props['sale_price'] = float(self.sale_price[index])
+        return props
+
+
+def format_property(props, kind):
+    """event_property text for one event: plain JSON or one of MALFORMED_KINDS"""
+    text = json.dumps(props, ensure_ascii=False)
+    if kind is None:
+        return text
+    if kind == 'repr':
+        return repr(props)
+    if kind == 'escaped':
+        return text.replace('"', '\\"')
+    if kind == 'truncated':
+        return text[:len(text) // 2]
+    return ''
+
+
+def write_synthetic_events(path, events, users=None, items=None, zipf=1.1, malformed_rate=0.0,
+                           contact_rate=0.02, days=30, seed=42, chunk_rows=200_000):
+    """Write a realestate_data.csv style export of `events` rows in chunks (memory stays flat)
+
+    Users and listings are drawn with Zipfian skew (exponent zipf), so a few
+    users and listings account for most events, as in the real export.
+    created_at increases through a window of `days` days. A malformed_rate
+    share of event_property values is broken, split evenly over MALFORMED_KINDS.
+    Returns counts of what was written.
+    """
+    rng = np.random.default_rng(seed)
+    users = users or max(1, events // 20)
+    items = items or max(1, events // 15)
+    catalog = SyntheticCatalog(items, rng)
+    user_ids = np.array([f"{seed:08x}-{i:04x}-4000-8000-{i * 2654435761 % (1 << 48):012x}" for i in range(users)],
+                        dtype=object)
+    sample_user = zipf_sampler(rng, users, zipf)
+    sample_item = zipf_sampler(rng, items, zipf)
+    start = 1758000000
+    step = days * 86400 / max(events, 1)
+
+    counts = {'events': 0, 'malformed': 0, 'users': users, 'items': items}
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(EVENT_COLUMNS) + '\n')
+        for offset in range(0, events, chunk_rows):
+            size = min(chunk_rows, events - offset)
+            item_index = sample_item(size)
+            page_types = np.array(['detail', 'list'], dtype=object)[(rng.random(size) < 0.5).astype(np.int64)]
+            malformed = rng.random(size) < malformed_rate
+            kinds = np.array(MALFORMED_KINDS, dtype=object)[rng.integers(0, len(MALFORMED_KINDS), size)]
+            seconds = start + (offset + np.arange(size)) * step + rng.random(size) * step
+            chunk = pd.DataFrame({
+                'user_id': user_ids[sample_user(size)],
+                'event_name': np.where(rng.random(size) < contact_rate, 'contact_agent', 'view_listing'),
+                'created_at': pd.to_datetime(seconds.astype(np.int64), unit='s').strftime('%Y-%m-%d %H:%M:%S'),
+                'event_property': [
+                    format_property(catalog.properties(i, page_type), kind if bad else None)
+                    for i, page_type, bad, kind in zip(item_index, page_types, malformed, kinds)
+                ],
+            })
+            chunk.to_csv(f, header=False, index=False)
+            counts['events'] += size
+            counts['malformed'] += int(malformed.sum())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic realestate_data.csv event export")
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--output', default='synthetic_events.csv')
+    parser.add_argument('--users', type=int, default=None, help="Distinct users (default: events / 20)")
+    parser.add_argument('--items', type=int, default=None, help="Distinct listings (default: events / 15)")
+    parser.add_argument('--zipf', type=float, default=1.1, help="Skew exponent of user and listing popularity")
+    parser.add_argument('--malformed-rate', type=float, default=0.02,
+                        help="Share of rows with a broken event_property")
+    parser.add_argument('--days', type=float, default=30, help="Span of created_at")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = write_synthetic_events(args.output, args.events, args.users, args.items, args.zipf,
+                                    args.malformed_rate, days=args.days, seed=args.seed)
+    seconds = time.perf_counter() - started
+    print(f"✓ Wrote {counts['events']:,} events ({counts['malformed']:,} malformed) for {counts['users']:,} users "
+          f"and {counts['items']:,} listings to {args.output}")
+    print(f"  {os.path.getsize(args.output) / 1e6:.1f} MB in {seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from ingest_daemon import FeedbackIngestor, SpillLog
+
+
+class FlakyUploader:
+    """Fails the first post of the older batch, and only after the newer one went through"""
+
+    def __init__(self):
+        self.newer_posted = threading.Event()
+        self.failed = False
+        self.stored = {}
+        self.lock = threading.Lock()
+
+    def post_batch(self, endpoint, batch):
+        record = batch[0]
+        if record['Comment'] == 'older' and not self.failed:
+            self.newer_posted.wait(5)
+            self.failed = True
+            return 0, 'status 503'
+        with self.lock:
+            for record in batch:
+                # Gorse overwrites feedback of the same type, user and item
+                self.stored[(record['FeedbackType'], record['UserId'], record['ItemId'])] = record['Comment']
+        if record['Comment'] == 'newer':
+            self.newer_posted.set()
+        return len(batch), None
+
+
+def feedback(comment):
+    return {'FeedbackType': 'view_listing', 'UserId': 'u', 'ItemId': 'i', 'Timestamp': '1', 'Comment': comment}
+
+
+def test_newer_in_flight_batch_is_replayed_after_a_spilled_older_one(tmp_path):
+    uploader = FlakyUploader()
+    spill_log = SpillLog(str(tmp_path / 'spill.sqlite3'))
+
+    async def run():
+        ingestor = await FeedbackIngestor(uploader, spill_log, batch_size=1, flush_interval=0.01, max_inflight=2,
+                                          replay_interval=0.01).start()
+        await ingestor.submit([feedback('older'), feedback('newer')])
+        for _ in range(500):
+            if uploader.failed and ingestor.counts['replayed'] == 2:
+                break
+            await asyncio.sleep(0.01)
+        await ingestor.close()
+        return ingestor.counts
+
+    try:
+        counts = asyncio.run(run())
+    finally:
+        spill_log.close()
+    assert counts['spilled'] == 1 and counts['deferred'] == 1 and counts['replayed'] == 2
+    assert uploader.stored[('view_listing', 'u', 'i')] == 'newer'
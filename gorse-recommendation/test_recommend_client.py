@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from recommend_client import RecommendClient
+
+
+class FailingFallback:
+    def recommend(self, user_id, n=10):
+        raise KeyError(user_id)
+
+
+def unreachable(user_id, n=10):
+    raise requests.ConnectionError("Gorse is down")
+
+
+def test_failing_fallback_releases_waiters():
+    client = RecommendClient('http://127.0.0.1:9/api', {}, ttl=60, fallback=FailingFallback())
+    client.fetch = unreachable
+    try:
+        with pytest.raises(KeyError):
+            client.recommend('u', 5)
+        assert client._in_flight == {}
+        # A second call for the same user must fail too instead of waiting on the first call's future
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            second = executor.submit(client.recommend, 'u', 5)
+            assert isinstance(second.exception(timeout=5), KeyError)
+    finally:
+        client.close()
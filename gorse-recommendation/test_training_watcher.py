@@ -0,0 +1,31 @@
+from training_watcher import TrainingWatcher
+
+
+def make_watcher(task_answers, canary_answers):
+    watcher = TrainingWatcher('http://127.0.0.1:9/api', {}, canary_users=['u'])
+    task_answers = iter(task_answers)
+    canary_answers = iter(canary_answers)
+    watcher.tasks = lambda: next(task_answers)
+    watcher.canary = lambda: next(canary_answers)
+    return watcher
+
+
+def test_task_list_failure_does_not_fall_back_to_canaries():
+    before = {'tasks': {'fit': ('Running', None)}, 'canary': {'u': ['a']}}
+    finished = {'fit': ('Complete', '2026-01-01T00:00:00+00:00')}
+    watcher = make_watcher([None, finished], [{'u': ['b']}] * 2)
+    # The canary moved, but the task list was reachable at snapshot time
+    assert watcher.check(before) is None
+    assert watcher.check(before) == 'tasks'
+
+
+def test_late_task_list_becomes_the_baseline():
+    before = {'tasks': None, 'canary': {'u': ['a']}}
+    earlier_run = {'fit': ('Complete', '2026-01-01T00:00:00+00:00')}
+    this_run = {'fit': ('Complete', '2026-01-02T00:00:00+00:00')}
+    watcher = make_watcher([earlier_run, earlier_run, this_run], [{'u': ['a']}] * 3)
+    # A finish time that predates the snapshot is not a finished run
+    assert watcher.check(before) is None
+    assert before['tasks'] == earlier_run
+    assert watcher.check(before) is None
+    assert watcher.check(before) == 'tasks'
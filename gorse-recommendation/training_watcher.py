@@ -0,0 +1,124 @@
+import time
+
+import requests
+
+BUSY_STATUS = {'Pending', 'Running'}
+
+
+def recommendation_ids(recommendations):
+    """Item ids from a /api/recommend response (plain ids or {"Id", "Score"} objects)"""
+    return [rec.get('Id') if isinstance(rec, dict) else rec for rec in recommendations or []]
+
+
+class TrainingResult:
+    def __init__(self, ready, duration, polls, reason):
+        self.ready = ready
+        self.duration = duration
+        self.polls = polls
+        self.reason = reason
+
+    def __repr__(self):
+        return (f"TrainingResult(ready={self.ready}, duration={self.duration:.1f}s, "
+                f"polls={self.polls}, reason={self.reason!r})")
+
+
+class TrainingWatcher:
+    """Poll Gorse until a training run has finished instead of sleeping a fixed time
+
+    Readiness comes from the dashboard task list: no running task and at least
+    one task whose FinishTime changed since the snapshot taken before training
+    was triggered; a poll where the list cannot be fetched just polls again.
+    Only when the endpoint was unavailable at snapshot time does a canary
+    user's recommendations changing (or appearing) since the snapshot count
+    instead; Gorse serves and refreshes non-model fallback lists as it reads
+    feedback, so canaries can move before a training run has finished. If the
+    task list comes back later, its first answer becomes the baseline.
+    """
+
+    def __init__(self, base_url, headers, canary_users=(), deadline=600.0, initial_interval=0.5,
+                 max_interval=15.0, backoff=2.0, n=10, timeout=10):
+        self.base_url = base_url
+        self.canary_users = list(canary_users)
+        self.deadline = deadline
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.n = n
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+
+    def _get_json(self, path):
+        """GET one endpoint; returns None when it is unavailable or failing"""
+        try:
+            response = self.session.get(f"{self.base_url}/{path}", timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def tasks(self):
+        """Map of task name -> (status, finish time), or None if the endpoint is unavailable"""
+        tasks = self._get_json('dashboard/tasks')
+        if not isinstance(tasks, list):
+            return None
+        return {task.get('Name'): (task.get('Status'), task.get('FinishTime')) for task in tasks}
+
+    def canary(self):
+        recommendations = {}
+        for user_id in self.canary_users:
+            result = self._get_json(f"recommend/{user_id}?n={self.n}")
+            if result is not None:
+                recommendations[user_id] = recommendation_ids(result)
+        return recommendations
+
+    def snapshot(self):
+        """State to compare against; take it right before triggering training"""
+        return {'tasks': self.tasks(), 'canary': self.canary()}
+
+    def check(self, before):
+        """Return why training looks finished, or None if it does not yet
+
+        Updates before['tasks'] when it was missing and the task list is reachable now.
+        """
+        previous = before.get('tasks')
+        tasks = self.tasks()
+        if previous is not None:
+            if tasks is None:
+                # A transient failure; canaries could fire before training has finished
+                return None
+            busy = any(status in BUSY_STATUS for status, _ in tasks.values())
+            finished = any(
+                finish_time and previous.get(name, (None, None))[1] != finish_time
+                for name, (_, finish_time) in tasks.items()
+            )
+            return 'tasks' if finished and not busy else None
+
+        if tasks is not None:
+            # Without a baseline every existing FinishTime would look new
+            before['tasks'] = tasks
+        canary = before.get('canary') or {}
+        for user_id, items in self.canary().items():
+            if items and items != canary.get(user_id):
+                return 'canary'
+        return None
+
+    def wait(self, before, started=None):
+        """Poll with exponential backoff until ready or the deadline passes"""
+        started = time.monotonic() if started is None else started
+        interval = self.initial_interval
+        polls = 0
+        while True:
+            polls += 1
+            reason = self.check(before)
+            elapsed = time.monotonic() - started
+            if reason is not None:
+                return TrainingResult(True, elapsed, polls, reason)
+            if elapsed >= self.deadline:
+                return TrainingResult(False, elapsed, polls, 'deadline')
+            time.sleep(min(interval, max(self.deadline - elapsed, 0)))
+            interval = min(self.max_interval, interval * self.backoff)
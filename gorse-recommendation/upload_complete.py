@@ -2,6 +2,19 @@ import requests
 import json
 import csv
 import time
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from bulk_uploader import BulkUploader, make_session
+from catalog_snapshot import CatalogDiff, CatalogSnapshot
+from columnar_store import ColumnarReader
+from metrics import METRICS, profiled
+from recommend_client import RecommendClient
+from training_watcher import TrainingWatcher
+from upload_journal import UploadJournal, source_fingerprint
+from warmup import warm_active_users
 
 BASE_URL = "http://localhost:8088/api"
 API_KEY = "gorse_key"
@@ -11,15 +24,24 @@ headers = {
     "Content-Type": "application/json"
 }
 
-def upload_all_items():
-    """Upload all items from items.csv"""
-    print("Uploading all items from items.csv...")
-    
+TEST_USERS = [
+    "9b6d5856-b182-4c98-97ee-982ebc116943",
+    "cb987911-b3a0-47fd-a25c-fdf8f3c18bba",
+    "68c3b151-6662-4096-a197-233ac78d7ad5",
+    "2db80906-9b4b-4649-b648-b58b46c3c048"
+]
+
+def load_items(path='items.csv', sample_fallback=True):
+    """Read items.csv into Gorse item records
+
+    Falls back to a few sample listings when the file is missing, unless
+    sample_fallback is False, in which case FileNotFoundError is raised.
+    """
     items = []
     
     # First, try to read from items.csv file
     try:
-        with open('items.csv', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 # Parse labels
@@ -43,6 +65,8 @@ def upload_all_items():
         
         print(f"Found {len(items)} items in CSV")
     except FileNotFoundError:
+        if not sample_fallback:
+            raise
         print("items.csv not found, using sample data")
         # Fall back to sample data
         items = [
@@ -83,39 +107,104 @@ def upload_all_items():
             }
         ]
     
-    # Upload in batches
-    batch_size = 10
-    total_uploaded = 0
+    return items
+
+def hide_items(item_ids, concurrency=8):
+    """Mark listings hidden in Gorse; returns the ids that were acknowledged"""
+    session = make_session(headers, concurrency)
     
-    for i in range(0, len(items), batch_size):
-        batch = items[i:i+batch_size]
+    def hide(item_id):
         try:
-            response = requests.post(f"{BASE_URL}/items", json=batch, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                affected = result.get('RowAffected', len(batch))
-                total_uploaded += affected
-                print(f"✓ Batch {i//batch_size + 1}: Uploaded {affected} items")
-            else:
-                print(f"✗ Batch {i//batch_size + 1}: Failed with status {response.status_code}")
-                print(f"  Response: {response.text[:200]}")
-        except Exception as e:
-            print(f"✗ Batch {i//batch_size + 1}: Error: {e}")
-        
-        # Small delay to avoid overwhelming
-        time.sleep(0.1)
+            response = session.patch(f"{BASE_URL}/item/{quote(item_id, safe='')}", json={"IsHidden": True},
+                                     timeout=30)
+        except requests.RequestException as e:
+            print(f"✗ Could not hide {item_id}: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"✗ Could not hide {item_id}: status {response.status_code}")
+            return None
+        return item_id
     
-    print(f"\nTotal items uploaded: {total_uploaded}/{len(items)}")
-    return total_uploaded
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        hidden = [item_id for item_id in executor.map(hide, item_ids) if item_id is not None]
+    session.close()
+    return hidden
 
-def upload_all_feedback():
-    """Upload all feedback from feedback.csv"""
-    print("\nUploading feedback from feedback.csv...")
+def upload_all_items(batch_size=10, concurrency=8, journal=None, columnar_dir=None, verbose=0,
+                     snapshot=None, hide_removed=False, max_removed_share=0.1):
+    """Upload all items from items.csv, or stream them from a columnar store
     
+    With a CatalogSnapshot only listings that are new or whose labels, categories
+    or comment changed since the last acknowledged upload are sent. Removed
+    listings are hidden only while they are at most max_removed_share of the
+    visible listings in the snapshot; a larger share usually means a truncated
+    or wrong catalog source rather than real churn.
+    """
+    if columnar_dir:
+        print(f"Uploading all items from {columnar_dir}...")
+        store = ColumnarReader(columnar_dir)
+        items = store.iter_item_records()
+        total = store.num_rows('items')
+        source = source_fingerprint(os.path.join(columnar_dir, 'meta.json'))
+        print(f"Found {total} items in columnar store")
+    else:
+        print("Uploading all items from items.csv...")
+        try:
+            # Diffing the snapshot against the sample listings would report the whole catalog as removed
+            items = load_items(sample_fallback=snapshot is None)
+        except FileNotFoundError:
+            raise SystemExit("✗ items.csv not found; aborting instead of diffing the catalog snapshot "
+                             "against sample data (use --full-catalog to upload the samples)")
+        total = len(items)
+        source = source_fingerprint('items.csv')
+    
+    diff = None
+    if snapshot is not None:
+        diff = CatalogDiff()
+        items = snapshot.changed_records(items, diff)
+        # The snapshot is the checkpoint here: batch offsets in a delta shift between runs
+        journal = None
+    
+    # Upload in concurrent batches over one pooled session
+    uploader = BulkUploader(BASE_URL, headers, batch_size=batch_size, max_concurrency=concurrency,
+                            verbose=verbose)
+    with METRICS.span('upload', endpoint='items'):
+        result = uploader.upload('items', items, label='items', journal=journal, source=source)
+    
+    if diff is not None:
+        failed_ids = {record['ItemId'] for _, _, batch, _ in result.failed for record in batch}
+        snapshot.record({item_id: content_hash for item_id, content_hash in diff.hashes.items()
+                         if item_id not in failed_ids})
+        print(f"\nCatalog changes: {diff.added} added, {diff.changed} changed, "
+              f"{diff.unchanged} unchanged, {len(diff.removed)} removed")
+        METRICS.count('items_unchanged_total', diff.unchanged)
+        removed_share = len(diff.removed) / diff.visible if diff.visible else 0.0
+        if diff.removed and hide_removed and removed_share > max_removed_share:
+            print(f"✗ Refusing to hide {len(diff.removed)} listings ({removed_share:.0%} of the snapshot, "
+                  f"limit {max_removed_share:.0%}); check the catalog source or raise --max-removed-share")
+        elif diff.removed and hide_removed:
+            hidden = hide_items(diff.removed, concurrency)
+            snapshot.mark_hidden(hidden)
+            print(f"✓ Hid {len(hidden)}/{len(diff.removed)} removed listings")
+        elif diff.removed:
+            print("  Removed listings stay visible in Gorse; use --hide-removed to hide them")
+        total = result.total + diff.unchanged
+    
+    print(f"\nTotal items uploaded: {result.uploaded}/{total}")
+    if diff is not None and diff.unchanged:
+        print(f"  {diff.unchanged} unchanged listings skipped (already in Gorse)")
+    if result.skipped:
+        print(f"  {result.skipped} items were already acknowledged by a previous run")
+    if result.failed:
+        print(f"✗ {len(result.failed)} batches dead-lettered; rerun to retry them")
+    return result.uploaded + result.skipped + (diff.unchanged if diff is not None else 0)
+
+def load_feedback(path='feedback.csv'):
+    """Read feedback.csv into Gorse feedback records"""
     feedback_list = []
     
     try:
-        with open('feedback.csv', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 feedback = {
@@ -169,34 +258,43 @@ def upload_all_feedback():
             }
         ]
     
-    # Upload in batches
-    batch_size = 20
-    total_uploaded = 0
+    return feedback_list
+
+def upload_all_feedback(batch_size=20, concurrency=8, journal=None, columnar_dir=None, verbose=0):
+    """Upload all feedback from feedback.csv, or stream it from a columnar store"""
+    if columnar_dir:
+        print(f"\nUploading feedback from {columnar_dir}...")
+        store = ColumnarReader(columnar_dir)
+        feedback_list = store.iter_feedback_records()
+        total = store.num_rows('feedback')
+        source = source_fingerprint(os.path.join(columnar_dir, 'meta.json'))
+        print(f"Found {total} feedback entries in columnar store")
+    else:
+        print("\nUploading feedback from feedback.csv...")
+        feedback_list = load_feedback()
+        total = len(feedback_list)
+        source = source_fingerprint('feedback.csv')
     
-    for i in range(0, len(feedback_list), batch_size):
-        batch = feedback_list[i:i+batch_size]
-        try:
-            response = requests.post(f"{BASE_URL}/feedback", json=batch, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                affected = result.get('RowAffected', len(batch))
-                total_uploaded += affected
-                print(f"✓ Batch {i//batch_size + 1}: Uploaded {affected} feedback entries")
-            else:
-                print(f"✗ Batch {i//batch_size + 1}: Failed with status {response.status_code}")
-                print(f"  Response: {response.text[:200]}")
-        except Exception as e:
-            print(f"✗ Batch {i//batch_size + 1}: Error: {e}")
-        
-        time.sleep(0.1)
+    uploader = BulkUploader(BASE_URL, headers, batch_size=batch_size, max_concurrency=concurrency,
+                            verbose=verbose)
+    with METRICS.span('upload', endpoint='feedback'):
+        result = uploader.upload('feedback', feedback_list, label='feedback entries',
+                                 journal=journal, source=source)
     
-    print(f"\nTotal feedback entries uploaded: {total_uploaded}/{len(feedback_list)}")
-    return total_uploaded
+    print(f"\nTotal feedback entries uploaded: {result.uploaded}/{total}")
+    if result.skipped:
+        print(f"  {result.skipped} entries were already acknowledged by a previous run")
+    if result.failed:
+        print(f"✗ {len(result.failed)} batches dead-lettered; rerun to retry them")
+    return result.uploaded + result.skipped
 
-def trigger_training_and_wait():
-    """Trigger training and wait for completion"""
+def trigger_training_and_wait(deadline=600.0, canary_users=TEST_USERS):
+    """Trigger training and poll until recommendations are refreshed (or the deadline passes)"""
     print("\nTriggering model training...")
     
+    watcher = TrainingWatcher(BASE_URL, headers, canary_users=canary_users, deadline=deadline)
+    before = watcher.snapshot()
+    started = time.monotonic()
     try:
         response = requests.post(f"{BASE_URL}/train", headers=headers)
         if response.status_code == 200:
@@ -209,62 +307,112 @@ def trigger_training_and_wait():
         print(f"✗ Error triggering training: {e}")
         return False
     
-    # Wait for training to complete
-    print("\nWaiting 30 seconds for training to complete...")
-    for i in range(30):
-        print(f".", end="", flush=True)
-        time.sleep(1)
-    print()
+    # Poll task status and canary recommendations with backoff instead of a fixed sleep
+    print(f"\nWaiting up to {deadline:.0f} seconds for training to complete...")
+    result = watcher.wait(before, started)
+    if not result.ready:
+        print(f"✗ Training not finished after {result.duration:.1f}s ({result.polls} polls)")
+        return False
     
+    METRICS.observe('training_seconds', result.duration)
+    print(f"✓ Training finished in {result.duration:.1f}s (detected via {result.reason}, {result.polls} polls)")
     return True
 
-def test_recommendations():
+def test_recommendations(client=None):
     """Test recommendations for sample users"""
     print("\n=== Testing Recommendations ===")
     
-    test_users = [
-        "9b6d5856-b182-4c98-97ee-982ebc116943",
-        "cb987911-b3a0-47fd-a25c-fdf8f3c18bba",
-        "68c3b151-6662-4096-a197-233ac78d7ad5",
-        "2db80906-9b4b-4649-b648-b58b46c3c048"
-    ]
-    
-    for user_id in test_users:
+    client = client or RecommendClient(BASE_URL, headers)
+    for user_id in TEST_USERS:
         print(f"\nRecommendations for user {user_id}:")
         try:
-            response = requests.get(
-                f"{BASE_URL}/recommend/{user_id}?n=5",
-                headers=headers
-            )
-            if response.status_code == 200:
-                recommendations = response.json()
-                if recommendations:
-                    print(f"✓ Found {len(recommendations)} recommendations")
-                    for i, rec in enumerate(recommendations[:3]):  # Show first 3
-                        print(f"  {i+1}. Item ID: {rec.get('Id', 'N/A')}, Score: {rec.get('Score', 'N/A')}")
-                else:
-                    print("✗ No recommendations available yet")
+            recommendations = client.recommend(user_id, n=5)
+            if recommendations:
+                print(f"✓ Found {len(recommendations)} recommendations")
+                for i, rec in enumerate(recommendations[:3]):  # Show first 3
+                    print(f"  {i+1}. Item ID: {rec.get('Id', 'N/A')}, Score: {rec.get('Score', 'N/A')}")
             else:
-                print(f"✗ API error: {response.status_code}")
-                print(f"  Response: {response.text[:200]}")
+                print("✗ No recommendations available yet")
+        except requests.HTTPError as e:
+            print(f"✗ API error: {e.response.status_code}")
+            print(f"  Response: {e.response.text[:200]}")
         except Exception as e:
             print(f"✗ Error: {e}")
+    return client
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload items and feedback to Gorse")
+    parser.add_argument('--base-url', default=BASE_URL, help="Gorse API root")
+    parser.add_argument('--items-batch-size', type=int, default=10)
+    parser.add_argument('--feedback-batch-size', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum batches in flight")
+    parser.add_argument('--journal', default='upload_journal.sqlite3',
+                        help="Checkpoint of acknowledged batches used to resume interrupted uploads")
+    parser.add_argument('--restart', action='store_true',
+                        help="Forget the journal and the catalog snapshot and upload everything")
+    parser.add_argument('--catalog', default='catalog_snapshot.sqlite3',
+                        help="Snapshot of uploaded listings; only new or changed ones are re-sent")
+    parser.add_argument('--full-catalog', action='store_true',
+                        help="Upload every listing without consulting the catalog snapshot")
+    parser.add_argument('--hide-removed', action='store_true',
+                        help="Mark listings that disappeared from the catalog as hidden in Gorse")
+    parser.add_argument('--max-removed-share', type=float, default=0.1,
+                        help="Refuse --hide-removed when more than this share of the snapshot's visible "
+                             "listings disappeared (1.0 to allow any)")
+    parser.add_argument('--train-deadline', type=float, default=600.0,
+                        help="Seconds to wait for training to finish before giving up")
+    parser.add_argument('--warm-users', type=int, default=1000,
+                        help="After training, prefetch recommendations for this many of the most active users "
+                             "(0 to skip)")
+    parser.add_argument('--warm-concurrency', type=int, default=16, help="Warm-up requests in flight")
+    parser.add_argument('--columnar', default=None,
+                        help="Stream records from a columnar store (e.g. gorse_data/columnar) instead of the CSVs")
+    parser.add_argument('--metrics', default=None,
+                        help="Write HTTP latency histograms and counters here: Prometheus text for *.prom, "
+                             "JSON lines otherwise")
+    parser.add_argument('--profile', nargs='?', const='upload_complete.prof', default=None,
+                        help="Run the upload under cProfile and dump the stats (default file: upload_complete.prof)")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="Print every uploaded batch")
+    args = parser.parse_args()
+    BASE_URL = args.base_url
+    if args.metrics:
+        METRICS.configure(args.metrics)
+    
+    journal = UploadJournal(args.journal)
+    snapshot = None if args.full_catalog else CatalogSnapshot(args.catalog)
+    if args.restart:
+        journal.reset()
+        if snapshot is not None:
+            snapshot.reset()
+    
     print("=== Gorse Real Estate Recommendation System ===")
     print("Starting data upload and setup...")
     
-    # Upload data
-    items_count = upload_all_items()
-    feedback_count = upload_all_feedback()
-    
-    if items_count > 0 and feedback_count > 0:
-        # Trigger training
-        if trigger_training_and_wait():
-            # Test recommendations
-            test_recommendations()
-    else:
-        print("\nInsufficient data uploaded. Need both items and feedback.")
+    try:
+        # Upload data
+        with profiled('upload', args.profile):
+            items_count = upload_all_items(args.items_batch_size, args.concurrency, journal, args.columnar,
+                                           args.verbose, snapshot, args.hide_removed,
+                                           args.max_removed_share)
+            feedback_count = upload_all_feedback(args.feedback_batch_size, args.concurrency, journal,
+                                                 args.columnar, args.verbose)
+        
+        if items_count > 0 and feedback_count > 0:
+            # Trigger training
+            if trigger_training_and_wait(args.train_deadline):
+                client = RecommendClient(BASE_URL, headers, pool_size=args.warm_concurrency)
+                try:
+                    # Prime Gorse's caches and the client's for the busiest users before real traffic
+                    if args.warm_users > 0:
+                        warm_active_users(client, args.columnar or 'feedback.csv', args.warm_users)
+                    # Test recommendations
+                    test_recommendations(client)
+                finally:
+                    client.close()
+        else:
+            print("\nInsufficient data uploaded. Need both items and feedback.")
+    finally:
+        METRICS.close()
     
     print("\n=== Setup Complete ===")
     print("\nNext steps:")
@@ -0,0 +1,95 @@
+import bisect
+import os
+import sqlite3
+import time
+
+
+def source_fingerprint(path):
+    """Identify one version of an input file; a rewritten file starts a fresh journal"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return f"sample:{os.path.basename(path)}"
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class UploadJournal:
+    """SQLite checkpoint of acknowledged and dead-lettered upload batches"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                kind TEXT NOT NULL,
+                source TEXT NOT NULL,
+                start_row INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                affected INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (kind, source, start_row, size)
+            )
+        """)
+        self.conn.commit()
+        self._acked = {}
+
+    def _record(self, kind, source, start_row, size, status, affected=0, error=None):
+        self.conn.execute("""
+            INSERT INTO batches (kind, source, start_row, size, status, affected, attempts, error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT (kind, source, start_row, size) DO UPDATE SET
+                status = excluded.status, affected = excluded.affected, error = excluded.error,
+                attempts = attempts + 1, updated_at = excluded.updated_at
+        """, (kind, source, start_row, size, status, affected, error, time.time()))
+        # Commit per batch so a crash never loses an acknowledgement
+        self.conn.commit()
+
+    def ack(self, kind, source, start_row, size, affected):
+        self._record(kind, source, start_row, size, 'acked', affected=affected)
+
+    def dead_letter(self, kind, source, start_row, size, error):
+        self._record(kind, source, start_row, size, 'failed', error=error)
+
+    def load(self, kind, source):
+        """Cache the acknowledged row ranges for one input so is_acked is a bisect"""
+        rows = self.conn.execute(
+            "SELECT start_row, size FROM batches WHERE kind = ? AND source = ? AND status = 'acked' "
+            "ORDER BY start_row", (kind, source)
+        ).fetchall()
+        merged = []
+        for start, size in rows:
+            end = start + size
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._acked[(kind, source)] = ([start for start, _ in merged], [end for _, end in merged])
+
+    def is_acked(self, kind, source, start_row, size):
+        starts, ends = self._acked.get((kind, source), ([], []))
+        i = bisect.bisect_right(starts, start_row) - 1
+        return i >= 0 and ends[i] >= start_row + size
+
+    def summary(self, kind, source):
+        """Return (acked batches, acked rows, dead-lettered batches) for one input"""
+        acked, rows = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(affected), 0) FROM batches "
+            "WHERE kind = ? AND source = ? AND status = 'acked'", (kind, source)
+        ).fetchone()
+        failed, = self.conn.execute(
+            "SELECT COUNT(*) FROM batches WHERE kind = ? AND source = ? AND status = 'failed'",
+            (kind, source)
+        ).fetchone()
+        return acked, rows, failed
+
+    def reset(self):
+        self.conn.execute("DELETE FROM batches")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
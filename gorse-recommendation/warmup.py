@@ -0,0 +1,117 @@
+import argparse
+import os
+import signal
+import time
+
+from metrics import METRICS
+from offline_recommender import drop_anonymous, load_feedback_frame
+from recommend_client import RecommendClient, parse_duration, percentile
+from training_watcher import TrainingWatcher
+
+BASE_URL = "http://localhost:8088/api"
+headers = {"X-API-Key": "gorse_key"}
+
+
+def most_active_users(feedback, limit=1000, window=7 * 24 * 3600.0):
+    """The `limit` users with the most feedback in the last `window` seconds of the data, busiest first"""
+    feedback = drop_anonymous(feedback)
+    if len(feedback) == 0 or limit <= 0:
+        return []
+    timestamps = feedback['timestamp'].astype('int64')
+    recent = feedback[timestamps >= timestamps.max() - window]
+    return recent['user_id'].astype(str).value_counts().head(limit).index.tolist()
+
+
+class WarmupResult:
+    def __init__(self, users, warmed, failed, seconds, latencies):
+        self.users = users
+        self.warmed = warmed
+        self.failed = failed
+        self.seconds = seconds
+        self.latencies = latencies
+
+    def __repr__(self):
+        return (f"WarmupResult(users={self.users}, warmed={self.warmed}, failed={self.failed}, "
+                f"seconds={self.seconds:.2f}, p99={percentile(self.latencies, 99) * 1000:.1f}ms)")
+
+
+def warm_up(client, user_ids, n=10):
+    """Fetch fresh recommendations for user_ids through client, busiest first
+
+    Each request makes Gorse build and cache that user's list, and the answer
+    lands in the client's cache, so the first real reads after training hit
+    warm caches on both sides. Entries cached before training are dropped
+    first. Concurrency is bounded by the client's pool_size.
+    """
+    user_ids = list(user_ids)
+    for user_id in user_ids:
+        client.invalidate(user_id)
+    misses_before = client.misses
+    started = time.perf_counter()
+    with METRICS.span('warmup'):
+        results = client.recommend_many(user_ids, n)
+    seconds = time.perf_counter() - started
+    failed = sum(not result.ok for result in results)
+    METRICS.count('warmup_users_total', len(results) - failed, outcome='warmed')
+    METRICS.count('warmup_users_total', failed, outcome='failed')
+    fetched = client.misses - misses_before
+    latencies = list(client.miss_latencies)[-fetched:] if fetched else []
+    return WarmupResult(len(results), len(results) - failed, failed, seconds, latencies)
+
+
+def warm_active_users(client, feedback_path, limit=1000, n=10, window=7 * 24 * 3600.0):
+    """Rank users by recent feedback in feedback_path and warm the top `limit`, printing a summary"""
+    if not os.path.exists(feedback_path):
+        print(f"✗ Warm-up skipped: {feedback_path} not found")
+        return None
+    user_ids = most_active_users(load_feedback_frame(feedback_path), limit, window)
+    print(f"\nWarming recommendations for the {len(user_ids)} most active users...")
+    result = warm_up(client, user_ids, n)
+    print(f"✓ Warmed {result.warmed}/{result.users} users in {result.seconds:.2f}s "
+          f"({result.users / max(result.seconds, 1e-9):,.0f} users/s, "
+          f"p50 {percentile(result.latencies, 50) * 1000:.1f}ms, p99 {percentile(result.latencies, 99) * 1000:.1f}ms)")
+    if result.failed:
+        print(f"✗ {result.failed} users failed")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch recommendations for the most active users after training")
+    parser.add_argument('--base-url', default=BASE_URL, help="Gorse API root")
+    parser.add_argument('--feedback', default='feedback.csv', help="feedback.csv or a columnar store directory")
+    parser.add_argument('--users', type=int, default=1000, help="How many of the most active users to warm")
+    parser.add_argument('--window', default='168h', help="Recent-activity window used to rank users")
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=16, help="Requests in flight")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and warm again whenever Gorse finishes a training run")
+    parser.add_argument('--deadline', type=float, default=5400.0,
+                        help="With --watch, seconds to wait for each training run before re-checking")
+    parser.add_argument('--metrics', default=None,
+                        help="Write warm-up counters and timings here: Prometheus text for *.prom, "
+                             "JSON lines otherwise")
+    args = parser.parse_args()
+    if args.metrics:
+        METRICS.configure(args.metrics)
+
+    window = parse_duration(args.window)
+    # Stop a --watch run on SIGTERM the same way as on Ctrl-C, so metrics are flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    client = RecommendClient(args.base_url, headers, pool_size=args.concurrency)
+    try:
+        warm_active_users(client, args.feedback, args.users, args.n, window)
+        watcher = TrainingWatcher(args.base_url, headers, deadline=args.deadline)
+        while args.watch:
+            result = watcher.wait(watcher.snapshot())
+            if result.ready:
+                print(f"\n✓ Training run finished ({result.reason})")
+                warm_active_users(client, args.feedback, args.users, args.n, window)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+        METRICS.close()
+
+
+if __name__ == "__main__":
+    main()